@@ -5,7 +5,7 @@ __email__ = "gaow@uchicago.edu"
 __license__ = "MIT"
 
 import os, sys, time
-from sos.utils import env, get_traceback
+from sos.utils import env, get_traceback, expand_size, format_HHMMSS
 from .version import __version__
 from .syntax import DSC_CACHE
 
@@ -153,7 +153,26 @@ def execute(args, unknown_args):
     if args.__construct__ == "all":
         return
     # Get the executed pipeline
-    pipeline.filter_execution(args.debug)
+    from .dsc_database import load_ledger, update_ledger
+    ledger = None if args.__construct__ == "none" else load_ledger(
+        script.runtime.output)
+    if args.__recover__:
+        env.logger.info(
+            "Recording existing output files as up-to-date in ledger ...")
+        ledger.update(
+            update_ledger(script.runtime.output, pipeline.get_outputs(),
+                          args.__recover_sample__, args.__max_jobs__))
+    from .dsc_scheduler import load_runtime_history, update_runtime_history, get_entrypoint, \
+        RUNTIME_ENV, SCHEDULER_ENV
+    runtime_history = f'{DSC_CACHE}/{db}.runtime.pkl'
+    # logged by module instances as they complete, see dsc_scheduler.record_runtime
+    os.environ[RUNTIME_ENV] = os.path.abspath(f'{DSC_CACHE}/{db}.runtime.log')
+    # local module instances are launched via scheduler, see dsc_scheduler
+    os.environ[SCHEDULER_ENV] = get_entrypoint()
+    # including those left by an interrupted run
+    update_runtime_history(runtime_history, os.environ[RUNTIME_ENV])
+    history = load_runtime_history(runtime_history)
+    pipeline.filter_execution(args.debug, ledger, history, args.__max_jobs__)
     script_run = pipeline.get_pipeline("run", args.debug)
     if args.debug:
         if args.host:
@@ -165,7 +184,55 @@ def execute(args, unknown_args):
     env.logger.debug(f"Running command ``{' '.join(sys.argv)}``")
     if os.path.isfile(f'{env.exec_dir}/transcript.txt'):
         os.remove(f'{env.exec_dir}/transcript.txt')
+    from .dsc_scheduler import THREADS_ENV
+    # cores of each module instance, unless leased by resources, see dsc_scheduler
+    os.environ.setdefault(THREADS_ENV, str(max((os.cpu_count() or 1) // max(args.__max_jobs__, 1), 1)))
+    if len(pipeline.resources):
+        from .dsc_scheduler import Resource_Pool, POOL_ENV, get_physical_memory
+        pool = os.path.abspath(f'{DSC_CACHE}/{db}.resources')
+        # serve waiting module instances by their time declared or in history
+        requests = dict([(k, dict(v)) for k, v in pipeline.resources.items()])
+        for k, v in history.items():
+            requests.setdefault(k, dict()).setdefault('time_per_instance', v[1])
+        Resource_Pool(pool).reset(
+            args.__max_jobs__,
+            args.__max_mem__ if args.__max_mem__ else get_physical_memory(),
+            requests)
+        os.environ[POOL_ENV] = pool
+    if args.host:
+        task_options = pipeline.get_task_options(
+            history,
+            dict([(k, v.get('max_running_jobs', 1))
+                  for k, v in conf['DSC'].items()]))
+        if len(task_options):
+            import pickle
+            from .dsc_scheduler import TASK_OPTIONS_ENV
+            fn = os.path.abspath(f'{DSC_CACHE}/{db}.tasks.pkl')
+            pickle.dump(task_options, open(fn, 'wb'))
+            os.environ[TASK_OPTIONS_ENV] = fn
+            env.logger.info("Module instances per job: " + ', '.join(
+                [f"``{k}``: {v['trunk_size']}" for k, v in task_options.items()]))
+    if pipeline.predicted is not None and not args.host:
+        env.logger.info(
+            f"Expected running time of DSC is ``{format_HHMMSS(int(pipeline.predicted))}`` based on previous runs."
+        )
+    executor = None
+    if args.executor == 'native' or args.fuse:
+        from .dsc_executor import DSC_Executor
+        reason = '``--host``' if args.host else (
+            '``-g``' if args.__dag__ else DSC_Executor.unsupported(pipeline))
+        if reason is None:
+            executor = DSC_Executor(pipeline, args.__construct__, ledger,
+                                    args.__max_jobs__, args.error_mode,
+                                    args.fuse)
+        else:
+            env.logger.warning(
+                f"Native executor does not support {reason}; running DSC with SoS instead.")
     env.logger.info(f"Building execution graph & running DSC ...")
+    run_start = time.time()
+    # record run time of module instances completed in this run
+    get_runtimes = lambda: update_runtime_history(runtime_history,
+                                                  os.environ[RUNTIME_ENV])
     # making verbosity level consistent with before SoS version 0.21.2
     verbosity_map = {0:1,1:0,2:2 if args.host else 0,3:3,4:4}
     try:
@@ -173,13 +240,21 @@ def execute(args, unknown_args):
             settings['error_mode'] = args.error_mode
         settings['verbosity'] = verbosity_map[args.verbosity]
         settings['output_dag'] = f'{db}.dot' if args.__dag__ else None
-        status = execute_workflow(script_run,
-                                  workflow='DSC',
-                                  options=settings,
-                                  config=conf_tpl)
+        if executor is not None:
+            executor.run()
+        else:
+            status = execute_workflow(script_run,
+                                      workflow='DSC',
+                                      options=settings,
+                                      config=conf_tpl)
         env.verbosity = args.verbosity
     except Exception as e:
-        if args.host is None:
+        get_runtimes()
+        if executor is not None:
+            # module instances known to have completed in this run
+            update_ledger(script.runtime.output, executor.completed,
+                          jobs=args.__max_jobs__)
+        elif args.host is None:
             transcript2html(f'{env.exec_dir}/transcript.txt',
                             f'{db}.scripts.html',
                             title=db)
@@ -187,6 +262,15 @@ def execute(args, unknown_args):
                                "the errors;\nadditional scripts upstream of the error can be found in " \
                                f"``{db}.scripts.html``.\n" + '=' * 75)
         raise Exception(e)
+    get_runtimes()
+    if pipeline.predicted is not None and not args.host:
+        env.logger.info(
+            f"DSC ran for ``{format_HHMMSS(int(time.time() - run_start))}``, predicted ``{format_HHMMSS(int(pipeline.predicted))}``."
+        )
+    # Record completed module instances, only after a successful run
+    # because otherwise existing output may be obsolete
+    update_ledger(script.runtime.output, pipeline.executed,
+                  jobs=args.__max_jobs__)
     # Plot DAG
     if args.__dag__:
         from sos.utils import dot_to_gif
@@ -270,10 +354,20 @@ def main():
                    "all": skips all modules and only build meta-database required to run `dsc-query` command.
                    It can be used for salvaging a partially completed benchmark making it possible to query from it.
                    "none": force executes DSC from scratch.''')
-    mt.add_argument('--touch',
-                    action='store_true',
-                    dest='__recover__',
-                    help=SUPPRESS)
+    mt.add_argument(
+        '--touch',
+        action='store_true',
+        dest='__recover__',
+        help=
+        '''Mark existing output as "up-to-date" without computing file signatures, as "-s existing" but fast
+                   for large output folders: only file size and timestamp are recorded, in parallel.''')
+    mt.add_argument(
+        '--touch-sample',
+        action='store_true',
+        dest='__recover_sample__',
+        help=
+        '''As "--touch", and also record digest of a few sampled blocks of each file, so that
+                   files whose timestamp has changed (eg after being copied) are still recognized.''')
     mt.add_argument('-e',
                     metavar='option',
                     choices=['ignore-safe', 'ignore', 'abort'],
@@ -308,6 +402,33 @@ def main():
         help=
         '''Maximum number of CPU threads for local runs, or job managing sockets for remote execution.'''
     )
+    ro.add_argument(
+        '--mem',
+        metavar='SIZE',
+        type=expand_size,
+        dest='__max_mem__',
+        help=
+        '''Maximum memory for local runs, eg 32G, default to physical memory of the computer.
+                   Modules with resources (cpus_per_instance, mem_per_instance, time_per_instance) declared in @CONF
+                   are executed locally only when enough CPU threads (see -c) and memory are available.'''
+    )
+    ro.add_argument(
+        '--executor',
+        choices=['sos', 'native'],
+        default='sos',
+        help=
+        '''How module instances are executed. "native" runs them directly from DSC I/O database
+                   without generating and parsing a SoS script, which is faster to start for large benchmarks;
+                   it falls back to "sos" for remote execution (--host), "-g" and modules in containers.'''
+    )
+    ro.add_argument(
+        '--fuse',
+        action='store_true',
+        help=
+        '''Run consecutive Python module instances of a pipeline in one process, as one job of
+                   "--executor native" (implied), passing module output to downstream modules in memory.
+                   Output files are still written and are used as without this option.'''
+    )
     ro.add_argument(
         '-v',
         '--verbosity',
@@ -356,11 +477,10 @@ def main():
         sys.exit(1)
     #
     env.verbosity = args.verbosity
-    # keep `args.__recover__` to maintain backwards compatibility for `--touch` option.
+    # `--touch-sample` implies `--touch`
+    args.__recover__ = args.__recover__ or args.__recover_sample__
+    # output not fully recorded by `--touch` are checked as in `-s existing`
     if args.__recover__:
-        env.logger.warning(
-            f'Option ``--touch`` is deprecated. Please use ``-s existing`` next time.'
-        )
         args.__construct__ = 'existing'
     with Timer(verbose=True if (args.verbosity > 0) else False) as t:
         try:
@@ -5,13 +5,16 @@ __email__ = "gaow@uchicago.edu"
 __license__ = "MIT"
 
 import os, sys
-import pandas as pd
+import pandas as pd, numpy as np
 from .utils import logger
 from .version import __version__
 
+# max number of data rows in an Excel sheet
+XLSX_MAX_ROWS = 1048575
+
 
 def preview(fn, output, am):
-    if fn.endswith('.pkl') or fn.endswith('.rds'):
+    if fn.endswith('.pkl') or fn.endswith('.rds') or fn.endswith('.h5'):
         from .dsc_io import load_dsc
         data = load_dsc(fn)
         debug = data.pop('DSC_DEBUG')
@@ -36,12 +39,99 @@ def preview(fn, output, am):
         )
 
 
+def get_columnar_name(fn, pipeline):
+    '''eg, for pipeline "simulate+analyze" output.parquet becomes output.simulate+analyze.parquet'''
+    fn, ext = os.path.splitext(fn)
+    return f'{fn}.{pipeline}{ext}'
+
+
+def write_columnar(table, fn):
+    '''
+    Save table to Parquet or Feather format, by file extension.
+    "NA" in query results are saved as missing values so that column types are kept.
+    '''
+    try:
+        import pyarrow
+    except ImportError:
+        raise ModuleNotFoundError(
+            "Python package ``pyarrow`` is required to save query results in Parquet or Feather format. Please install it and try again."
+        )
+    table = table.where(table != 'NA').infer_objects().reset_index(drop=True)
+    for col in table.columns:
+        if table[col].dtype == object and pd.api.types.infer_dtype(
+                table[col], skipna=True).startswith('mixed'):
+            # eg, parameter taking both numbers and strings
+            table[col] = table[col].where(table[col].isnull(),
+                                          table[col].astype(str))
+    if fn.endswith('.feather'):
+        table.to_feather(fn)
+    else:
+        table.to_parquet(fn, index=False)
+
+
+def write_xlsx(table, pipeline_tables, fn, max_rows=XLSX_MAX_ROWS):
+    '''
+    Save query results to spreadsheet using write-only workbook,
+    which streams rows to file in constant memory.
+    - Main table goes to "Sheet1", and is split into "Sheet1_2", "Sheet1_3" ...
+      every max_rows rows
+    - Tables of each pipeline go to their own sheets if there are multiple pipelines;
+      those larger than max_rows are skipped as they are already in the main table
+    '''
+    from openpyxl import Workbook
+
+    def write_sheet(name, data):
+        sheet = workbook.create_sheet(name)
+        sheet.append([str(x) for x in data.columns])
+        for row in data.itertuples(index=False, name=None):
+            sheet.append([
+                x.item() if isinstance(x, np.generic) else
+                x if x is None or isinstance(x, (str, int, float)) else str(x)
+                for x in row
+            ])
+
+    max_rows = max(max_rows, 1)
+    workbook = Workbook(write_only=True)
+    for i in range(0, max(len(table), 1), max_rows):
+        write_sheet('Sheet1' if i == 0 else f'Sheet1_{i // max_rows + 1}',
+                    table.iloc[i:i + max_rows])
+    if len(table) > max_rows:
+        logger.warning(
+            f"Query result of ``{len(table)}`` rows is split into sheets of ``{max_rows}`` rows."
+        )
+    if len(pipeline_tables) > 1:
+        for k, v in pipeline_tables.items():
+            if len(v) > max_rows:
+                logger.warning(
+                    f"Sheet for pipeline ``{k}`` is skipped because it has ``{len(v)}`` rows, more than ``{max_rows}``."
+                )
+                continue
+            write_sheet(k, v)
+    workbook.save(fn)
+
+
+def get_db(dsc_output):
+    return os.path.join(
+        dsc_output,
+        os.path.basename(os.path.normpath(dsc_output)) + '.db')
+
+
+def serve(args):
+    from .query_server import Query_Server
+    if os.path.isfile(args.dsc_output) and args.dsc_output.endswith('.db'):
+        args.dsc_output = os.path.dirname(args.dsc_output)
+    logger.info("Loading database ...")
+    Query_Server(get_db(args.dsc_output)).serve(args.serve)
+
+
 def query(args):
+    if args.output is None:
+        raise ValueError("Please specify output file name via ``-o``.")
     logger.info("Loading database ...")
     from sos.__main__ import AnswerMachine
     # from sos_notebook.converter import notebook_to_html
     from .query_jupyter import get_database_notebook, get_query_notebook
-    from .query_engine import Query_Processor
+    from .query_engine import Query_Processor, Query_Cache
     from .utils import uniq_list
     am = AnswerMachine(always_yes=args.force)
     if os.path.isfile(args.dsc_output):
@@ -51,9 +141,7 @@ def query(args):
             preview(args.dsc_output, args.output, am)
             sys.exit(0)
     args.output = args.output.strip('.')
-    db = os.path.join(
-        args.dsc_output,
-        os.path.basename(os.path.normpath(args.dsc_output)) + '.db')
+    db = get_db(args.dsc_output)
     if args.target is None:
         if not args.output.endswith('.ipynb'):
             fnb = args.output + '.ipynb'
@@ -67,27 +155,38 @@ def query(args):
                               args.limit)
     else:
         logger.info("Running queries ...")
-        qp = Query_Processor(db, args.target, args.condition, args.groups)
-        for query in qp.get_queries():
+        cache = Query_Cache(db, args.target, args.condition, args.groups)
+        qp = cache.load() if not (args.no_cache or args.debug) else None
+        if qp is None:
+            qp = Query_Processor(db, args.target, args.condition,
+                                 args.groups, args.debug, args.jobs)
+            if qp.rows_pruned > 0:
+                logger.info(
+                    f"``{qp.rows_pruned}`` of ``{qp.rows_loaded}`` table rows pruned by query condition before loading."
+                )
+            if not args.no_cache:
+                cache.dump(qp)
+        else:
+            logger.info("Loaded query results from cache.")
+        for query in qp.queries:
             logger.debug(query)
+            if args.debug and query.strip() in qp.query_plans:
+                logger.info(
+                    f"Query plan for ``{query}``:\n{qp.query_plans[query.strip()]}"
+                )
         # convert output database
         if args.rds is not None:
             fns = sum([
                 list(qp.output_table[x]) for x in qp.output_table.columns
                 if x.endswith(':output') or x.endswith('.output.file')
             ], [])
-            fns = [os.path.join(os.path.dirname(db), x) for x in fns]
+            fns = [os.path.join(os.path.dirname(db), x) for x in fns if x == x]
             if args.rds == 'omit':
-                fns = [
-                    x + '.pkl' for x in fns
-                    if x == x and os.path.isfile(x + '.pkl')
-                    and not os.path.isfile(x + '.rds')
-                ]
-            else:
-                fns = [
-                    x + '.pkl' for x in fns
-                    if x == x and os.path.isfile(x + '.pkl')
-                ]
+                fns = [x for x in fns if not os.path.isfile(x + '.rds')]
+            fns = [
+                x + ext for x in fns for ext in ['.pkl', '.h5']
+                if os.path.isfile(x + ext)
+            ]
             if len(fns):
                 fns = uniq_list(fns)
                 try:
@@ -106,21 +205,24 @@ def query(args):
                     logger.warning(
                         f"Failed to convert {len(fns)} files to RDS: {e}")
         # write output
-        if not args.output.endswith('.xlsx') and not args.output.endswith(
-                '.ipynb') and not args.output.endswith('.csv'):
-            fnb = args.output + '.ipynb'
-            fxlsx = args.output + '.xlsx'
-            fcsv = None
-        elif args.output.endswith('.xlsx'):
+        fnb = fxlsx = fcsv = fcol = None
+        if args.output.endswith('.xlsx'):
             fxlsx = args.output
-            fnb = fcsv = None
         elif args.output.endswith('.csv'):
             fcsv = args.output
-            fnb = fxlsx = None
-        else:
+        elif args.output.endswith('.parquet') or args.output.endswith(
+                '.feather'):
+            fcol = args.output
+        elif args.output.endswith('.ipynb'):
             fnb = args.output
-            fcsv = None
             fxlsx = args.output[:-6] + '.xlsx'
+        else:
+            fnb = args.output + '.ipynb'
+            fxlsx = args.output + '.xlsx'
+        if fcol is not None and len(qp.output_tables) > 1:
+            fcols = [get_columnar_name(fcol, x) for x in qp.output_tables]
+        else:
+            fcols = []
         if fxlsx is not None and os.path.isfile(
                 fxlsx) and not am.get(f"Overwrite existing file \"{fxlsx}\"?"):
             sys.exit("Aborted!")
@@ -130,26 +232,28 @@ def query(args):
         if fcsv is not None and os.path.isfile(
                 fcsv) and not am.get(f"Overwrite existing file \"{fcsv}\"?"):
             sys.exit("Aborted!")
+        for fn in ([fcol] if fcol is not None else []) + fcols:
+            if os.path.isfile(fn) and not am.get(
+                    f"Overwrite existing file \"{fn}\"?"):
+                sys.exit("Aborted!")
         if fxlsx is not None:
-            writer = pd.ExcelWriter(fxlsx)
-            qp.output_table.to_excel(writer, 'Sheet1', index=False)
-            if len(qp.output_tables) > 1:
-                for table in qp.output_tables:
-                    qp.output_tables[table].to_excel(writer,
-                                                     table,
-                                                     index=False)
-            writer.save()
-            logger.info(
-                f"Query results saved to spreadsheet ``{fxlsx}``".format(
-                    fxlsx))
+            write_xlsx(qp.output_table, qp.output_tables, fxlsx,
+                       args.xlsx_max_rows)
+            logger.info(f"Query results saved to spreadsheet ``{fxlsx}``")
         if fnb is not None:
             desc = (args.description or []) + ['Queries performed for:\n\n* targets: `{}`\n* conditions: `{}`'.\
                                                format(repr(args.target), repr(args.condition))]
-            get_query_notebook(fxlsx, qp.get_queries(), fnb,
+            get_query_notebook(fxlsx, qp.queries, fnb,
                                args.title, desc, args.language,
                                uniq_list(args.addon or []), args.limit)
         if fcsv is not None:
             qp.output_table.to_csv(fcsv, index=False)
+        if fcol is not None:
+            write_columnar(qp.output_table, fcol)
+            for table, fn in zip(qp.output_tables, fcols):
+                write_columnar(qp.output_tables[table], fn)
+            logger.info(
+                f"Query results saved to ``{', '.join([fcol] + fcols)}``")
     logger.info("Extraction complete!")
     if os.path.isfile(args.output + '.ipynb'):
         logger.info("You can use ``jupyter notebook {0}.ipynb`` to open it and run all cells, "\
@@ -162,7 +266,7 @@ def query(args):
 
 
 def main():
-    from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, SUPPRESS
+    from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
     class ArgumentParserError(Exception):
         pass
@@ -176,7 +280,10 @@ def main():
         description=
         "An internal command to extract meta-table for DSC results (requires 'sos-essentials' package to use notebook output).",
         formatter_class=ArgumentDefaultsHelpFormatter)
-    p.add_argument('--debug', action='store_true', help=SUPPRESS)
+    p.add_argument('--debug',
+                   action='store_true',
+                   help='''Show SQLite query plans for the queries performed,
+                   and raise errors with full traceback.''')
     p.add_argument('--version', action='version', version=__version__)
     p.add_argument('dsc_output',
                    metavar="DSC output folder or a single output file",
@@ -184,10 +291,11 @@ def main():
     p.add_argument('-o',
                    '--output',
                    metavar="str",
-                   required=True,
                    help='''Output notebook / data file name.
-                   In query applications if file name ends with ".csv", ".ipynb" or ".xlsx" then only data file will be saved
-                   as result of query. Otherwise both data file in ".xlsx" format and a notebook that displays the data
+                   In query applications if file name ends with ".csv", ".ipynb", ".xlsx", ".parquet" or ".feather"
+                   then only data file will be saved as result of query. For ".parquet" and ".feather", results of
+                   each pipeline are also saved to separate files when there are multiple pipelines.
+                   Otherwise both data file in ".xlsx" format and a notebook that displays the data
                    will be saved.''')
     p.add_argument(
         '--limit',
@@ -241,7 +349,35 @@ def main():
         '--rds',
         dest='rds',
         choices=['omit', 'overwrite'],
-        help='''Convert Python serialized files to R serialized files''')
+        help='''Convert Python serialized or HDF5 files to R serialized files''')
+    p.add_argument(
+        '--xlsx-max-rows',
+        metavar='N',
+        type=int,
+        default=XLSX_MAX_ROWS,
+        dest='xlsx_max_rows',
+        help='''Max number of rows per sheet in ".xlsx" output. Larger query result is split
+                   into multiple sheets, and larger sheets for each pipeline are skipped.''')
+    p.add_argument('-j',
+                   '--jobs',
+                   metavar='N',
+                   type=int,
+                   default=1,
+                   help='''Number of processes to run queries of different pipelines in parallel.''')
+    p.add_argument(
+        '--serve',
+        metavar='PORT',
+        type=int,
+        nargs='?',
+        const=8765,
+        help='''Instead of writing query results to file, keep the database loaded
+                   and answer queries on localhost at given port (8765 if not specified).
+                   Queries can be sent from R via "dscquery(..., server = 'http://localhost:8765')",
+                   or from Python via "dsc.query_server.request_query".''')
+    p.add_argument('--no-cache',
+                   action='store_true',
+                   dest='no_cache',
+                   help='''Do not use or save cached query results.''')
     p.add_argument('-f',
                    '--force',
                    action='store_true',
@@ -259,6 +395,8 @@ def main():
     try:
         args = p.parse_args()
         logger.verbosity = args.verbosity
+        if args.serve is not None:
+            args.func = serve
     except Exception as e:
         logger.info("Please type ``{} -h`` to view available options".\
                         format(os.path.basename(sys.argv[0])))
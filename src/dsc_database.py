@@ -4,12 +4,17 @@ __copyright__ = "Copyright 2016, Stephens lab"
 __email__ = "gaow@uchicago.edu"
 __license__ = "MIT"
 import os, msgpack, glob, pickle, copy, shutil
-import pandas as pd
+try:
+    from xxhash import xxh32 as xxh
+except ImportError:
+    from hashlib import md5 as xxh
+import pandas as pd, numpy as np
 from collections import OrderedDict
+from itertools import chain
 from .utils import uniq_list, flatten_list, chunks, remove_multiple_strings, extend_dict, \
-    remove_quotes, DBError
+    remove_quotes, sos_hash_output, group_input, expand_grid, DBError, logger
 from .addict import Dict as dotdict
-from .syntax import DSC_CACHE
+from .syntax import DSC_CACHE, DSC_DATA_EXT
 
 
 def remove_obsolete_output(output, additional_files=None, rerun=False):
@@ -135,6 +140,60 @@ def remove_unwanted_output(workflows, groups, modules, db, zap=False):
         print("Nothing found to remove!")
 
 
+def prepare_io(conf, io_db):
+    '''
+    Expand module instances from their configuration, see
+    ``DSC_Translator.get_io_conf``, into I/O database ``io_db``:
+    - output of instances are identified by hash of module and parameter values
+    - input of instances are output of modules they depend on, grouped for multiple depends
+    - parameters of instances are kept by output
+    '''
+    if isinstance(conf, str):
+        conf = pickle.load(open(conf, 'rb'))
+    res = OrderedDict()
+    # output of steps, to be used as input downstream
+    outputs = dict()
+    for item in conf:
+        params = list(item['params'].keys())
+        # last parameter in the outermost loop
+        combos = list(expand_grid(item['params'], item['filter']))
+        hashes = sos_hash_output([
+            item['template'].format(*values) if len(params) else item['template']
+            for values in combos
+        ])
+        if len(item['depends']) > 1:
+            groups = group_input(*[outputs[x] for x in item['depends']])
+            input_files = list(chain.from_iterable(groups))
+            suffixes = [':'.join(i) for i in groups]
+            output = [f"{item['name']}:{h}:{i}" for h in hashes for i in suffixes]
+            labels = [' '.join(i) for i in groups]
+        elif len(item['depends']) == 1:
+            input_files = outputs[item['depends'][0]]
+            output = [f"{item['name']}:{h}:{i}" for h in hashes for i in input_files]
+            labels = input_files
+        else:
+            input_files = None
+            output = [f"{item['name']}:{h}" for h in hashes]
+            labels = None
+        outputs[item['step']] = output
+        base = [('__pipeline_id__', item['pipeline_id']),
+                ('__pipeline_name__', item['pipeline_name']),
+                ('__module__', item['name']), ('__out_vars__', item['out_vars'])]
+        if labels is None:
+            keys = [(y, ) for y in output]
+            values = combos
+        else:
+            keys = [tuple(' '.join((y, x)).split()) for x, y in zip(
+                [x for values in combos for x in labels], output)]
+            values = [values for values in combos for x in labels]
+        res[(item['name'], item['pipeline_id'])] = dict(
+            [(k, dict(base + list(zip(reversed(params), v))))
+             for k, v in zip(keys, values)] +
+            [('__input_output___', (input_files if input_files is not None else [], output)),
+             ('__ext__', item['ext'])])
+    pickle.dump(res, open(io_db, 'wb'))
+
+
 def build_config_db(io_db, map_db, conf_db, vanilla=False, jobs=4):
     '''
     - collect all output file names in md5 style
@@ -263,6 +322,146 @@ def build_config_db(io_db, map_db, conf_db, vanilla=False, jobs=4):
     pickle.dump(conf, open(conf_db, "wb"), protocol=pickle.HIGHEST_PROTOCOL)
 
 
+def query_cache_dir(prefix):
+    '''
+    Folder next to DSC result database ``prefix.db`` to cache query results.
+    It is hidden so that it is not mistaken for obsolete module output.
+    '''
+    return os.path.join(os.path.dirname(prefix),
+                        f'.{os.path.basename(prefix)}.query')
+
+
+def ledger_file(output):
+    return os.path.join(output, '.ledger')
+
+
+def file_sample_digest(fn, size, block=2**16):
+    '''
+    Digest of the first, middle and last blocks of a file, a cheap check of
+    file content when file timestamp has changed (eg after copying output)
+    '''
+    h = xxh(str(size).encode())
+    with open(fn, 'rb') as f:
+        for offset in uniq_list([0, max(size // 2 - block // 2, 0), max(size - block, 0)]):
+            f.seek(offset)
+            h.update(f.read(block))
+    return h.hexdigest()
+
+
+def load_ledger(output):
+    '''
+    Completion ledger of module instances:
+    {output file: (module signature, size, mtime_ns, sampled digest)},
+    output file relative to DSC output folder eg ``normal/normal_1.pkl``.
+    The ledger is append-only; it is compacted here when it has grown to
+    twice the number of its entries.
+    '''
+    fn = ledger_file(output)
+    res = dict()
+    if not os.path.isfile(fn):
+        return res
+    n_lines = 0
+    with open(fn) as f:
+        for line in f:
+            line = line.rstrip('\n').split('\t')
+            if len(line) == 5:
+                res[line[4]] = (line[0], int(line[1]), int(line[2]), line[3])
+                n_lines += 1
+    if n_lines > 2 * len(res):
+        with open(fn + '.tmp', 'w') as f:
+            f.write(''.join(
+                ['\t'.join(map(str, v + (k, ))) + '\n' for k, v in res.items()]))
+        os.replace(fn + '.tmp', fn)
+    return res
+
+
+def _ledger_entry(args):
+    fn, signature, sample = args
+    try:
+        st = os.stat(fn)
+    except FileNotFoundError:
+        return None
+    return (signature, st.st_size, st.st_mtime_ns,
+            file_sample_digest(fn, st.st_size) if sample else '')
+
+
+def update_ledger(output, completed, sample=False, jobs=4):
+    '''
+    Add completed module instances {output file: module signature}. Only
+    file metadata are recorded, plus a sampled digest of file content if
+    ``sample`` is set; files are processed in parallel threads.
+    Files that do not exist are ignored. Returns the new ledger entries.
+    '''
+    from multiprocessing.dummy import Pool
+    completed = list(completed.items())
+    if len(completed) == 0:
+        return dict()
+    with Pool(max(min(jobs, len(completed)), 1)) as p:
+        entries = p.map(_ledger_entry, [(k, v, sample) for k, v in completed],
+                        chunksize=256)
+    res = dict([(os.path.relpath(k, output), e)
+                for (k, v), e in zip(completed, entries) if e is not None])
+    with open(ledger_file(output), 'a') as f:
+        f.write(''.join(
+            ['\t'.join(map(str, v + (k, ))) + '\n' for k, v in res.items()]))
+    return res
+
+
+def match_ledger(entry, fn, signature, stats):
+    '''
+    Check if output file ``fn`` is current per its ledger ``entry``: module
+    signature unchanged and file unchanged, by size and mtime or failing
+    that by sampled digest. ``stats`` caches one listing per folder.
+    '''
+    if entry is None or entry[0] != signature:
+        return False
+    dirname, basename = os.path.split(fn)
+    if dirname not in stats:
+        stats[dirname] = dict([(x.name, x.stat()) for x in os.scandir(dirname)
+                               if x.is_file()]) if os.path.isdir(dirname) else dict()
+    st = stats[dirname].get(basename)
+    if st is None or st.st_size != entry[1]:
+        return False
+    if st.st_mtime_ns == entry[2]:
+        return True
+    return len(entry[3]) > 0 and file_sample_digest(fn, st.st_size) == entry[3]
+
+
+def intern_tables(data):
+    '''
+    Compact module tables in place
+    - module instance IDs ``__id__`` and ``__parent__`` become integer keys
+      (starting from 1; ``-9`` for no parent) into shared string table ``.ids``
+    - ``__output__`` and string valued parameters become categoricals
+    Tables already using integer keys are not re-keyed.
+    '''
+    tables = [
+        k for k, v in data.items() if not k.startswith('.')
+        and isinstance(v, pd.DataFrame) and '__id__' in v.columns
+    ]
+    if len(tables) == 0:
+        return data
+    if not all(
+            pd.api.types.is_integer_dtype(data[k]['__id__']) for k in tables):
+        ids = pd.Index(
+            pd.unique(
+                pd.concat([data[k]['__id__'] for k in tables]).astype(object)))
+        for k in tables:
+            data[k]['__id__'] = ids.get_indexer(
+                data[k]['__id__'].astype(object)) + 1
+            parent = ids.get_indexer(data[k]['__parent__'].astype(object))
+            data[k]['__parent__'] = np.where(parent < 0, -9, parent + 1)
+        data['.ids'] = ids.tolist()
+    for k in tables:
+        for col in data[k].columns:
+            if col in ['__id__', '__parent__'] or isinstance(
+                    data[k][col].dtype, pd.CategoricalDtype):
+                continue
+            if pd.api.types.is_string_dtype(data[k][col]):
+                data[k][col] = data[k][col].astype('category')
+    return data
+
+
 class ResultDB:
     def __init__(self, prefix):
         self.prefix = prefix
@@ -357,7 +556,10 @@ class ResultDB:
             self.data['.depends'] = depends
         self.data['.output'] = output
         self.data['.pipelines'] = pipelines
+        intern_tables(self.data)
         pickle.dump(self.data, open(self.prefix + '.db', 'wb'))
+        # cached query results are no longer valid
+        shutil.rmtree(query_cache_dir(self.prefix), ignore_errors=True)
 
 
 if __name__ == '__main__':
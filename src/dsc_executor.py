@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+__author__ = "Gao Wang"
+__copyright__ = "Copyright 2016, Stephens lab"
+__email__ = "gaow@uchicago.edu"
+__license__ = "MIT"
+'''
+Run module instances of a benchmark without generating and parsing a SoS
+script (``dsc --executor native``). The graph of module instances is built
+from the I/O database ``io.pkl`` and parameters in ``cfg.pkl``, and
+instances are started as subprocesses as soon as their input is ready,
+critical path first, at most ``-c`` at a time. Module scripts are the same
+as those in SoS module steps, see ``DSC_Translator.Step_Translator``. With
+``dsc --fuse`` chains of Python module instances run as one job, see
+``dsc_fusion``.
+'''
+
+import os, sys, time, heapq, shlex, pickle, tempfile, subprocess, threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from sos.utils import env, as_fstring
+from sos.eval import interpolate
+from sos.parser import replace_sigil
+from sos.targets import sos_targets, path, paths
+from .dsc_io import load_io_db
+from .dsc_database import match_ledger
+from .dsc_scheduler import record_runtime
+from .syntax import DSC_CACHE
+from .utils import uniq_list
+
+INTERPRETERS = {'python3': 'python3', 'R': 'Rscript', 'bash': 'bash'}
+SUFFIXES = {'python3': '.py', 'R': '.R', 'bash': '.sh'}
+# as SoS action R
+DEFAULT_ENV = {
+    'R': {
+        'R_DEFAULT_PACKAGES': 'datasets,methods,utils,stats,grDevices,graphics'
+    }
+}
+
+
+class Instance:
+    def __init__(self, module, pid, index, output, input, params):
+        self.module = module
+        self.step = (module, pid)
+        self.index = index
+        self.output = output
+        self.input = input
+        self.params = params
+        self.producers = []
+        self.consumers = []
+        self.status = None
+
+
+class DSC_Executor:
+    def __init__(self,
+                 pipeline,
+                 mode='strict',
+                 ledger=None,
+                 workers=4,
+                 error_mode='ignore-safe',
+                 fuse=False):
+        '''
+        ``pipeline``: ``DSC_Translator`` after ``filter_execution``.
+        ``mode``: as ``dsc -s``, how existing output is skipped.
+        ``fuse``: run chains of Python module instances in one process.
+        '''
+        self.pipeline = pipeline
+        self.mode = mode
+        self.ledger = ledger
+        self.workers = max(workers, 1)
+        self.error_mode = error_mode
+        self.fuse = fuse
+        # completed module instances {output file: module signature}
+        self.completed = dict()
+        self.failed = []
+        self.running = dict()
+        self.lock = threading.Lock()
+        self.code = dict()
+        for module, action in pipeline.actions.items():
+            if action is None or action['action'] not in INTERPRETERS:
+                continue
+            self.code[module] = (compile(
+                as_fstring(replace_sigil(action['script'], action['sigil'])),
+                f'<{module}>', 'eval'),
+                                 compile(action['options'], f'<{module}>',
+                                         'eval'))
+
+    @staticmethod
+    def unsupported(pipeline):
+        '''Reason why the benchmark cannot be run without SoS, or None'''
+        for module in uniq_list([x[0] for x in pipeline.included_steps]):
+            action = pipeline.actions.get(module)
+            if action is None or action['action'] not in INTERPRETERS:
+                return f'module ``{module}``'
+            if action['container']:
+                return f'``container`` of module ``{module}``'
+        return None
+
+    def get_instances(self):
+        io_db = load_io_db(f'{DSC_CACHE}/{self.pipeline.db}.io.pkl')
+        with open(f'{DSC_CACHE}/{self.pipeline.db}.cfg.pkl', 'rb') as f:
+            cfg = pickle.load(f)
+        res = []
+        producer = dict()
+        for module, pid in self.pipeline.included_steps:
+            data = io_db[str(pid)][module]
+            # parameters of instances, in the same order as output
+            params = [
+                v for k, v in cfg[(module, pid)].items()
+                if k not in ['__ext__', '__input_output___']
+            ]
+            n = self.pipeline.actions[module]['group_by']
+            groups = [data['input'][i:i + n] for i in range(0, len(data['input']), n)] \
+                if n else [[]]
+            for i, (f, p) in enumerate(zip(data['output'], params)):
+                x = Instance(module, pid, i, f, groups[i % len(groups)], [
+                    (k, v) for k, v in p.items() if not k.startswith('__')
+                ])
+                producer[f] = x
+                res.append(x)
+        for x in res:
+            x.producers = uniq_list([producer[f] for f in x.input if f in producer])
+            for y in x.producers:
+                y.consumers.append(x)
+        return res
+
+    def is_completed(self, x, stats):
+        if self.mode == 'none':
+            return False
+        if self.mode == 'existing':
+            return os.path.isfile(x.output)
+        if self.mode == 'lenient':
+            if not os.path.isfile(x.output):
+                return False
+            mtime = os.path.getmtime(x.output)
+            return all([
+                os.path.isfile(f) and os.path.getmtime(f) <= mtime
+                for f in x.input
+            ])
+        return self.ledger is not None and match_ledger(
+            self.ledger.get(os.path.relpath(x.output, self.pipeline.output)),
+            x.output, self.pipeline.signatures[x.module], stats)
+
+    def set_status(self, instances):
+        '''
+        Instances to run: those not completed, or downstream of instances
+        to run, plus zapped instances (see ``dsc -d replace``) whose output
+        is needed by instances to run.
+        '''
+        stats = dict()
+        signatures = self.pipeline.signatures
+        for x in instances:
+            # instances are in topological order
+            if any([y.status == 'run' for y in x.producers]):
+                x.status = 'run'
+            elif self.is_completed(x, stats):
+                x.status = 'completed'
+            elif self.mode == 'strict' and self.ledger is not None and \
+                 os.path.isfile(x.output + '.zapped') and \
+                 self.ledger.get(os.path.relpath(x.output, self.pipeline.output), [None])[0] == signatures[x.module]:
+                x.status = 'zapped'
+            else:
+                x.status = 'run'
+        stack = [x for x in instances if x.status == 'run']
+        while stack:
+            for y in stack.pop().producers:
+                if y.status == 'zapped':
+                    y.status = 'run'
+                    stack.append(y)
+
+    def get_command(self, x):
+        '''Script file, options and environment of a module instance, as SoS action would use'''
+        action = self.pipeline.actions[x.module]
+        script, options = self.code[x.module]
+        ns = dict(os=os, sys=sys, path=path, paths=paths, sos_targets=sos_targets)
+        ns.update([(f'_{k}', v) for k, v in x.params])
+        ns.update(dict(_index=x.index,
+                       _input=sos_targets(x.input),
+                       _output=sos_targets(x.output),
+                       DSC_STEP_ID_=self.pipeline.step_ids[x.module],
+                       step_name=x.module))
+        options = eval(options, ns)
+        script = eval(script, ns)
+        os.makedirs(os.path.dirname(os.path.abspath(x.output)), exist_ok=True)
+        fd, fn = tempfile.mkstemp(suffix=SUFFIXES[action['action']])
+        with os.fdopen(fd, 'w') as f:
+            f.write(script)
+        run_env = dict(os.environ)
+        for k, v in DEFAULT_ENV.get(action['action'], dict()).items():
+            run_env.setdefault(k, v)
+        run_env.update(options.get('env', dict()))
+        return fn, options, run_env
+
+    def get_error(self, x, ret, options, cmd):
+        if ret == 0 and os.path.isfile(x.output):
+            return None
+        return f"``{x.output}`` of module ``{x.module}`` " + \
+            (f"exited with code {ret}" if ret else "was not created") + \
+            f"; see ``{options['stderr']}``, or run ``{cmd}``"
+
+    def run_instance(self, x):
+        '''Run a module instance as SoS action of module step would'''
+        action = self.pipeline.actions[x.module]
+        fn, options, run_env = self.get_command(x)
+        entrypoint = options.get('entrypoint', '')
+        start = time.time()
+        cmd = interpolate(
+            f"{entrypoint} {options.get('interpreter', INTERPRETERS[action['action']])} {options.get('args', '{filename:q}')}"
+            .strip(), {'filename': sos_targets(fn)})
+        with open(options['stdout'], 'ab') as so, open(options['stderr'], 'ab') as se:
+            p = subprocess.Popen(cmd,
+                                 shell=True,
+                                 cwd=options.get('workdir'),
+                                 env=run_env,
+                                 stdout=so,
+                                 stderr=se)
+            with self.lock:
+                self.running[x] = p
+            ret = p.wait()
+            with self.lock:
+                self.running.pop(x)
+        error = self.get_error(x, ret, options, cmd)
+        if error is None:
+            # otherwise recorded by scheduler, without time waiting for resources
+            if not entrypoint:
+                record_runtime(x.module, time.time() - start)
+            os.remove(fn)
+        # script is kept to reproduce the error
+        return [(x, error)]
+
+    def run_chain(self, chain):
+        '''
+        Run a chain of Python module instances in one process, see
+        ``dsc_fusion``. Returns errors of module instances that were run.
+        '''
+        if len(chain) == 1:
+            return self.run_instance(chain[0])
+        job = []
+        commands = []
+        for x in chain:
+            fn, options, run_env = self.get_command(x)
+            cmd = interpolate(options.get('args', '{filename:q}'),
+                              {'filename': sos_targets(fn)})
+            job.append(dict(module=x.module,
+                            argv=shlex.split(cmd),
+                            cwd=os.path.abspath(options.get('workdir') or os.getcwd()),
+                            env=run_env,
+                            stdout=options['stdout'],
+                            stderr=options['stderr'],
+                            input=[os.path.abspath(f) for f in x.input],
+                            output=x.output))
+            commands.append((fn, options, f'python3 {cmd}'))
+        fd, job_file = tempfile.mkstemp(suffix='.pkl')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(job, f)
+        # Python of the first module instance, where dsc is installed
+        p = subprocess.Popen(['python3', '-m', 'dsc.dsc_fusion', job_file],
+                             env=job[0]['env'])
+        with self.lock:
+            self.running[chain[0]] = p
+        p.wait()
+        with self.lock:
+            self.running.pop(chain[0])
+        try:
+            with open(job_file + '.ret', 'rb') as f:
+                codes = pickle.load(f)
+            os.remove(job_file + '.ret')
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # runner was killed
+            codes = [p.returncode or 1]
+        os.remove(job_file)
+        res = []
+        for x, ret, (fn, options, cmd) in zip(chain, codes, commands):
+            res.append((x, self.get_error(x, ret, options, cmd)))
+            if res[-1][1] is None:
+                os.remove(fn)
+        return res
+
+    def get_chains(self, to_run):
+        '''
+        Module instances to run, one chain each, or with ``fuse`` chains of
+        Python module instances of a pipeline: a module instance is added to
+        a chain ending with one of its producers when all its producers to
+        run are in the chain. Other consumers of module instances in the
+        chain run after the chain, loading its output from files.
+        '''
+        res = []
+        tail = dict()
+        scheduled = getattr(self.pipeline, 'scheduled', [])
+        for x in to_run:
+            chain = None
+            if self.fuse and self.pipeline.actions[x.module]['action'] == 'python3' \
+               and x.module not in scheduled:
+                for y in x.producers:
+                    if y in tail and all([z.status != 'run' or z in tail[y][1]
+                                          for z in x.producers]):
+                        chain = tail.pop(y)
+                        break
+            if chain is None:
+                chain = (len(res), set())
+                res.append([])
+            res[chain[0]].append(x)
+            chain[1].add(x)
+            if self.fuse and self.pipeline.actions[x.module]['action'] == 'python3' \
+               and x.module not in scheduled:
+                tail[x] = chain
+        return res
+
+    def run(self):
+        '''Run module instances, raising an error if any of them failed'''
+        instances = self.get_instances()
+        self.set_status(instances)
+        to_run = [x for x in instances if x.status == 'run']
+        env.logger.info(
+            f"Running ``{len(to_run)}`` of ``{len(instances)}`` module instances ...")
+        priority = self.pipeline.priority
+        chains = self.get_chains(to_run)
+        chain_of = dict([(x, i) for i, chain in enumerate(chains) for x in chain])
+        # producers to run, of module instances in other chains
+        waiting = [len([y for x in chain for y in x.producers
+                        if y.status == 'run' and chain_of[y] != i])
+                   for i, chain in enumerate(chains)]
+        ready = [(-priority.get(chain[0].step, 0), i) for i, chain in enumerate(chains)
+                 if waiting[i] == 0]
+        heapq.heapify(ready)
+        futures = dict()
+        stopped = False
+        # each chain of module instances is a subprocess; threads only wait for them
+        with ThreadPoolExecutor(self.workers) as pool:
+            while ready or futures:
+                while ready and not stopped and len(futures) < self.workers:
+                    i = heapq.heappop(ready)[1]
+                    futures[pool.submit(self.run_chain, chains[i])] = i
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chain = chains[futures.pop(future)]
+                    try:
+                        res = future.result()
+                    except Exception as e:
+                        res = [(chain[0], f"``{chain[0].output}`` of module ``{chain[0].module}`` failed to start: {e}")]
+                    for x, error in res:
+                        if error is None:
+                            self.completed[x.output] = self.pipeline.signatures[x.module]
+                            for y in x.consumers:
+                                j = chain_of[y]
+                                if j == chain_of[x]:
+                                    continue
+                                waiting[j] -= 1
+                                if waiting[j] == 0:
+                                    heapq.heappush(ready, (-priority.get(chains[j][0].step, 0), j))
+                            continue
+                        self.failed.append(error)
+                        env.logger.error(error)
+                        if self.error_mode == 'abort' and not stopped:
+                            stopped = True
+                            with self.lock:
+                                for p in self.running.values():
+                                    p.terminate()
+        if len(self.failed):
+            raise RuntimeError(
+                f"{len(self.failed)} module instance(s) failed; " \
+                f"{len(to_run) - len(self.completed) - len(self.failed)} downstream or remaining instance(s) were not run."
+            )
+
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+__author__ = "Gao Wang"
+__copyright__ = "Copyright 2016, Stephens lab"
+__email__ = "gaow@uchicago.edu"
+__license__ = "MIT"
+'''
+Run a chain of Python module instances of a pipeline as one job
+(``dsc --fuse``, see ``DSC_Executor``). Module scripts run one after another
+in one Python process, each as ``__main__`` with its own arguments, working
+directory, environment and ``stdout`` / ``stderr`` files, as ``python3``
+would run it. Output saved by a module instance (``dsc_io.save_dsc``) is kept
+in memory and loaded from there by downstream module instances of the chain
+(``dsc_io.load_dsc``) until no more of them need it. Output files are still
+written, so signatures, the completion ledger and queries are as when module
+instances are run separately.
+
+python -m dsc.dsc_fusion <job.pkl>
+
+The job is a list of module instances, each a dict of ``module``, ``argv``,
+``cwd``, ``env``, ``stdout``, ``stderr``, ``input`` and ``output``. Exit codes
+of module instances run are written to ``<job.pkl>.ret``; module instances
+after a failed one are downstream of it and are not run.
+'''
+
+import os, sys, time, pickle
+from . import dsc_io
+from .dsc_scheduler import record_runtime
+
+
+def run_script(x):
+    '''Run module script as python would, returning its exit code'''
+    import runpy, traceback
+    os.chdir(x['cwd'])
+    os.environ.clear()
+    os.environ.update(x['env'])
+    sys.argv = x['argv']
+    sys.path[0] = os.path.dirname(os.path.abspath(sys.argv[0]))
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    with open(x['stdout'], 'ab') as so, open(x['stderr'], 'ab') as se:
+        # also for subprocesses started by the script
+        os.dup2(so.fileno(), 1)
+        os.dup2(se.fileno(), 2)
+        code = 0
+        try:
+            runpy.run_path(sys.argv[0], run_name='__main__')
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            if not isinstance(e.code, int) and e.code is not None:
+                sys.stderr.write(f'{e.code}\n')
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for i, fd in enumerate(saved):
+            os.dup2(fd, i + 1)
+            os.close(fd)
+    return code
+
+
+def run(job):
+    '''Run module instances of a job, returning their exit codes'''
+    # position of the last module instance loading each output
+    last_use = dict()
+    for i, x in enumerate(job):
+        for f in x['input']:
+            last_use[os.path.abspath(f)] = i
+    dsc_io.MEMORY = dict()
+    res = []
+    cwd = os.getcwd()
+    for i, x in enumerate(job):
+        start = time.time()
+        res.append(run_script(x))
+        os.chdir(cwd)
+        if res[-1] != 0:
+            break
+        record_runtime(x['module'], time.time() - start)
+        for f in list(dsc_io.MEMORY):
+            if last_use.get(f, -1) <= i:
+                del dsc_io.MEMORY[f]
+    dsc_io.MEMORY = None
+    return res
+
+
+def main():
+    if len(sys.argv) != 2:
+        sys.exit(__doc__)
+    job_file = os.path.abspath(sys.argv[1])
+    with open(job_file, 'rb') as f:
+        job = pickle.load(f)
+    res = run(job)
+    with open(job_file + '.ret', 'wb') as f:
+        pickle.dump(res, f)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,9 @@ python -m 'rpy2.tests'
 
 from dsc.utils import flatten_list
 
+# {output file: data} saved by module instances of a fused job, see dsc_fusion
+MEMORY = None
+
 def load_mpk(mpk_files, jobs=2):
     import msgpack, collections
     from multiprocessing import Process, Manager
@@ -186,13 +189,33 @@ def save_rds(data, filename):
     RO.r("saveRDS(res, '%s')" % filename)
 
 
-def load_dsc(infiles):
-    import pickle, yaml
+def load_dsc(infiles, group=None, sel=None):
+    '''
+    Load DSC module output files. For ``.h5`` output a specific ``group``,
+    eg ``/x``, can be loaded and further sliced by ``sel``,
+    eg ``numpy.s_[:100, :]``, without reading the entire file.
+    '''
+    import os, pickle, yaml
     if isinstance(infiles, str):
         infiles = [infiles]
+    if group is not None or sel is not None:
+        if not all([x.endswith('.h5') for x in infiles]):
+            raise ValueError(
+                'Partial loading via ``group`` and ``sel`` is only supported for ``h5`` DSC data'
+            )
+        from .hdf5io import load as load_h5
+        res = [load_h5(infile, group=group, sel=sel) for infile in infiles]
+        return res[0] if len(res) == 1 else res
     res = dict()
     for infile in infiles:
-        if infile.endswith('.pkl'):
+        if MEMORY is not None and os.path.abspath(infile) in MEMORY:
+            # a copy, as if loaded from file
+            import copy
+            data = copy.deepcopy(MEMORY[os.path.abspath(infile)])
+        elif infile.endswith('.h5'):
+            from .hdf5io import load as load_h5
+            data = load_h5(infile)
+        elif infile.endswith('.pkl'):
             data = pickle.load(open(infile, 'rb'))
         elif infile.endswith('.rds'):
             data = load_rds(infile)
@@ -208,16 +231,35 @@ def load_dsc(infiles):
     return res
 
 
+def save_dsc(data, outfile):
+    '''
+    Save output of a Python module instance to ``.pkl`` or ``.h5`` file.
+    In a fused job ``.pkl`` output is also kept in memory, for downstream
+    module instances of the job to load without reading the file.
+    '''
+    import os
+    if outfile.endswith('.h5'):
+        from .hdf5io import save as save_h5
+        save_h5(data, outfile)
+    else:
+        import pickle
+        with open(outfile, 'wb') as f:
+            pickle.dump(data, f)
+        if MEMORY is not None:
+            MEMORY[os.path.abspath(outfile)] = data
+
+
 def convert_dsc(pkl_files, jobs=2):
-    import pickle
+    '''Convert ``.pkl`` or ``.h5`` DSC data to ``.rds``'''
+    import os
     from multiprocessing import Process
     from .utils import chunks
 
     def convert(d):
         for ff in d:
-            if not ff.endswith('pkl'):
+            if not (ff.endswith('.pkl') or ff.endswith('.h5')):
                 raise ValueError(f'``{ff}`` is not supported DSC data format')
-            save_rds(pickle.load(open(ff, 'rb')), ff[:-4] + '.rds')
+            save_rds(load_dsc(ff), os.path.splitext(ff)[0] + '.rds')
 
     #
     if isinstance(pkl_files, str):
@@ -283,9 +325,19 @@ def source_dirs(dirs):
                     functions.append((i, getattr(m,i)))
     return functions
 
-def load_io_db(fn, sequence_id=None, module=None):
-    import pickle
-    data = pickle.load(open(fn, 'rb'))
+def load_io_db(fn, sequence_id=None, module=None, _cache=dict()):
+    '''
+    Load I/O database once per process; it is loaded again only when the
+    file has changed. Returned data should not be modified.
+    '''
+    import os, pickle
+    st = os.stat(fn)
+    key = (os.path.abspath(fn), st.st_mtime_ns, st.st_size)
+    if _cache.get('key') != key:
+        _cache.clear()
+        _cache['data'] = pickle.load(open(fn, 'rb'))
+        _cache['key'] = key
+    data = _cache['data']
     return data[sequence_id][module] if sequence_id and module else data
 
 def main():
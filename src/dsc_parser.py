@@ -13,10 +13,10 @@ try:
     from xxhash import xxh32 as xxh
 except ImportError:
     from hashlib import md5 as xxh
-from sos.utils import env
+from sos.utils import env, expand_size, expand_time
 from sos.targets import fileMD5, executable
 from .utils import FormatError, strip_dict, recursive_items, merge_lists, flatten_list, uniq_list, \
-     try_get_value, dict2str, locate_file, filter_sublist, cartesian_list, \
+     try_get_value, dict2str, locate_file, filter_sublist, cartesian_list, expand_grid, \
      parens_aware_split, remove_parens, remove_quotes, rmd_to_r, update_gitconf, install_package_interactive, \
      dsc2html
 from .syntax import *
@@ -677,10 +677,14 @@ class DSC_Module:
         self.libpath = None
         self.path = None
         self.libpath_tracked = None
+        self.output_format = None
+        self.output_format_tracked = None
         self.rlib = None
         self.pymodule = None
         self.container = None
         self.container_engine = None
+        # resources of each module instance for local scheduler
+        self.resources = dict()
         # dependencies
         self.depends = []
         # check if it runs in shell
@@ -845,6 +849,20 @@ class DSC_Module:
             (' '.join(self.exe['args']) if self.exe['args'] else '') +
             lib_signature).hexdigest()
         self.plugin = Plugin(self.exe['type'], self.exe['signature'])
+        if self.output_format is not None:
+            if self.output_format not in ['hdf5', 'h5']:
+                raise FormatError(
+                    f"Unknown ``output_format`` ``{self.output_format}`` for module ``{self.name}``; only ``hdf5`` is supported."
+                )
+            if self.exe['type'] == 'PY':
+                self.plugin.output_ext = 'h5'
+                if self.container is None:
+                    # required by dsc.hdf5io
+                    self.pymodule = uniq_list(self.pymodule + ['tables', 'scipy'])
+            elif self.output_format_tracked is not None:
+                raise FormatError(
+                    f"Option ``output_format`` is only supported for Python modules, not for module ``{self.name}``."
+                )
 
     def set_output(self, return_var):
         '''
@@ -947,7 +965,23 @@ class DSC_Module:
         if not self.container is None and (self.rlib or self.pymodule):
             raise FormatError(f'Options ``R_libs`` and ``python_modules`` cannot be used for module ``{self.name}`` when option ``container`` is specified.')
         self.libpath_tracked = libpath2
-
+        output_format1 = try_get_value(common_option, 'output_format')
+        output_format2 = try_get_value(spec_option, 'output_format')
+        self.output_format = output_format2[0] if output_format2 is not None else output_format1
+        self.output_format_tracked = output_format2
+        for key, convert in [('cpus_per_instance', int),
+                             ('mem_per_instance', expand_size),
+                             ('time_per_instance', expand_time)]:
+            value = try_get_value(spec_option, key)
+            if value is None:
+                continue
+            try:
+                self.resources[key] = convert(value[0])
+                assert self.resources[key] > 0
+            except Exception:
+                raise FormatError(
+                    f'Invalid @CONF ``{key} = {value[0]}`` of module ``{self.name}``.\nTip: eg, "cpus_per_instance = 2", "mem_per_instance = 4G", "time_per_instance = 1h".'
+                )
 
     def set_input(self, params, alias):
         if params is not None:
@@ -1083,17 +1117,12 @@ class DSC_Module:
         ft = flatten_list(ft)
         raw_rule = ft
         ft = self.make_filter_statement(ft)
-        # Verify it
-        statement = '\n'.join([f"{k} = {str(self.p[k])}" for k in self.p])
-        value_str = ','.join([f'_{x}' for x in self.p.keys()])
-        loop_str = ' '.join([f"for _{x} in {x}" for x in self.p])
-        statement += f'\nret = len([({value_str}) {loop_str} if {ft}])'
-        exec_env = dict()
+        # Verify it, stopping at the first parameter combination kept
         try:
-            exec(statement, exec_env)
+            ret = next(expand_grid(self.p, ft), None)
         except Exception:
             raise FormatError(f"Invalid @FILTER: ``{raw_rule}``!")
-        if exec_env['ret'] == 0:
+        if ret is None:
             raise FormatError(
                 f"No parameter combination satisfies @FILTER ``{' AND '.join(raw_rule)}``!"
             )
@@ -1187,7 +1216,8 @@ class DSC_Module:
              dict([('exec_path', self.path), ('workdir', self.workdir),
                    ('library_path', self.libpath), 
                    ('container', self.container),
-                   ('container_engine', self.container_engine)]))
+                   ('container_engine', self.container_engine),
+                   ('resources', self.resources)]))
         ]),
                           mapping=dict,
                           skip_keys=['input'])
@@ -1257,6 +1287,8 @@ class DSC_Section:
             'lib_path'] if 'lib_path' in self.content else None
         self.options['exec_path'] = self.content[
             'exec_path'] if 'exec_path' in self.content else None
+        self.options['output_format'] = self.content[
+            'output_format'] if 'output_format' in self.content else None
         self.rlib = self.content['R_libs'] if 'R_libs' in self.content else []
         self.pymodule = self.content[
             'python_modules'] if 'python_modules' in self.content else []
@@ -1406,7 +1438,7 @@ class DSC_Pipeline:
                             if id_dependent[1] not in module.depends:
                                 module.depends.append(id_dependent[1])
                             if id_dependent[1][2] is None or id_dependent[1][
-                                    2].split('.')[-1] in ['rds', 'pkl', 'yml']:
+                                    2].split('.')[-1] in DSC_DATA_EXT:
                                 module.plugin.add_input(k, p1)
                             else:
                                 # FIXME: for multiple output should figure out the index of previous output
@@ -1528,7 +1560,8 @@ def remote_config_parser(host):
     default = dict([('queue', list(conf['DSC'].keys())[0]),
                     ('instances_per_job', 2), ('nodes_per_job', 1),
                     ('instances_per_node', 1), ('cpus_per_instance', 1),
-                    ('mem_per_instance', '2G'), ('time_per_instance', '5m')])
+                    ('mem_per_instance', '2G'), ('time_per_instance', '5m'),
+                    ('time_per_job', '1h')])
 
     def check_valid_conf(key):
         for kk in conf[key]:
@@ -1554,11 +1587,22 @@ def remote_config_parser(host):
         tmp['cores'] = tmp.pop('cpus_per_instance')
         tmp['trunk_size'] = tmp.pop('instances_per_job')
         tmp['trunk_workers'] = f"[{tmp.pop('instances_per_node')}] * {tmp.pop('nodes_per_job')}"
+        # "instances_per_job: auto" groups instances into jobs of about "time_per_job",
+        # by run time of instances from previous runs
+        if tmp['trunk_size'] == 'auto':
+            tmp['time_per_job'] = expand_time(tmp['time_per_job'])
+        elif isinstance(tmp['trunk_size'], int):
+            tmp.pop('time_per_job')
+        else:
+            raise FormatError(
+                f"Invalid ``instances_per_job: {tmp['trunk_size']}`` in section ``{key}``, should be an integer or ``auto``."
+            )
         if tmp['queue'].endswith('.local'):
             for item in [
-                    'walltime', 'mem', 'cores', 'trunk_size', 'trunk_workers'
+                    'walltime', 'mem', 'cores', 'trunk_size', 'trunk_workers',
+                    'time_per_job'
             ]:
-                tmp.pop(item)
+                tmp.pop(item, None)
             local_queues.add(tmp['queue'][:-6])
         else:
             queues.add(tmp['queue'])
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+__author__ = "Gao Wang"
+__copyright__ = "Copyright 2016, Stephens lab"
+__email__ = "gaow@uchicago.edu"
+__license__ = "MIT"
+'''
+Local stand-in of a PBS / SLURM queue, to try out ``--host`` configurations
+(eg ``instances_per_job: auto``) without a cluster. In host file:
+
+DSC:
+  local_pbs:
+    queue_type: pbs
+    max_running_jobs: 4
+    task_template: |
+      #!/bin/bash
+      #SBATCH --time={walltime}
+      cd {cur_dir}
+    submit_cmd: python -m dsc.dsc_queue submit {job_file} --slots 4 --latency 5
+    submit_cmd_output: "Submitted batch job {job_id}"
+    status_cmd: python -m dsc.dsc_queue status {job_id}
+    kill_cmd: python -m dsc.dsc_queue kill {job_id}
+
+Jobs are run in background, at most ``--slots`` at a time, each started
+``--latency`` seconds after it gets a slot as by a busy cluster scheduler,
+and killed if running over walltime of ``#SBATCH --time`` or
+``#PBS -l walltime``. Jobs are logged in ``~/.sos/dsc_queue/jobs.log``.
+'''
+
+import os, sys, re, time, fcntl, signal, argparse, subprocess
+
+QUEUE_DIR = os.path.expanduser('~/.sos/dsc_queue')
+
+
+def get_walltime(job_file):
+    '''walltime in seconds from job script, None if not specified'''
+    with open(job_file) as f:
+        content = f.read()
+    m = re.search(r'^#SBATCH\s+(?:--time=|-t\s*)(\S+)', content, re.M) or \
+        re.search(r'^#PBS\s+-l\s+walltime=(\S+)', content, re.M)
+    if m is None:
+        return None
+    days, hms = m.group(1).split('-') if '-' in m.group(1) else (0, m.group(1))
+    res = 0
+    for x in hms.split(':'):
+        res = res * 60 + int(x)
+    return int(days) * 86400 + res
+
+
+def log(msg):
+    with open(os.path.join(QUEUE_DIR, 'jobs.log'), 'a') as f:
+        f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')}\t{msg}\n")
+
+
+def submit(args):
+    os.makedirs(QUEUE_DIR, exist_ok=True)
+    job_file = os.path.abspath(args.job_file)
+    name = os.path.splitext(job_file)[0]
+    with open(f'{name}.out', 'w') as out, open(f'{name}.err', 'w') as err:
+        p = subprocess.Popen([
+            sys.executable, '-m', 'dsc.dsc_queue', 'run', job_file, '--slots',
+            str(args.slots), '--latency',
+            str(args.latency)
+        ],
+                             stdout=out,
+                             stderr=err,
+                             stdin=subprocess.DEVNULL,
+                             start_new_session=True)
+    log(f'{p.pid}\tsubmitted\t{job_file}')
+    print(f'Submitted batch job {p.pid}')
+
+
+def run(args):
+    os.makedirs(QUEUE_DIR, exist_ok=True)
+    # wait for a free slot
+    slot = None
+    while slot is None:
+        for i in range(args.slots):
+            f = open(os.path.join(QUEUE_DIR, f'slot_{i}.lock'), 'w')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                slot = f
+                break
+            except OSError:
+                f.close()
+        else:
+            time.sleep(1)
+    time.sleep(args.latency)
+    walltime = get_walltime(args.job_file)
+    log(f'{os.getpid()}\tstarted\twalltime={walltime}')
+    start = time.time()
+    p = subprocess.Popen(['bash', args.job_file])
+    signal.signal(signal.SIGTERM, lambda s, f: p.terminate())
+    try:
+        ret = p.wait(timeout=walltime)
+    except subprocess.TimeoutExpired:
+        p.kill()
+        ret = p.wait()
+        log(f'{os.getpid()}\tkilled\texceeded walltime')
+    log(f'{os.getpid()}\tfinished\tret={ret}\ttime={time.time() - start:.1f}')
+    sys.exit(ret if ret >= 0 else 128 - ret)
+
+
+def status(args):
+    try:
+        os.kill(args.job_id, 0)
+        print(f'{args.job_id} running')
+    except ProcessLookupError:
+        print(f'{args.job_id} completed')
+
+
+def kill(args):
+    try:
+        os.killpg(args.job_id, signal.SIGTERM)
+        log(f'{args.job_id}\tkilled')
+    except ProcessLookupError:
+        pass
+
+
+def main():
+    p = argparse.ArgumentParser(description='Local stand-in of a job queue')
+    sp = p.add_subparsers(dest='command')
+    for name, func in [('submit', submit), ('run', run)]:
+        x = sp.add_parser(name)
+        x.add_argument('job_file')
+        x.add_argument('--slots', type=int, default=os.cpu_count() or 1)
+        x.add_argument('--latency', type=float, default=0)
+        x.set_defaults(func=func)
+    for name, func in [('status', status), ('kill', kill)]:
+        x = sp.add_parser(name)
+        x.add_argument('job_id', type=int)
+        x.set_defaults(func=func)
+    args = p.parse_args()
+    if args.command is None:
+        p.print_help()
+        sys.exit(1)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
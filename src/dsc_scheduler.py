@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+__author__ = "Gao Wang"
+__copyright__ = "Copyright 2016, Stephens lab"
+__email__ = "gaow@uchicago.edu"
+__license__ = "MIT"
+'''
+Local scheduler packing module instances onto the machine by the resources
+declared in module @CONF:
+
+cpus_per_instance = 2, mem_per_instance = 4G, time_per_instance = 1h
+
+Each module instance executed locally is then launched as
+
+python -m dsc.dsc_scheduler <module> -- <command>
+
+by ``entrypoint`` option of its action, resolved at run time from
+environment variable ``DSC_SCHEDULER`` (see ``get_entrypoint``). It waits
+for a lease on resources of the module from the pool file named by
+environment variable ``DSC_RESOURCE_POOL``, if any, runs the command and then
+returns the lease. Waiting instances are served longest expected time first;
+smaller ones may fill in unused resources unless a waiting instance has been
+starved for too long. Run time of module instances is logged as they
+complete, for expected time of later runs.
+'''
+
+import os, sys, time, fcntl, pickle, subprocess, signal, shlex
+from contextlib import contextmanager
+
+POOL_ENV = 'DSC_RESOURCE_POOL'
+SCHEDULER_ENV = 'DSC_SCHEDULER'
+STARVATION = 60
+HISTORY_SIZE = 100
+TASK_OPTIONS_ENV = 'DSC_TASK_OPTIONS'
+RUNTIME_ENV = 'DSC_RUNTIME_LOG'
+# cores of a module instance, eg for threads of HDF5 compression
+THREADS_ENV = 'DSC_INSTANCE_THREADS'
+# walltime of an instance relative to its expected time
+WALLTIME_FACTOR = 2
+
+
+def get_physical_memory():
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError):
+        return None
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Resource_Pool:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def reset(self, cores, mem, requests):
+        '''
+        Start a new pool of ``cores`` and ``mem`` (bytes, None for no limit).
+        ``requests``: {module: dict(cpus_per_instance, mem_per_instance, time_per_instance)}
+        '''
+        with open(self.fn, 'wb') as f:
+            pickle.dump(
+                dict(budget=(cores, mem),
+                     requests=requests,
+                     leases=dict(),
+                     waiting=dict()), f)
+
+    @contextmanager
+    def _locked(self):
+        with open(self.fn, 'r+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                data = pickle.load(f)
+                yield data
+                f.seek(0)
+                f.truncate()
+                pickle.dump(data, f)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def get_request(data, module):
+        '''(cores, mem, walltime) of module, capped by pool budget'''
+        request = data['requests'].get(module, dict())
+        cores = min(request.get('cpus_per_instance', 1), data['budget'][0])
+        mem = request.get('mem_per_instance', 0)
+        if data['budget'][1] is not None:
+            mem = min(mem, data['budget'][1])
+        return cores, mem, request.get('time_per_instance', 0)
+
+    def acquire(self, module, pid):
+        '''Try to lease resources of module for process ``pid``; returns True if granted'''
+        with self._locked() as data:
+            for key in ['leases', 'waiting']:
+                for k in [k for k in data[key] if not is_alive(k)]:
+                    del data[key][k]
+            if pid not in data['waiting']:
+                data['waiting'][pid] = self.get_request(data, module) + (time.time(), )
+            free_cores = data['budget'][0] - sum([x[0] for x in data['leases'].values()])
+            free_mem = data['budget'][1] - sum([x[1] for x in data['leases'].values()]) \
+                if data['budget'][1] is not None else float('inf')
+            now = time.time()
+            for k, (cores, mem, walltime, since) in sorted(
+                    data['waiting'].items(), key=lambda x: (-x[1][2], x[1][3])):
+                fits = cores <= free_cores and mem <= free_mem
+                if k == pid:
+                    if fits:
+                        del data['waiting'][pid]
+                        data['leases'][pid] = (cores, mem)
+                    return fits
+                if fits:
+                    # reserved for waiting instance of higher priority
+                    free_cores -= cores
+                    free_mem -= mem
+                elif now - since > STARVATION:
+                    # stop filling in so it eventually gets the resources
+                    return False
+        return False
+
+    def get_lease(self, pid):
+        '''(cores, mem) leased to process ``pid``'''
+        with self._locked() as data:
+            return data['leases'].get(pid, (1, 0))
+
+    def release(self, pid):
+        with self._locked() as data:
+            data['leases'].pop(pid, None)
+            data['waiting'].pop(pid, None)
+
+
+def load_runtime_history(fn):
+    '''Run time history: {module: (number of instances, mean time in seconds)}'''
+    if not os.path.isfile(fn):
+        return dict()
+    with open(fn, 'rb') as f:
+        return pickle.load(f)
+
+
+def record_runtime(module, t):
+    '''
+    Add run time ``t`` of a module instance to the file named by environment
+    variable ``DSC_RUNTIME_LOG``, to be added to history after the run.
+    '''
+    fn = os.environ.get(RUNTIME_ENV)
+    if fn is None:
+        return
+    # single short line appended, not mixed up with other instances
+    with open(fn, 'a') as f:
+        f.write(f'{module}\t{t:.6f}\n')
+
+
+def update_runtime_history(fn, log):
+    '''
+    Add run time of module instances, as recorded in file ``log`` by
+    ``record_runtime``, to history and remove the log. Mean time of a module
+    is weighted to its latest ``HISTORY_SIZE`` instances.
+    '''
+    if not os.path.isfile(log):
+        return
+    with open(log) as f:
+        times = [x.rstrip('\n').split('\t') for x in f]
+    history = load_runtime_history(fn)
+    for x in times:
+        try:
+            module, t = x[0], float(x[1])
+        except (IndexError, ValueError):
+            # partially written line of an interrupted run
+            continue
+        n, mean = history.get(module, (0, 0))
+        n = min(n, HISTORY_SIZE)
+        history[module] = (n + 1, (mean * n + t) / (n + 1))
+    with open(fn + '.tmp', 'wb') as f:
+        pickle.dump(history, f)
+    os.replace(fn + '.tmp', fn)
+    os.remove(log)
+
+
+def get_expected_time(history, module):
+    '''Expected time of a module instance, by median of other modules if unknown'''
+    if module in history:
+        return history[module][1]
+    if len(history) == 0:
+        return 1
+    times = sorted([x[1] for x in history.values()])
+    return times[len(times) // 2]
+
+
+def get_bottom_levels(steps, workers):
+    '''
+    Expected time from beginning of each step to the end of benchmark,
+    along the longest (critical) path through downstream steps.
+    ``steps``: {step: (number of instances, time per instance, upstream steps)}
+    '''
+    downstream = dict([(x, []) for x in steps])
+    for x, (n, t, depends) in steps.items():
+        for y in depends:
+            if y in downstream:
+                downstream[y].append(x)
+    res = dict()
+
+    def visit(x):
+        if x not in res:
+            n, t = steps[x][:2]
+            # instances of a step run in parallel, by batches of workers
+            res[x] = t * -(-n // workers) + max(
+                [visit(y) for y in downstream[x]] or [0])
+        return res[x]
+
+    for x in steps:
+        visit(x)
+    return res
+
+
+def predict_makespan(steps, workers):
+    '''
+    Expected run time: the longest of critical path and total work over workers
+    '''
+    if len(steps) == 0:
+        return 0
+    return max(
+        max(get_bottom_levels(steps, workers).values()),
+        sum([n * t for n, t, depends in steps.values()]) / workers)
+
+
+def get_trunk_size(n, t, time_per_job, workers=1, min_jobs=1):
+    '''
+    Number of module instances per job, for ``n`` instances of expected
+    time ``t`` each: a job running ``workers`` instances at a time takes about
+    ``time_per_job``, unless that leaves fewer than ``min_jobs`` jobs to run
+    in parallel.
+    '''
+    size = max(int(time_per_job / max(t, 1E-3)), 1) * workers
+    return max(min(size, -(-n // max(min_jobs, 1))), 1)
+
+
+def get_walltime(t):
+    '''Walltime of a module instance of expected time ``t``, in seconds'''
+    return max(int(t * WALLTIME_FACTOR) + 1, 60)
+
+
+_task_options = dict()
+
+
+def get_task_option(module, key):
+    '''
+    ``trunk_size`` or ``walltime`` of tasks of module for current run, from
+    file named by environment variable ``DSC_TASK_OPTIONS``. It is called from
+    task options so that these values are not part of step signatures.
+    '''
+    fn = os.environ[TASK_OPTIONS_ENV]
+    mtime = os.stat(fn).st_mtime_ns
+    if _task_options.get('__mtime__') != (fn, mtime):
+        with open(fn, 'rb') as f:
+            _task_options.clear()
+            _task_options.update(pickle.load(f))
+        _task_options['__mtime__'] = (fn, mtime)
+    return _task_options[module][key]
+
+
+def get_entrypoint():
+    '''
+    Entrypoint of local module instance commands, to be formatted with module
+    name. It is set to environment variable ``DSC_SCHEDULER`` for a run, and
+    resolved from there by ``entrypoint`` option of module actions.
+    '''
+    return f'{shlex.quote(sys.executable)} -m dsc.dsc_scheduler {{}} --'
+
+
+def main():
+    module = sys.argv[1]
+    cmd = sys.argv[sys.argv.index('--') + 1:]
+    fn = os.environ.get(POOL_ENV)
+    pool = Resource_Pool(fn) if fn is not None and os.path.isfile(fn) else None
+    pid = os.getpid()
+    delay = 0.05
+    try:
+        while pool is not None and not pool.acquire(module, pid):
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
+        env = dict(os.environ)
+        if pool is not None:
+            env[THREADS_ENV] = str(pool.get_lease(pid)[0])
+        start = time.time()
+        p = subprocess.Popen(cmd, env=env)
+        for sig in [signal.SIGTERM, signal.SIGINT]:
+            signal.signal(sig, lambda s, f: p.send_signal(s))
+        ret = p.wait()
+        if ret == 0:
+            record_runtime(module, time.time() - start)
+    finally:
+        if pool is not None:
+            pool.release(pid)
+    sys.exit(ret if ret >= 0 else 128 - ret)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,16 +6,19 @@ __license__ = "MIT"
 '''
 This file defines methods to translate DSC into pipeline in SoS language
 '''
-import os, sys, pickle, glob, inspect
+import os, re, sys, pickle, glob
 try:
     from xxhash import xxh32 as xxh
 except ImportError:
     from hashlib import md5 as xxh
-from collections import OrderedDict
+from collections import OrderedDict, Counter
 from sos.targets import path
+from sos.utils import env
 from sos import execute_workflow
-from .utils import uniq_list, dict2str, n2a, install_package
+from .utils import uniq_list, n2a, install_package
 from .dsc_io import load_io_db
+from .dsc_database import match_ledger
+from .dsc_scheduler import SCHEDULER_ENV
 from .syntax import DSC_CACHE
 __all__ = ['DSC_Translator']
 
@@ -42,19 +45,34 @@ class DSC_Translator:
                     for kk in runtime.groups[k]:
                         host_conf[kk] = host_conf[k]
                     del host_conf[k]
-        conf_header = 'import os\nfrom dsc.dsc_database import build_config_db, ResultDB\n'
-        job_header = f"[global]\nimport os\n\nIO_DB = '{DSC_CACHE}/{self.db}.io.pkl'\n\n"\
-                     f"{inspect.getsource(load_io_db)}"
+        conf_header = 'import os\nfrom dsc.dsc_database import prepare_io, build_config_db, ResultDB\n'
+        self.host_conf = host_conf
+        # imported, not defined here, so that its cache is kept across steps
+        job_header = f"[global]\nimport os\nfrom dsc.dsc_io import load_io_db\n\nIO_DB = '{DSC_CACHE}/{self.db}.io.pkl'\n"
+        if host_conf is not None and any(
+            [v.get('trunk_size') == 'auto' for v in host_conf.values()]):
+            job_header += "\nfrom dsc.dsc_scheduler import get_task_option\n"
         processed_steps = dict()
         self.depends = dict()
         conf_dict = dict()
-        conf_str = []
+        # module instances to configure, see dsc_database.prepare_io
+        self.io_conf = []
         job_str = []
         exe_signatures = dict()
+        # signatures of module steps, to tell if a module will be re-executed
+        self.signatures = dict()
         # name map for steps, very important
         # to be used to expand IO_DB after load
         self.step_map = dict()
         self.exe_check = []
+        # module actions to run without SoS, see dsc_executor
+        self.actions = dict()
+        # resources of modules, for local scheduler
+        self.resources = dict([(step.name, step.resources)
+                               for workflow in workflows
+                               for step in workflow.values()
+                               if step.resources])
+        local_modules = []
         # Get workflow steps
         for workflow_id, workflow in enumerate(workflows):
             self.step_map[workflow_id + 1] = dict()
@@ -77,10 +95,15 @@ class DSC_Translator:
                             if x == step.name
                     ]) == 0:
                         job_translator = self.Step_Translator(
-                            step, self.db, None, try_catch, host_conf, debug)
+                            step, self.db, try_catch, host_conf, debug)
                         job_str.append(job_translator.dump())
+                        self.signatures[step.name] = xxh(
+                            job_str[-1].encode()).hexdigest()
                         exe_signatures[
                             step.name] = job_translator.exe_signature
+                        self.actions[step.name] = job_translator.native
+                        if job_translator.local:
+                            local_modules.append(step.name)
                         self.exe_check.extend(job_translator.exe_check)
                     processed_steps[(step.name, flow, depend)] = name
                     if step.name not in self.depends:
@@ -88,37 +111,30 @@ class DSC_Translator:
                     if len(step.depends) and step.depends not in self.depends[
                             step.name]:
                         self.depends[step.name].append(step.depends)
-                    conf_translator = self.Step_Translator(
-                        step, self.db, self.step_map[workflow_id + 1],
-                        try_catch, None)
-                    conf_dict[name] = conf_translator.dump()
+                    conf_dict[name] = self.get_io_conf(
+                        step, self.step_map[workflow_id + 1])
                 else:
                     self.step_map[workflow_id +
                                   1][step.name] = processed_steps[(step.name,
                                                                    flow,
                                                                    depend)]
         # Get workflows executions
-        io_info_files = []
         self.last_steps = []
         # Execution steps, unfiltered
         self.job_pool = OrderedDict()
+        self.step_ids = dict([(k, sum([abs(int(x, 16)) % (10**8) for x in v]))
+                              for k, v in exe_signatures.items()])
         # Do not document steps that has been configured already in its unique context
         configured_steps = set()
         for workflow_id, sequence in enumerate(runtime.sequence):
             sqn = [self.step_map[workflow_id + 1][x] for x in sequence]
-            new_steps = [
-                conf_dict[x] for x in sqn if x not in configured_steps
-            ]
-            configured_steps.update(sqn)
             # Configuration
-            if len(new_steps):
-                conf_str.append(f"###\n# [{n2a(workflow_id + 1)}]\n###\n" \
-                                f"__pipeline_id__ = {workflow_id + 1}\n"\
-                                f'''__pipeline_name__ = '{"+".join([n2a(x[1]).lower()+"_"+x[0] for x in sqn])}'\n''' \
-                                f"# output: '{DSC_CACHE}/{self.db}_{workflow_id + 1}.pkl'\n")
-                conf_str.extend(new_steps)
-                io_info_files.append(
-                    f'{DSC_CACHE}/{self.db}_{workflow_id + 1}.pkl')
+            pipeline_name = "+".join([n2a(x[1]).lower() + "_" + x[0] for x in sqn])
+            self.io_conf.extend([
+                dict(conf_dict[x], pipeline_id=workflow_id + 1, pipeline_name=pipeline_name)
+                for x in sqn if x not in configured_steps
+            ])
+            configured_steps.update(sqn)
             # Execution pool
             ii = 1
             for y in sequence:
@@ -131,27 +147,20 @@ class DSC_Translator:
                 tmp_str.append(f"output: data_io['output']")
                 tmp_str.append(f"sos_run('{y}', {y}_output_files = data_io['output'], " + \
                                (f"{y}_input_files = data_io['input'], " if len(self.depends[y]) else "") + \
-                               f"DSC_STEP_ID_ = {sum([abs(int(x, 16)) % (10**8) for x in exe_signatures[y]])})")
+                               f"DSC_STEP_ID_ = {self.step_ids[y]})")
                 if ii == len(sequence):
                     self.last_steps.append((y, workflow_id + 1))
                 self.job_pool[(y, workflow_id + 1)] = tmp_str
                 ii += 1
-        conf_str_py = 'import pickle\nfrom collections import OrderedDict\n' + \
-                      'from dsc.utils import sos_hash_output, sos_group_input, chunks as sos_chunks\n' + \
-                      '\n'.join([f'## {x}' for x in dict2str(self.step_map).split('\n')]) + \
-                      '@profile #via "kernprof -l" and "python -m line_profiler"\ndef prepare_io():\n\t'+ \
-                      f'\n\t__io_db__ = OrderedDict()\n\t' + \
-                      '\n\t'.join('\n'.join(conf_str).split('\n')) + \
-                      f"\n\tpickle.dump(__io_db__, open('{DSC_CACHE}/{self.db}.cfg.pkl', 'wb'))\n\n" + \
-                      "if __name__ == '__main__':\n\tprepare_io()"
+        # module instances run locally, packed by resources if any declared
+        self.scheduled = local_modules if len(self.resources) else []
         self.job_str = job_header + "\n{}".format('\n'.join(job_str))
         self.conf_str_sos = conf_header + \
                             "\n[deploy_1 (Hashing output files)]" + \
+                            f"\ninput: '{DSC_CACHE}/{self.db}.prepare.pkl'" + \
                             (f'\ndepends: {", ".join(uniq_list(self.exe_check))}' if len(self.exe_check) and host_conf is None else '') + \
                             f"\noutput: '{DSC_CACHE}/{self.db}.cfg.pkl'" + \
-                            "\nscript: interpreter={}, suffix='.py'\n{}\n".\
-                            format(f'{path(sys.executable):er}',
-                                   '\n'.join(['\t' + x for x in conf_str_py.split('\n')])) + \
+                            "\nprepare_io(str(_input[0]), str(_output[0]))\n" + \
                             "\n[deploy_2 (Configuring output filenames)]\n"\
                             f"parameter: vanilla = {rerun}\n"\
                             f"output: '{self.output}/{self.db}.map.mpk', "\
@@ -171,10 +180,38 @@ class DSC_Translator:
                           "Python_Module")
             self.pull_images(runtime.container)
 
+    @staticmethod
+    def get_io_conf(step, step_map):
+        '''
+        Configuration of module instances of a step, to be expanded by
+        ``dsc_database.prepare_io``; ``step_map`` maps modules to steps of
+        current pipeline.
+        '''
+        params = list(step.p.keys())
+        # module instances are identified by hash of these
+        template = ' '.join([step.name, ' '.join([x.replace('{', '{{').replace('}', '}}') for x in step.exe['args']]) if step.exe['args'] else ''] \
+                            + step.exe['file'] + [f'{k}:{xxh(str(step.rv[k])).hexdigest()}' for k in sorted(step.rv)] \
+                            + [f'{k}:{step.rf[k]}' for k in sorted(step.rf)] \
+                            + [f'{x}:{{}}' for x in reversed(params)])
+        return dict(name=step.name,
+                    step=step_map[step.name],
+                    out_vars=list(step.rv.keys()) + list(step.rf.keys()),
+                    params=OrderedDict([(k, step.p[k]) for k in params]),
+                    filter=step.ft,
+                    template=template,
+                    depends=[step_map[x] for x in uniq_list([x[0] for x in step.depends])],
+                    ext=step.plugin.output_ext if len(step.exe['path']) == 0 and len(step.rv) > 0 else 'yml')
+
     def get_pipeline(self, task, save=False):
         if task == 'prepare':
             res = self.conf_str_sos
             pickle.dump(self.step_map, open(f'{DSC_CACHE}/{self.db}.io.meta.pkl', 'wb'))
+            # only updated when changed, so that SoS skips configuration
+            fn = f'{DSC_CACHE}/{self.db}.prepare.pkl'
+            conf = pickle.dumps(self.io_conf)
+            if not os.path.isfile(fn) or open(fn, 'rb').read() != conf:
+                with open(fn, 'wb') as f:
+                    f.write(conf)
         else:
             res = self.job_str
         # write explicit SoS script if desired
@@ -184,26 +221,125 @@ class DSC_Translator:
                 f.write(res)
         return res
 
-    def filter_execution(self, debug=False):
-        '''Filter steps removing the ones having common input and output'''
+    def filter_execution(self, debug=False, ledger=None, history=None, workers=1):
+        '''
+        Filter steps removing the ones having common input and output.
+        With completion ``ledger`` ({output file: module signature}, see
+        ``dsc_database.load_ledger``), steps whose module instances have all
+        completed with current module signature, and whose upstream steps
+        are also completed, are removed so SoS does not validate them.
+        With run time ``history`` (see ``dsc_scheduler.load_runtime_history``),
+        dependencies are listed critical path first so that SoS starts them
+        first, and run time of the benchmark is predicted.
+        '''
+        from .dsc_scheduler import get_expected_time, get_bottom_levels, predict_makespan
         io_db = load_io_db(f'{DSC_CACHE}/{self.db}.io.pkl')
+        steps = dict([(x, (len(io_db[str(x[1])][x[0]]['output']),
+                           get_expected_time(history or dict(), x[0]),
+                           [tuple(s) for s in io_db[str(x[1])][x[0]]['depends']]))
+                      for x in self.job_pool if self.step_map[x[1]][x[0]] == x])
+        priority = get_bottom_levels(steps, workers) if history else dict()
         included_steps = []
+        completed_steps = set()
+        stats = dict()
+        # module instances to be executed: {output file: module signature}
+        self.executed = dict()
+        # number of module instances expected to run, to predict run time
+        to_run = dict()
+        # and of each module, see get_task_options
+        self.to_run = Counter()
+        for x in steps:
+            depends = steps[x][2] if self.job_pool[x][1] == 'DEPENDS_STR' else []
+            outputs = io_db[str(x[1])][x[0]]['output']
+            if ledger is not None and all(
+                [s in completed_steps for s in depends]) and all([
+                    match_ledger(ledger.get(os.path.relpath(f, self.output)),
+                                 f, self.signatures[x[0]], stats)
+                    for f in outputs
+                ]):
+                completed_steps.add(x)
+                continue
+            if self.job_pool[x][1] == 'DEPENDS_STR':
+                depends_str = [
+                    f"sos_step('{n2a(s[1]).lower()}_{s[0]}')"
+                    for s in sorted(depends, key=lambda s: -priority.get(s, 0))
+                    if s not in completed_steps
+                ]
+                self.job_pool[x][1] = f'depends: {", ".join(depends_str)}' \
+                    if len(depends_str) else ''
+            self.job_str += "\n" + "\n".join(
+                [s for s in self.job_pool[x] if s])
+            included_steps.append(x)
+            self.executed.update(
+                dict([(f, self.signatures[x[0]]) for f in outputs]))
+            to_run[x] = (len([
+                f for f in outputs if ledger is None or not match_ledger(
+                    ledger.get(os.path.relpath(f, self.output)), f,
+                    self.signatures[x[0]], stats)
+            ]), ) + steps[x][1:]
+            self.to_run[x[0]] += to_run[x][0]
+        # for dsc_executor
+        self.included_steps = included_steps
+        self.priority = priority
+        #
+        self.last_steps = sorted(
+            [x for x in self.last_steps if x in included_steps],
+            key=lambda x: -priority.get(x, 0))
+        self.job_str += "\n\n[{}]\ndata_io = load_io_db(IO_DB)".\
+                        format('default' if debug else 'DSC (output validation)')
+        if len(self.last_steps):
+            self.job_str += "\ndepends: {}\noutput: {}".\
+                            format(', '.join([f"sos_step('{n2a(x[1]).lower()}_{x[0]}')" for x in self.last_steps]),
+                                   ', '.join([f"data_io['{x[1]}']['{x[0]}']['output']" for x in self.last_steps]))
+        if len(completed_steps):
+            env.logger.info(
+                f"{len(completed_steps)} completed module step(s) found in ledger and are not checked again."
+            )
+        # predicted run time in seconds
+        self.predicted = predict_makespan(to_run, workers) if history else None
+
+    def get_task_options(self, history, max_running_jobs=None):
+        '''
+        ``trunk_size`` and ``walltime`` of tasks for modules configured with
+        ``instances_per_job: auto``, by their expected time from ``history``
+        or else ``time_per_instance``, for instances to run
+        (see ``filter_execution``). ``max_running_jobs``: {queue: number}
+        '''
+        from sos.utils import expand_time
+        from .dsc_scheduler import get_trunk_size, get_walltime, WALLTIME_FACTOR
+        counts = self.to_run
+        res = dict()
+        for module in counts:
+            if counts[module] == 0:
+                continue
+            conf = self.host_conf.get(module, self.host_conf['default'])
+            if conf.get('trunk_size') != 'auto':
+                continue
+            if module in history:
+                t = history[module][1]
+            else:
+                t = self.resources.get(module, dict()).get(
+                    'time_per_instance',
+                    expand_time(conf['walltime'])) / WALLTIME_FACTOR
+            # trunk_workers: "[instances_per_node] * nodes_per_job"
+            workers = [int(x) for x in re.findall(r'\d+', conf['trunk_workers'])]
+            res[module] = dict(trunk_size=get_trunk_size(
+                counts[module], t, conf['time_per_job'],
+                workers[0] * workers[1],
+                (max_running_jobs or dict()).get(conf['queue'], 1)),
+                               walltime=get_walltime(t))
+        return res
+
+    def get_outputs(self):
+        '''Output files of all module instances: {output file: module signature}'''
+        io_db = load_io_db(f'{DSC_CACHE}/{self.db}.io.pkl')
+        res = dict()
         for x in self.job_pool:
             if self.step_map[x[1]][x[0]] == x:
-                if self.job_pool[x][1] == 'DEPENDS_STR':
-                    depends_str = [
-                        f"sos_step('{n2a(s[1]).lower()}_{s[0]}')"
-                        for s in io_db[str(x[1])][x[0]]['depends']
-                    ]
-                    self.job_pool[x][1] = f'depends: {", ".join(depends_str)}'
-                self.job_str += "\n" + "\n".join(self.job_pool[x])
-                included_steps.append(x)
-        #
-        self.last_steps = [x for x in self.last_steps if x in included_steps]
-        self.job_str += "\n\n[{}]\ndata_io = load_io_db(IO_DB)\ndepends: {}\noutput: {}".\
-                        format('default' if debug else 'DSC (output validation)',
-                               ', '.join([f"sos_step('{n2a(x[1]).lower()}_{x[0]}')" for x in self.last_steps]),
-                               ', '.join([f"data_io['{x[1]}']['{x[0]}']['output']" for x in self.last_steps]))
+                res.update(
+                    dict([(f, self.signatures[x[0]])
+                          for f in io_db[str(x[1])][x[0]]['output']]))
+        return res
 
     def install_libs(self, libs, lib_type):
         if lib_type not in ["R_library", "Python_Module"]:
@@ -259,35 +395,29 @@ class DSC_Translator:
         def __init__(self,
                      step,
                      db,
-                     step_map,
                      try_catch,
                      host_conf=None,
                      debug=False):
             '''
-            prepare step:
-             - will produce source to build config and database for
-            parameters and file names. The result is a dictionary (key-value database) saved in pickle
-            run step:
-             - will construct the actual script to run
+            Construct the module step to run. Parameters and file names of
+            module instances are configured by ``DSC_Translator.get_io_conf``.
             '''
             # FIXME
-            #if step_map is not None and len(step.rf.values()) > 1:
+            #if len(step.rf.values()) > 1:
             #    sys.stderr.write(f'INTERNAL WARNING: "{step.name}" has multiple output files, but only meta-file signature is tracked. '\
             #                     'Rigorous support of multiple output files is not yet implemented in current version of DSC.\n')
-            self.step_map = step_map
             self.try_catch = try_catch
             self.exe_signature = []
             self.exe_check = []
-            self.prepare = 0 if step_map is None else 1
             self.step = step
             self.current_depends = uniq_list([x[0] for x in step.depends
                                               ]) if step.depends else []
             self.db = db
             self.conf = host_conf
             self.debug = debug
-            self.input_vars = None
+            # module instances run on local machine (not as tasks), see dsc_scheduler
+            self.local = False
             self.header = ''
-            self.loop_string = ['', '']
             self.filter_string = ''
             self.param_string = ''
             self.input_string = ''
@@ -295,6 +425,7 @@ class DSC_Translator:
             self.input_option = []
             self.step_option = ''
             self.action = ''
+            self.native = None
             self.get_header()
             self.get_parameters()
             self.get_input()
@@ -303,167 +434,135 @@ class DSC_Translator:
             self.get_action()
 
         def get_header(self):
-            if self.prepare:
-                self.header = f"## Codes for {self.step.name}\n"
-                self.header += f"__out_vars__ = {repr([x for x in list(self.step.rv.keys()) + list(self.step.rf.keys())])}"
-            else:
-                self.header = f"\n[{self.step.name} (module {self.step.name})]\n"
-                self.header += f"parameter: DSC_STEP_ID_ = None\nparameter: {self.step.name}_output_files = list"
+            self.header = f"\n[{self.step.name} (module {self.step.name})]\n"
+            self.header += f"parameter: DSC_STEP_ID_ = None\nparameter: {self.step.name}_output_files = list"
 
         def get_parameters(self):
             # Set params, make sure each time the ordering is the same
             self.params = list(self.step.p.keys())
             for key in self.params:
-                self.param_string += '{}{} = {}\n'.\
-                                     format('' if self.prepare else "parameter: ", key, repr(self.step.p[key]))
-            if self.params:
-                self.loop_string[0] = ' '.join(
-                    [f'for _{s} in {s}' for s in reversed(self.params)])
+                self.param_string += 'parameter: {} = {}\n'.\
+                                     format(key, repr(self.step.p[key]))
             if self.step.ft:
                 self.filter_string = ' if ' + self.step.ft
 
         def get_input(self):
-            if self.prepare:
-                if self.current_depends:
-                    self.input_string += f"## With variables from: {', '.join(self.current_depends)}"
-                if len(self.current_depends) >= 2:
-                    self.input_vars = f'__{n2a(int(self.step_map[self.step.name][1])).lower()}_{self.step.name}_input__'
-                    self.input_string += '\n{} = sos_group_input({})'.\
-                       format(self.input_vars,
-                              ', '.join([f'__{n2a(int(self.step_map[x][1])).lower()}_{x}_output__' for x in self.current_depends]))
-                elif len(self.current_depends) == 1:
-                    self.input_vars = f"__{n2a(int(self.step_map[self.current_depends[0]][1])).lower()}_{self.current_depends[0]}_output__"
-                else:
-                    pass
-                if len(self.current_depends):
-                    if len(self.current_depends) > 1:
-                        self.loop_string[
-                            1] = f'for __i__ in sos_chunks({self.input_vars}, {len(self.current_depends)})'
-                    else:
-                        self.loop_string[1] = f'for __i__ in {self.input_vars}'
+            if len(self.current_depends):
+                self.input_string += "parameter: {0}_input_files = list\ninput: {0}_input_files".\
+                                     format(self.step.name)
+                self.input_option.append(
+                    f'group_by = {len(self.current_depends)}')
             else:
-                if len(self.current_depends):
-                    self.input_string += "parameter: {0}_input_files = list\ninput: {0}_input_files".\
-                                         format(self.step.name)
-                    self.input_option.append(
-                        f'group_by = {len(self.current_depends)}')
+                self.input_string += "input:"
+            if len(self.params):
+                if self.filter_string:
+                    self.input_option.append("for_each = {{'{0}':[({0}) {1}{2}]}}".\
+                                             format(','.join([f'_{x}' for x in self.params]),
+                                                    ' '.join([f'for _{s} in {s}' for s in reversed(self.params)]),
+                                                    self.filter_string))
                 else:
-                    self.input_string += "input:"
-                if len(self.params):
-                    if self.filter_string:
-                        self.input_option.append("for_each = {{'{0}':[({0}) {1}{2}]}}".\
-                                                 format(','.join([f'_{x}' for x in self.params]),
-                                                        ' '.join([f'for _{s} in {s}' for s in reversed(self.params)]),
-                                                        self.filter_string))
-                    else:
-                        self.input_option.append(
-                            f'for_each = {repr(self.params)}')
+                    self.input_option.append(
+                        f'for_each = {repr(self.params)}')
 
         def get_output(self):
-            if self.prepare:
-                format_string = '.format({})'.format(', '.join([
-                    f'_{s}' for s in reversed(self.params)
-                ])) if len(self.params) else ''
-                output_lhs = f"__{n2a(int(self.step_map[self.step.name][1])).lower()}_{self.step.name}_output__"
-                self.output_string += "{3} = sos_hash_output(['{0}'{1} {2}])".\
-                                      format(' '.join([self.step.name,
-                                                       ' '.join([x.replace('{', '{{').replace('}', '}}') for x in self.step.exe['args']]) if self.step.exe['args'] else ''] \
-                                                      + self.step.exe['file'] + [f'{k}:{xxh(str(self.step.rv[k])).hexdigest()}' for k in sorted(self.step.rv)] \
-                                                      + [f'{k}:{self.step.rf[k]}' for k in sorted(self.step.rf)] \
-                                                      + [f'{x}:{{}}' for x in reversed(self.params)]),
-                                             format_string, self.loop_string[0] + self.filter_string, output_lhs)
-                if len(self.current_depends):
-                    self.output_string += "\n{0} = ['{1}:{{}}:{{}}'.format(item, {3}) " \
-                                          "for item in {0} {2}]".format(output_lhs, self.step.name, self.loop_string[1],
-                                                                        "':'.join(__i__)" if len(self.current_depends) > 1 else "__i__")
-                else:
-                    self.output_string += "\n{0} = ['{1}:{{}}'.format(item) for item in {0}]".\
-                                          format(output_lhs, self.step.name)
-            else:
-                self.output_string += f"output: {self.step.name}_output_files[_index]"
+            self.output_string += f"output: {self.step.name}_output_files[_index]"
 
         def get_step_option(self):
-            if not self.prepare:
-                if self.conf is None or (self.step.name in self.conf and self.conf[self.step.name]['queue'] is None) \
-                   or (self.step.name not in self.conf and self.conf['default']['queue'] is None):
-                    return
-                self.step_option += f"task: {', '.join([str(k) + ' = ' + (repr(v) if isinstance(v, str) and k != 'trunk_workers' else str(v)) for k, v in self.conf[self.step.name if self.step.name in self.conf else 'default'].items()])}, tags = f'{self.step.name}_{{_output:bn}}'"
-                self.step_option += '\n' if path(self.step.workdir).absolute(
-                ) == path.cwd() else f', workdir = {repr(self.step.workdir)}\n'
+            if self.conf is None or (self.step.name in self.conf and self.conf[self.step.name]['queue'] is None) \
+               or (self.step.name not in self.conf and self.conf['default']['queue'] is None):
+                return
+            if self.step.name in self.conf:
+                conf = self.conf[self.step.name]
+            else:
+                # module resources in @CONF take precedence over default
+                conf = dict(self.conf['default'])
+                for k, kk in [('cpus_per_instance', 'cores'),
+                              ('mem_per_instance', 'mem'),
+                              ('time_per_instance', 'walltime')]:
+                    if k in self.step.resources and kk in conf:
+                        conf[kk] = self.step.resources[k]
+            options = [(k, repr(v) if isinstance(v, str) and k != 'trunk_workers' else str(v))
+                       for k, v in conf.items() if k != 'time_per_job']
+            if conf.get('trunk_size') == 'auto':
+                # computed for each run, see DSC_Translator.get_task_options
+                options = [(k, f"get_task_option('{self.step.name}', '{k}')"
+                            if k in ['trunk_size', 'walltime'] else v)
+                           for k, v in options]
+            self.step_option += f"task: {', '.join([k + ' = ' + v for k, v in options])}, tags = f'{self.step.name}_{{_output:bn}}'"
+            self.step_option += '\n' if path(self.step.workdir).absolute(
+            ) == path.cwd() else f', workdir = {repr(self.step.workdir)}\n'
 
         def get_action(self):
-            if self.prepare:
-                combined_params = '[([{0}], {1}) {2}]'.\
-                                  format(', '.join([f"('{x}', _{x})" for x in reversed(self.params)]),
-                                         None if self.loop_string[1] == '' else ("f\"{' '.join(__i__)}\"" if len(self.current_depends) > 1 else "f'{__i__}'"),
-                                         ' '.join(self.loop_string) + self.filter_string)
-                input_str = '[]' if self.input_vars is None else '{0} if {0} is not None else []'.format(
-                    self.input_vars)
-                output_str = f"__{n2a(int(self.step_map[self.step.name][1])).lower()}_{self.step.name}_output__"
-                # FIXME: multiple output to be implemented
-                ext_str = self.step.plugin.output_ext if (
-                    len(self.step.exe['path']) == 0
-                    and len(self.step.rv) > 0) else 'yml'
-                if len(self.current_depends):
-                    self.action += f"__io_db__[('{self.step.name}', __pipeline_id__)] = dict([(tuple(' '.join((y, x[1])).split()), dict([('__pipeline_id__', __pipeline_id__), ('__pipeline_name__', __pipeline_name__), ('__module__', '{self.step.name}'), ('__out_vars__', __out_vars__)] + x[0])) for x, y in zip({combined_params}, {output_str})] + [('__input_output___', ({input_str}, {output_str})), ('__ext__', '{ext_str}')])\n"
-                else:
-                    self.action += f"__io_db__[('{self.step.name}', __pipeline_id__)] = dict([((y,), dict([('__pipeline_id__', __pipeline_id__), ('__pipeline_name__', __pipeline_name__), ('__module__', '{self.step.name}'), ('__out_vars__', __out_vars__)] + x[0])) for x, y in zip({combined_params}, {output_str})] + [('__input_output___', ({input_str}, {output_str})), ('__ext__', '{ext_str}')])\n"
-            else:
-                # FIXME: have not considered multi-action module (or compound module) yet
-                # Create fake loop for now with idx going around
-                signature = []
-                for idx, (plugin, cmd) in enumerate(
-                        zip([self.step.plugin], [self.step.exe])):
-                    sigil = '$[ ]' if plugin.name == 'bash' else '${ }'
-                    self.action += f'{"python3" if plugin.name == "python" else plugin.name}: expand = "{sigil}"'
-                    if path(self.step.workdir).absolute() != path.cwd():
-                        self.action += f", workdir = {repr(self.step.workdir)}"
-                    self.action += f', stderr = f"{{_output:n}}.stderr", stdout = f"{{_output:n}}.stdout"'
-                    if self.step.container:
-                        self.action += f", container={repr(self.step.container)}"
-                        if self.step.container_engine:
-                            self.action += f", engine={repr(self.step.container_engine)}"
-                    if len(self.step.path):
-                        self.action += ", env={'PATH': '%s:' + os.environ['PATH']}" % ":".join(self.step.path)
-                    self.action += plugin.get_cmd_args(cmd['args'],
-                                                       self.params)
-                    signature.append(cmd['signature'])
-                    # Add action
-                    if len(cmd['path']) == 0:
-                        if self.debug:
-                            script = plugin.get_return(None)
-                        else:
-                            script_begin = plugin.load_env(
-                                self.step.depends, idx > 0
-                                and len(self.step.rv))
-                            script_begin += '\n' + plugin.get_input(
-                                self.params,
-                                self.step.libpath if self.step.libpath else [],
-                                self.step.seed)
-                            if len(self.step.rf):
-                                script_begin += '\n' + plugin.get_output(
-                                    self.step.rf)
-                            script_begin = '\n'.join(
-                                [x for x in script_begin.split('\n') if x])
-                            script_begin = f"{cmd['header']}\n{script_begin.strip()}\n\n## BEGIN DSC CORE"
-                            script_end = plugin.get_return(
-                                self.step.rv) if len(self.step.rv) else ''
-                            script_end = f'## END DSC CORE\n\n{script_end.strip()}'.strip(
-                            )
-                            script = '\n'.join(
-                                [script_begin, cmd['content'], script_end])
-                            if self.try_catch:
-                                script = plugin.add_try(
-                                    script, len([self.step.rf.values()]))
-                            script = f"""## {str(plugin)} script UUID: ${{DSC_STEP_ID_}}\n{script}\n"""
-                            script = '\n'.join(
-                                [f'  {x}' for x in script.split('\n')])
-                        self.action += script
+            # FIXME: have not considered multi-action module (or compound module) yet
+            # Create fake loop for now with idx going around
+            signature = []
+            for idx, (plugin, cmd) in enumerate(
+                    zip([self.step.plugin], [self.step.exe])):
+                sigil = '$[ ]' if plugin.name == 'bash' else '${ }'
+                action = "python3" if plugin.name == "python" else plugin.name
+                options = ''
+                if path(self.step.workdir).absolute() != path.cwd():
+                    options += f", workdir = {repr(self.step.workdir)}"
+                options += f', stderr = f"{{_output:n}}.stderr", stdout = f"{{_output:n}}.stdout"'
+                if self.step.container:
+                    options += f", container={repr(self.step.container)}"
+                    if self.step.container_engine:
+                        options += f", engine={repr(self.step.container_engine)}"
+                self.local = not self.step_option
+                if self.local and not self.step.container:
+                    # launched via local scheduler when set for the run, see dsc_scheduler
+                    options += f", entrypoint = os.environ.get({repr(SCHEDULER_ENV)}, '').format({repr(self.step.name)})"
+                if len(self.step.path):
+                    options += ", env={'PATH': '%s:' + os.environ['PATH']}" % ":".join(self.step.path)
+                options += plugin.get_cmd_args(cmd['args'], self.params)
+                self.action += f'{action}: expand = "{sigil}"{options}'
+                # same action for dsc_executor, without SoS
+                self.native = dict(action=action,
+                                   sigil=sigil,
+                                   options=f'dict({options.strip()[2:]})',
+                                   container=self.step.container,
+                                   params=self.params,
+                                   group_by=len(self.current_depends))
+                signature.append(cmd['signature'])
+                # Add action
+                if len(cmd['path']) == 0:
+                    if self.debug:
+                        script = plugin.get_return(None)
+                        self.native['script'] = script
                     else:
-                        self.exe_check.append(
-                            f"executable({repr(cmd['path'])})")
-                        self.action += f"\t{cmd['path']} {'$*' if cmd['args'] else ''}\n"
-                self.exe_signature.extend(signature)
+                        script_begin = plugin.load_env(
+                            self.step.depends, idx > 0
+                            and len(self.step.rv))
+                        script_begin += '\n' + plugin.get_input(
+                            self.params,
+                            self.step.libpath if self.step.libpath else [],
+                            self.step.seed)
+                        if len(self.step.rf):
+                            script_begin += '\n' + plugin.get_output(
+                                self.step.rf)
+                        script_begin = '\n'.join(
+                            [x for x in script_begin.split('\n') if x])
+                        script_begin = f"{cmd['header']}\n{script_begin.strip()}\n\n## BEGIN DSC CORE"
+                        script_end = plugin.get_return(
+                            self.step.rv) if len(self.step.rv) else ''
+                        script_end = f'## END DSC CORE\n\n{script_end.strip()}'.strip(
+                        )
+                        script = '\n'.join(
+                            [script_begin, cmd['content'], script_end])
+                        if self.try_catch:
+                            script = plugin.add_try(
+                                script, len([self.step.rf.values()]))
+                        script = f"""## {str(plugin)} script UUID: ${{DSC_STEP_ID_}}\n{script}\n"""
+                        self.native['script'] = script
+                        script = '\n'.join(
+                            [f'  {x}' for x in script.split('\n')])
+                    self.action += script
+                else:
+                    self.exe_check.append(
+                        f"executable({repr(cmd['path'])})")
+                    self.action += f"\t{cmd['path']} {'$*' if cmd['args'] else ''}\n"
+                    self.native['script'] = f"{cmd['path']} {'$*' if cmd['args'] else ''}\n"
+            self.exe_signature.extend(signature)
 
 
         def dump(self):
@@ -474,7 +573,7 @@ class DSC_Translator:
                         self.input_string,
                         (', ' if self.input_string != 'input:' else '') +
                         ', '.join(self.input_option)
-                    ]) if not self.prepare else self.input_string,
+                    ]),
                     self.output_string, self.step_option, self.action
                 ] if x
             ])
@@ -27,16 +27,24 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import os
 import numpy as np
 import tables
+from contextlib import contextmanager
 from scipy import sparse
 import pandas as pd
 from types import SimpleNamespace
 from .utils import logger
+from .dsc_scheduler import THREADS_ENV
 
 IO_PREFIX = 'DSC_'
 IO_UNPACK = 'DSC_IO_UNPACK'
 IO_ROOT_IS_SNS = 'DSC_ROOT_IS_SNS'
+# Target (uncompressed) size of a chunk of a compressed array, in bytes
+CHUNK_BYTES = 2**20
+# Arrays smaller than this size in bytes are not compressed, because for
+# small arrays compression actually leads to larger files
+COMPRESS_MIN_BYTES = 4096
 
 # Types that should be saved as pytables attribute
 ATTR_TYPES = (int, float, bool, str, bytes, np.int8, np.int16, np.int32,
@@ -54,6 +62,8 @@ aslice = SliceClass()
 
 class _HDFStoreWithHandle(pd.io.pytables.HDFStore):
     def __init__(self, handle):
+        # make sure pandas has its pytables module loaded
+        pd.io.pytables._tables()
         self._path = None
         self._complevel = None
         self._complib = None
@@ -80,10 +90,13 @@ class ForcePickle(object):
 class Compression(object):
     """
     Class to enable explicit compression settings for individual arrays.
+    `layout` can be set to `row` or `column` to override the expected
+    access pattern of the array (see `save`).
     """
-    def __init__(self, obj, compression='default'):
+    def __init__(self, obj, compression='default', layout=None):
         self.obj = obj
         self.compression = compression
+        self.layout = layout
 
 
 def _dict_native_ok(d):
@@ -128,18 +141,50 @@ def _get_compression_filters(compression='blosc'):
     return ff
 
 
-def _save_ndarray(handler, group, name, x, filters=None):
-    if np.issubdtype(x.dtype, np.unicode_):
+def _get_chunkshape(shape, itemsize, layout='row'):
+    """
+    Chunk shape of about `CHUNK_BYTES` in size. For `row` layout chunks are
+    filled from the last axis, so that a chunk holds complete rows (slicing
+    ``x[i, :]`` reads as few chunks as possible); for `column` layout chunks
+    are filled from the first axis, holding complete columns.
+    """
+    budget = max(CHUNK_BYTES // max(itemsize, 1), 1)
+    chunkshape = [1] * len(shape)
+    axes = range(len(shape))
+    for i in (axes if layout == 'column' else reversed(axes)):
+        chunkshape[i] = max(min(shape[i], budget), 1)
+        budget = max(budget // chunkshape[i], 1)
+    return tuple(chunkshape)
+
+
+@contextmanager
+def _blosc_threads(threads=None):
+    """
+    Set number of threads used by blosc to (de)compress data. By default
+    it is the number of cores of a module instance set by DSC, or 1, so that
+    module instances run in parallel do not oversubscribe the machine.
+    """
+    if threads is None:
+        threads = int(os.environ.get(THREADS_ENV, 1))
+    previous = tables.set_blosc_max_threads(max(threads, 1))
+    try:
+        yield
+    finally:
+        tables.set_blosc_max_threads(previous)
+
+
+def _save_ndarray(handler, group, name, x, filters=None, layout='row'):
+    if np.issubdtype(x.dtype, np.str_):
         # Convert unicode strings to pure byte arrays
         strtype = b'unicode'
         itemsize = x.itemsize // 4
         atom = tables.UInt8Atom()
         x = x.view(dtype=np.uint8)
-    elif np.issubdtype(x.dtype, np.string_):
+    elif np.issubdtype(x.dtype, np.bytes_):
         strtype = b'ascii'
         itemsize = x.itemsize
         atom = tables.StringAtom(itemsize)
-    elif x.dtype == np.object:
+    elif x.dtype == object:
         # Not supported by HDF5, force pickling
         _save_pickled(handler, group, x, name=name)
         return
@@ -163,15 +208,13 @@ def _save_ndarray(handler, group, name, x, filters=None):
         setattr(group._v_attrs, name, x[()])
         return
 
-    # For small arrays, compression actually leads to larger files, so we are
-    # settings a threshold here. The threshold has been set through
-    # experimentation.
-    if filters is not None and x.size > 300:
+    if filters is not None and x.nbytes > COMPRESS_MIN_BYTES:
         node = handler.create_carray(group,
                                      name,
                                      atom=atom,
                                      shape=x.shape,
-                                     chunkshape=None,
+                                     chunkshape=_get_chunkshape(
+                                         x.shape, atom.size, layout),
                                      filters=filters)
     else:
         node = handler.create_array(group, name, atom=atom, shape=x.shape)
@@ -181,6 +224,84 @@ def _save_ndarray(handler, group, name, x, filters=None):
     node[:] = x
 
 
+def _dataframe_native_ok(df):
+    """
+    This checks if a data frame can be saved natively, column by column.
+
+    If it can't, it will be saved via pandas `HDFStore`.
+    """
+    return not isinstance(df.columns, pd.MultiIndex) and not isinstance(
+        df.index, pd.MultiIndex)
+
+
+def _save_column(handler, group, name, x, filters=None):
+    """
+    Save a pandas column (or index) as an array that can be sliced by rows,
+    returns the kind of storage used.
+    """
+    dtype = x.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        _save_ndarray(handler, group, name, np.asarray(x.cat.codes),
+                      filters=filters)
+        _save_ndarray(handler, group, name + '_categories',
+                      np.asarray(dtype.categories))
+        group._f_get_child(name + '_categories')._v_attrs.ordered = dtype.ordered
+        return 'category'
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufc':
+        _save_ndarray(handler, group, name, np.asarray(x), filters=filters)
+        return 'numeric'
+    if isinstance(dtype, np.dtype) and dtype.kind in 'mM':
+        _save_ndarray(handler, group, name,
+                      np.asarray(x).view(np.int64), filters=filters)
+        return 'datetime'
+    values = np.asarray(x, dtype=object)
+    na = pd.isna(values)
+    if all(isinstance(v, str) for v in values[~na]):
+        # Strings are stored UTF-8 encoded with fixed width, so that they
+        # can be sliced unlike pickled objects
+        values = [v.encode('utf-8') if not m else b''
+                  for v, m in zip(values, na)]
+        _save_ndarray(handler, group, name, np.array(values, dtype=bytes),
+                      filters=filters)
+        # Trailing NUL bytes are dropped when reading fixed width strings,
+        # lengths are kept to restore them
+        if any(v.endswith(b'\x00') for v in values):
+            _save_ndarray(handler, group, name + '_len',
+                          np.array([len(v) for v in values], dtype=np.int64),
+                          filters=filters)
+        if na.any():
+            _save_ndarray(handler, group, name + '_na', na, filters=filters)
+        return 'string'
+    _save_pickled(handler, group, x, name=name)
+    return 'pickle'
+
+
+def _save_dataframe(handler, group, name, df, filters=None):
+    """
+    Save a data frame natively as one array per column, along with column
+    names, kinds and dtypes as group attributes.
+    """
+    new_group = handler.create_group(group, name,
+                                     "dataframe:{}".format(df.shape[1]))
+    kinds = [
+        _save_column(handler, new_group, 'c{}'.format(i), df.iloc[:, i],
+                     filters)
+        for i in range(df.shape[1])
+    ]
+    attrs = new_group._v_attrs
+    attrs.columns = list(df.columns)
+    attrs.kinds = kinds
+    attrs.dtypes = [str(x) for x in df.dtypes]
+    attrs.nrows = df.shape[0]
+    attrs.index_name = df.index.name
+    if isinstance(df.index, pd.RangeIndex):
+        attrs.index_range = (df.index.start, df.index.stop, df.index.step)
+    else:
+        attrs.index_kind = _save_column(handler, new_group, 'index',
+                                        df.index.to_series(), filters)
+        attrs.index_dtype = str(df.index.dtype)
+
+
 def _save_pickled(handler, group, level, name=None):
     node = handler.create_vlarray(group, name, tables.ObjectAtom())
     node.append(level)
@@ -192,7 +313,13 @@ def _is_linkable(level):
     return True
 
 
-def _save_level(handler, group, level, name=None, filters=None, idtable=None):
+def _save_level(handler,
+                group,
+                level,
+                name=None,
+                filters=None,
+                idtable=None,
+                layout='row'):
     _id = id(level)
     try:
         oldpath = idtable[_id]
@@ -215,7 +342,9 @@ def _save_level(handler, group, level, name=None, filters=None, idtable=None):
                            level.obj,
                            name=name,
                            filters=custom_filters,
-                           idtable=idtable)
+                           idtable=idtable,
+                           layout=level.layout
+                           if level.layout is not None else layout)
 
     elif isinstance(level, ForcePickle):
         _save_pickled(handler, group, level, name=name)
@@ -231,7 +360,8 @@ def _save_level(handler, group, level, name=None, filters=None, idtable=None):
                             v,
                             name=k,
                             filters=filters,
-                            idtable=idtable)
+                            idtable=idtable,
+                            layout=layout)
 
     elif isinstance(level, SimpleNamespace) and _dict_native_ok(
             level.__dict__):
@@ -245,7 +375,8 @@ def _save_level(handler, group, level, name=None, filters=None, idtable=None):
                             v,
                             name=k,
                             filters=filters,
-                            idtable=idtable)
+                            idtable=idtable,
+                            layout=layout)
 
     elif isinstance(level, list) and len(level) < 256:
         # Lists can contain other dictionaries and numpy arrays, so we don't
@@ -261,7 +392,8 @@ def _save_level(handler, group, level, name=None, filters=None, idtable=None):
                         entry,
                         name=level_name,
                         filters=filters,
-                        idtable=idtable)
+                        idtable=idtable,
+                        layout=layout)
 
     elif isinstance(level, tuple) and len(level) < 256:
         # Lists can contain other dictionaries and numpy arrays, so we don't
@@ -277,12 +409,21 @@ def _save_level(handler, group, level, name=None, filters=None, idtable=None):
                         entry,
                         name=level_name,
                         filters=filters,
-                        idtable=idtable)
+                        idtable=idtable,
+                        layout=layout)
 
     elif isinstance(level, np.ndarray):
-        _save_ndarray(handler, group, name, level, filters=filters)
+        _save_ndarray(handler,
+                      group,
+                      name,
+                      level,
+                      filters=filters,
+                      layout=layout)
+
+    elif isinstance(level, pd.DataFrame) and _dataframe_native_ok(level):
+        _save_dataframe(handler, group, name, level, filters=filters)
 
-    elif isinstance(level, (pd.DataFrame, pd.Series, pd.Panel)):
+    elif isinstance(level, (pd.DataFrame, pd.Series)):
         store = _HDFStoreWithHandle(handler)
         store.put(group._v_pathname + '/' + name, level)
 
@@ -362,7 +503,7 @@ def _load_specific_level(handler, grp, path, sel=None, pathtable=None):
             if sel is not None:
                 raise ValueError("Cannot slice this type")
             v = grp._v_attrs[vv[0]]
-            if isinstance(v, np.string_):
+            if isinstance(v, np.bytes_):
                 v = v.decode('utf-8')
             return v
         else:
@@ -386,6 +527,144 @@ def _load_specific_level(handler, grp, path, sel=None, pathtable=None):
                 raise ValueError('Undefined group "{}"'.format(level))
 
 
+def _read_array(node, sel=None):
+    """
+    Read an array saved by `_save_ndarray`, or a selection of it
+    """
+    if isinstance(node, tables.VLArray):
+        return _load_pickled(node)
+    if 'zeroarray_dtype' in node._v_attrs:
+        x = np.zeros(tuple(node[:]), dtype=node._v_attrs.zeroarray_dtype)
+        return x[sel] if sel is not None else x
+    return node[sel] if sel is not None else node[:]
+
+
+def _load_column(group, name, kind, dtype, rows=None):
+    node = getattr(group, name)
+    if kind == 'pickle':
+        x = _load_pickled(node)
+        return x.iloc[rows] if rows is not None else x
+    x = _read_array(node, rows)
+    if kind == 'category':
+        node = getattr(group, name + '_categories')
+        return pd.Categorical.from_codes(
+            x,
+            dtype=pd.CategoricalDtype(_read_array(node),
+                                      ordered=bool(node._v_attrs.ordered)))
+    if kind == 'datetime':
+        return x.view(dtype)
+    if kind == 'string':
+        if hasattr(group, name + '_len'):
+            x = [v.ljust(n, b'\x00') for v, n in
+                 zip(x, _read_array(getattr(group, name + '_len'), rows))]
+        x = np.array([v.decode('utf-8') for v in x], dtype=object)
+        if hasattr(group, name + '_na'):
+            x[_read_array(getattr(group, name + '_na'), rows)] = np.nan
+        return x if dtype == 'object' else pd.array(x, dtype=dtype)
+    return x
+
+
+def _load_dataframe(level, sel=None):
+    """
+    Load a data frame saved by `_save_dataframe`. `sel` can be a selection of
+    rows, or a tuple of selection of rows and list of column names, eg
+    ``aslice[:100, ['a', 'b']]``. Only the selected part is read from file.
+    """
+    attrs = level._v_attrs
+    rows, cols = sel if isinstance(sel, tuple) else (sel, None)
+    if isinstance(rows, (int, np.integer)):
+        # Keep a data frame of one row
+        rows = slice(rows, rows + 1 if rows != -1 else None)
+    if isinstance(rows, slice) and rows == slice(None):
+        rows = None
+    columns = list(attrs.columns)
+    if cols is None:
+        idx = list(range(len(columns)))
+    else:
+        cols = [cols] if not isinstance(cols, (list, tuple)) else cols
+        idx = []
+        for c in cols:
+            if c not in columns:
+                raise ValueError('Undefined column "{}"'.format(c))
+            idx.append(columns.index(c))
+    data = [
+        _load_column(level, 'c{}'.format(i), attrs.kinds[i], attrs.dtypes[i],
+                     rows) for i in idx
+    ]
+    if 'index_range' in attrs:
+        index = pd.RangeIndex(*attrs.index_range, name=attrs.index_name)
+        if rows is not None:
+            index = index[rows]
+    else:
+        index = pd.Index(_load_column(level, 'index', attrs.index_kind,
+                                      attrs.index_dtype, rows),
+                         name=attrs.index_name)
+    df = pd.DataFrame(dict(zip(range(len(idx)), data)), index=index)
+    df.columns = [columns[i] for i in idx]
+    return df
+
+
+def _load_sparse(level, sel=None):
+    """
+    Load a sparse matrix. For CSR (CSC) matrices only the rows (columns)
+    selected by a slice in `sel` are read from file.
+    """
+    frm = level._v_attrs.format
+    shape = tuple(_read_array(level.shape))
+    if sel is not None and frm in ('csr', 'csc'):
+        axes = sel if isinstance(sel, tuple) else (sel, )
+        axes = axes + (slice(None), ) * (2 - len(axes))
+        major, minor = (axes[0], axes[1]) if frm == 'csr' else (axes[1], axes[0])
+        n = shape[0] if frm == 'csr' else shape[1]
+        if isinstance(major, (int, np.integer)):
+            major = slice(major % n, major % n + 1)
+        if isinstance(major, slice) and major.step in (None, 1):
+            start, stop, _ = major.indices(n)
+            stop = max(start, stop)
+            indptr = _read_array(level.indptr, slice(start, stop + 1))
+            data = _read_array(level.data, slice(indptr[0], indptr[-1]))
+            indices = _read_array(level.indices,
+                                  slice(indptr[0], indptr[-1]))
+            shape = (stop - start, shape[1]) if frm == 'csr' else (
+                shape[0], stop - start)
+            cls = sparse.csr_matrix if frm == 'csr' else sparse.csc_matrix
+            matrix = cls((data, indices, indptr - indptr[0]), shape=shape)
+            matrix.maxprint = level._v_attrs.maxprint
+            if minor != slice(None):
+                matrix = matrix[:, minor] if frm == 'csr' else matrix[minor, :]
+            return matrix
+    elif sel is not None:
+        raise ValueError('Cannot partially load {} matrix using `sel`'.format(
+            frm.upper()))
+    if frm in ('csr', 'csc', 'bsr'):
+        cls = {
+            'csr': sparse.csr_matrix,
+            'csc': sparse.csc_matrix,
+            'bsr': sparse.bsr_matrix
+        }
+        matrix = cls[frm](shape)
+        matrix.data = _read_array(level.data)
+        matrix.indices = _read_array(level.indices)
+        matrix.indptr = _read_array(level.indptr)
+        matrix.maxprint = level._v_attrs.maxprint
+        return matrix[sel] if sel is not None else matrix
+    elif frm == 'dia':
+        matrix = sparse.dia_matrix(shape)
+        matrix.data = _read_array(level.data)
+        matrix.offsets = _read_array(level.offsets)
+        matrix.maxprint = level._v_attrs.maxprint
+        return matrix
+    elif frm == 'coo':
+        matrix = sparse.coo_matrix(shape)
+        matrix.data = _read_array(level.data)
+        matrix.col = _read_array(level.col)
+        matrix.row = _read_array(level.row)
+        matrix.maxprint = level._v_attrs.maxprint
+        return matrix
+    else:
+        raise ValueError('Unknown sparse matrix type: {}'.format(frm))
+
+
 def _load_pickled(level):
     if isinstance(level[0], ForcePickle):
         return level[0].obj
@@ -398,6 +677,14 @@ def _load_nonlink_level(handler, level, pathtable, pathname):
     Loads level and builds appropriate type, without handling softlinks
     """
     if isinstance(level, tables.Group):
+        # These are loaded directly without going through their children
+        if level._v_title.startswith('dataframe:'):
+            return _load_dataframe(level)
+        elif level._v_title.startswith('sparse:'):
+            return _load_sparse(level)
+        elif is_pandas_dataframe(level):
+            store = _HDFStoreWithHandle(handler)
+            return store.get(level._v_pathname)
         if level._v_title.startswith(
                 'SimpleNamespace:') or IO_ROOT_IS_SNS in level._v_attrs:
             val = SimpleNamespace()
@@ -442,41 +729,6 @@ def _load_nonlink_level(handler, level, pathtable, pathname):
             return tuple(lst)
         elif level._v_title.startswith('nonetype:'):
             return None
-        elif is_pandas_dataframe(level):
-            store = _HDFStoreWithHandle(handler)
-            return store.get(level._v_pathname)
-        elif level._v_title.startswith('sparse:'):
-            frm = level._v_attrs.format
-            if frm in ('csr', 'csc', 'bsr'):
-                shape = tuple(level.shape[:])
-                cls = {
-                    'csr': sparse.csr_matrix,
-                    'csc': sparse.csc_matrix,
-                    'bsr': sparse.bsr_matrix
-                }
-                matrix = cls[frm](shape)
-                matrix.data = level.data[:]
-                matrix.indices = level.indices[:]
-                matrix.indptr = level.indptr[:]
-                matrix.maxprint = level._v_attrs.maxprint
-                return matrix
-            elif frm == 'dia':
-                shape = tuple(level.shape[:])
-                matrix = sparse.dia_matrix(shape)
-                matrix.data = level.data[:]
-                matrix.offsets = level.offsets[:]
-                matrix.maxprint = level._v_attrs.maxprint
-                return matrix
-            elif frm == 'coo':
-                shape = tuple(level.shape[:])
-                matrix = sparse.coo_matrix(shape)
-                matrix.data = level.data[:]
-                matrix.col = level.col[:]
-                matrix.row = level.row[:]
-                matrix.maxprint = level._v_attrs.maxprint
-                return matrix
-            else:
-                raise ValueError('Unknown sparse matrix type: {}'.format(frm))
         else:
             return val
 
@@ -498,9 +750,9 @@ def _load_nonlink_level(handler, level, pathtable, pathname):
             strtype = level._v_attrs.strtype
             itemsize = level._v_attrs.itemsize
             if strtype == b'unicode':
-                return level[:].view(dtype=(np.unicode_, itemsize))
+                return level[:].view(dtype=(np.str_, itemsize))
             elif strtype == b'ascii':
-                return level[:].view(dtype=(np.string_, itemsize))
+                return level[:].view(dtype=(np.bytes_, itemsize))
         # This serves two purposes:
         # (1) unpack big integers: the only time we save arrays like this
         # (2) unpack non-deepdish "scalars"
@@ -545,11 +797,19 @@ def _load_sliced_level(handler, level, sel):
     elif isinstance(level, tables.Array):
         return level[sel]
 
+    elif isinstance(level, tables.Group) and level._v_title.startswith(
+            'dataframe:'):
+        return _load_dataframe(level, sel)
+
+    elif isinstance(level, tables.Group) and level._v_title.startswith(
+            'sparse:'):
+        return _load_sparse(level, sel)
+
     else:
         raise ValueError('Cannot partially load this data type using `sel`')
 
 
-def save(data, path, compression='blosc'):
+def save(data, path, compression='blosc', layout='row', threads=None):
     """
     Save any Python structure to an HDF5 file. It is particularly suited for
     Numpy arrays. This function works similar to ``numpy.save``, except if you
@@ -566,7 +826,7 @@ def save(data, path, compression='blosc'):
     * Basic data types (including strings and None)
     * Numpy arrays
     * Scipy sparse matrices
-    * Pandas ``DataFrame``, ``Series``, and ``Panel``
+    * Pandas ``DataFrame`` (stored column by column) and ``Series``
     * SimpleNamespaces (for Python >= 3.3, but see note below)
 
     A recommendation is to always convert your data to using only these types
@@ -599,8 +859,17 @@ def save(data, path, compression='blosc'):
         tuple (e.g. ``('blosc', 5)``), with the latter value specifying the
         level of compression, choosing from 0 (no compression) to 9 (maximum
         compression).  Set to `None` to turn off compression. The default is
-        `zlib`, since it is highly portable; for much greater speed, try for
-        instance `blosc`.
+        `blosc` for speed; for portability to other HDF5 readers use
+        `zlib`. Specific blosc codecs can be selected as eg `blosc:lz4`
+        or `blosc:zstd`.
+    layout : string
+        Expected access pattern of arrays, used to choose the chunk shape of
+        compressed arrays. `row` (default) is suited for loading rows, eg
+        ``sel=aslice[:100, :]``, and `column` for loading columns, eg
+        ``sel=aslice[:, :10]``. Use `Compression` to set it per array.
+    threads : int
+        Number of threads blosc uses for compression. Default to the number
+        of cores of current module instance, see `_blosc_threads`.
 
     See also
     --------
@@ -608,7 +877,7 @@ def save(data, path, compression='blosc'):
     """
     filters = _get_compression_filters(compression)
 
-    with tables.open_file(path, mode='w') as h5file:
+    with _blosc_threads(threads), tables.open_file(path, mode='w') as h5file:
         # If the data is a dictionary, put it flatly in the root
         group = h5file.root
         idtable = dict()  # dict to keep track of objects already saved
@@ -622,7 +891,8 @@ def save(data, path, compression='blosc'):
                             value,
                             name=key,
                             filters=filters,
-                            idtable=idtable)
+                            idtable=idtable,
+                            layout=layout)
 
         elif isinstance(data, SimpleNamespace) and _dict_native_ok(
                 data.__dict__):
@@ -634,7 +904,8 @@ def save(data, path, compression='blosc'):
                             value,
                             name=key,
                             filters=filters,
-                            idtable=idtable)
+                            idtable=idtable,
+                            layout=layout)
 
         else:
             _save_level(h5file,
@@ -642,12 +913,13 @@ def save(data, path, compression='blosc'):
                         data,
                         name='data',
                         filters=filters,
-                        idtable=idtable)
+                        idtable=idtable,
+                        layout=layout)
             # Mark this to automatically unpack when loaded
             group._v_attrs[IO_UNPACK] = True
 
 
-def load(path, group=None, sel=None, unpack=False):
+def load(path, group=None, sel=None, unpack=False, threads=None):
     """
     Loads an HDF5 saved with `save`.
 
@@ -665,11 +937,17 @@ def load(path, group=None, sel=None, unpack=False):
     sel : slice or tuple of slices
         If you specify `group` and the target is a numpy array, then you can
         use this to slice it. This is useful for opening subsets of large HDF5
-        files. To compose the selection, you can use `hdf5io.aslice`.
+        files. To compose the selection, you can use `hdf5io.aslice`. For a
+        data frame select rows and optionally columns by name, eg
+        ``aslice[:100, ['a', 'b']]``; for a CSR (CSC) matrix, slicing of rows
+        (columns) only reads the selected part.
     unpack : bool
         If True, a single-entry dictionaries will be unpacked and the value
         will be returned directly. That is, if you save ``dict(a=100)``, only
         ``100`` will be loaded.
+    threads : int
+        Number of threads blosc uses for decompression. Default to the number
+        of cores of current module instance, see `_blosc_threads`.
 
     Returns
     -------
@@ -681,7 +959,7 @@ def load(path, group=None, sel=None, unpack=False):
     save
 
     """
-    with tables.open_file(path, mode='r') as h5file:
+    with _blosc_threads(threads), tables.open_file(path, mode='r') as h5file:
         pathtable = dict()  # dict to keep track of objects already loaded
         if group is not None:
             if isinstance(group, str):
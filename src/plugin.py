@@ -9,7 +9,7 @@ Process R and Python plugin codes to DSC
 import yaml, re, glob
 from collections import OrderedDict
 from copy import deepcopy
-from .syntax import DSC_FILE_OP
+from .syntax import DSC_FILE_OP, DSC_DATA_EXT
 from .utils import flatten_list
 
 
@@ -313,7 +313,7 @@ class RPlug(BasePlug):
             if any([x[1] is None for x in depends[k]])
         ]
         assign_idx = [(i, k) for i, k in enumerate(depends.keys()) if any([
-            x[1].split('.')[-1] in ['rds', 'pkl', 'yml'] for x in depends[k]
+            x[1].split('.')[-1] in DSC_DATA_EXT for x in depends[k]
             if x[1] is not None
         ])]
         loader = 'dscrutils:::read_dsc'
@@ -322,9 +322,7 @@ class RPlug(BasePlug):
         assign_in = ['\n']
         for i, k in assign_idx:
             for j in depends[k]:
-                if j[1] is not None and j[1].split('.')[-1] in [
-                        'rds', 'pkl', 'yml'
-                ]:
+                if j[1] is not None and j[1].split('.')[-1] in DSC_DATA_EXT:
                     assign_in.append(
                         f'{self.identifier}${j[0]} <- {loader}("${{_input[{i}]:n}}.{j[1]}")'
                     )
@@ -504,18 +502,16 @@ class PyPlug(BasePlug):
             if any([x[1] is None for x in depends[k]])
         ]
         assign_idx = [(i, k) for i, k in enumerate(depends.keys()) if any([
-            x[1].split('.')[-1] in ['rds', 'pkl', 'yml'] for x in depends[k]
+            x[1].split('.')[-1] in DSC_DATA_EXT for x in depends[k]
             if x[1] is not None
         ])]
         # load files
-        res += '\nfrom dsc.dsc_io import load_dsc as __load_dsc__, source_dirs as __source_dirs__'
+        res += '\nfrom dsc.dsc_io import load_dsc as __load_dsc__, save_dsc as __save_dsc__, source_dirs as __source_dirs__'
         load_in = f'\n{self.identifier} = __load_dsc__([${{paths([_input[i] for i in {load_idx}]):r,}}])'
         assign_in = ['\n']
         for i, k in assign_idx:
             for j in depends[k]:
-                if j[1] is not None and j[1].split('.')[-1] in [
-                        'rds', 'pkl', 'yml'
-                ]:
+                if j[1] is not None and j[1].split('.')[-1] in DSC_DATA_EXT:
                     assign_in.append(
                         f'{self.identifier}[{repr(j[0])}] = __load_dsc__("${{_input[{i}]:n}}.{j[1]}")'
                     )
@@ -567,14 +563,20 @@ class PyPlug(BasePlug):
             f"\nwith open(${{_output:nr}} + '.yml', 'w') as f:\n\tf.write({repr(dict2yaml(res))})"
 
     def get_return(self, output_vars):
+        if self.output_ext == 'h5':
+            dump = 'from dsc.hdf5io import save as __save_h5__; __save_h5__({}, ${{_output:r}})'
+        else:
+            dump = 'pickle.dump({}, open(${{_output:r}}, "wb"))'
         if output_vars is None:
-            return '\timport pickle; pickle.dump(0, open(${_output:r}, "wb"))'
+            return '\timport pickle; ' + dump.format(0)
         if len(output_vars) == 0:
             return ''
-        res = '\npickle.dump({{{}}}, open(${{_output:r}}, "wb"))'.\
-          format(', '.join(['"{0}": {1}'.format(x, output_vars[x]) for x in output_vars] + \
+        # kept in memory for downstream modules of a fused job, see dsc_fusion
+        dump = '__save_dsc__({}, ${{_output:r}})'
+        res = '\n' + dump.\
+          format('{{{}}}'.format(', '.join(['"{0}": {1}'.format(x, output_vars[x]) for x in output_vars] + \
                            [f"'DSC_DEBUG': dict([('time', timeit.default_timer() - TIC_{self.identifier[4:]}), " \
-                            "('script', inspect.getsource(inspect.getmodule(inspect.currentframe()))), ('replicate', DSC_REPLICATE), ('seed', DSC_SEED)])"]))
+                            "('script', inspect.getsource(inspect.getmodule(inspect.currentframe()))), ('replicate', DSC_REPLICATE), ('seed', DSC_SEED)])"])))
         # res += '\nfrom os import _exit; _exit(0)'
         return res.strip()
 
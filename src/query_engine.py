@@ -3,10 +3,17 @@ __author__ = "Gao Wang"
 __copyright__ = "Copyright 2016, Stephens lab"
 __email__ = "gaow@uchicago.edu"
 __license__ = "MIT"
-import os, re, pickle
+import os, re, pickle, glob, copy, ast
+from multiprocessing import Pool
 import pandas as pd, numpy as np
+try:
+    from xxhash import xxh32 as xxh
+except ImportError:
+    from hashlib import md5 as xxh
 from .utils import uniq_list, case_insensitive_uniq_list, flatten_list, filter_sublist, FormatError, DBError, logger
-from .yhat_sqldf import sqldf
+from .yhat_sqldf import sqldf, extract_index_columns
+from .dsc_database import intern_tables, query_cache_dir
+from .addict import Dict as dotdict
 from .line import parse_filter
 
 # keywords for SQLite
@@ -45,13 +52,151 @@ def find_partial_index(xx, ordering):
     raise ValueError(f'{xx} not in list {ordering}')
 
 
+def get_condition_mask(table, condition):
+    '''
+    Evaluate a condition ``(not, [table, field], op, value)`` on a table as a pandas boolean mask.
+    Returns None when the condition cannot be safely evaluated outside of SQLite,
+    eg value is not a literal or its type does not match the column type.
+    '''
+    is_not, (_, field), op, value = condition
+    column = [x for x in table.columns if x.lower() == field.lower()]
+    if len(column) != 1:
+        return None
+    try:
+        value = ast.literal_eval(value)
+    except Exception:
+        return None
+    values = list(value) if op == 'in' and isinstance(value, tuple) else [value]
+    column = table[column[0]]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        column = column.astype(object)
+    if all(
+            isinstance(x, (int, float)) and not isinstance(x, bool)
+            for x in values):
+        if not pd.api.types.is_numeric_dtype(
+                column) or pd.api.types.is_bool_dtype(column):
+            return None
+    elif all(isinstance(x, str) for x in values):
+        if not pd.api.types.is_string_dtype(column):
+            return None
+    else:
+        return None
+    ops = {
+        '==': lambda x, y: x == y,
+        '!=': lambda x, y: x != y,
+        '>': lambda x, y: x > y,
+        '<': lambda x, y: x < y,
+        '>=': lambda x, y: x >= y,
+        '<=': lambda x, y: x <= y
+    }
+    try:
+        if op == 'in':
+            mask = column.isin(values)
+        elif op in ops and len(values) == 1:
+            mask = ops[op](column, values[0])
+        else:
+            return None
+    except Exception:
+        return None
+    # NULL fails the condition in SQL whether or not it is negated
+    # here they are kept either way, which is safe
+    return ~mask if is_not else mask
+
+
+def push_down_condition(data, condition, pipeline):
+    '''
+    Apply conditions involving a single table of the pipeline as pandas filters
+    so that rows which cannot pass the WHERE clause are not loaded into SQLite.
+    A row is removed only if it fails, in every OR branch of the condition,
+    some condition on its table alone.
+    Returns tables after filtering and the number of rows pruned for each table
+    '''
+    data = dict(data)
+    pruned = dict()
+    if len(condition) == 0:
+        return data, pruned
+    for table in pipeline:
+        if table not in data:
+            continue
+        mask = None
+        for each_and in condition:
+            and_mask = pd.Series(True, index=data[table].index)
+            for value in each_and:
+                value = [value] if isinstance(value, tuple) else value
+                if not all(x[1][0] == table for x in value):
+                    continue
+                or_mask = [get_condition_mask(data[table], x) for x in value]
+                if any(x is None for x in or_mask):
+                    continue
+                any_mask = or_mask[0]
+                for x in or_mask[1:]:
+                    any_mask = any_mask | x
+                and_mask &= any_mask
+            mask = and_mask if mask is None else (mask | and_mask)
+        if mask is not None and not mask.all():
+            pruned[table] = int((~mask).sum())
+            data[table] = data[table][mask]
+    return data, pruned
+
+
+def run_query(data, query, pipeline, debug=False, condition=None):
+    '''
+    Index columns involved in JOIN conditions before running the query.
+    Returns adjusted result table, the query plan (in debug mode)
+    and number of rows pruned by pushing down condition
+    '''
+    data, pruned = push_down_condition(data, condition or [], pipeline)
+    res = sqldf(query,
+                data,
+                pipeline,
+                indexes=extract_index_columns(query),
+                explain=debug)
+    plan = None
+    if debug:
+        res, plan = res
+        plan = '\n'.join(plan['detail']) if plan is not None else ''
+    return Query_Processor.adjust_table(res, pipeline), plan, pruned
+
+
+# tables of current query worker process
+WORKER_DATA = None
+
+
+def init_query_worker(data):
+    global WORKER_DATA
+    WORKER_DATA = data
+
+
+def run_query_worker(query, pipeline, debug=False, condition=None):
+    return run_query(WORKER_DATA, query, pipeline, debug, condition)
+
+
 class Query_Processor:
-    def __init__(self, db, targets, condition=None, groups=None):
+    def __init__(self,
+                 db,
+                 targets,
+                 condition=None,
+                 groups=None,
+                 debug=False,
+                 jobs=1):
         self.db = db
+        self.debug = debug
+        self.jobs = jobs
+        self.query_plans = dict()
+        self.rows_loaded = self.rows_pruned = 0
         self.targets = uniq_list(' '.join(targets).split())
         self.raw_condition = condition
-        with open(os.path.expanduser(db), 'rb') as f:
-            self.data = pickle.load(f)
+        if isinstance(db, dict):
+            # database already loaded, eg by query server
+            # tables will be changed by query so make a copy
+            self.data = copy.copy(db)
+            for k in self.data:
+                self.data[k] = self.data[k].copy(deep=False) if isinstance(
+                    self.data[k], pd.DataFrame) else copy.deepcopy(
+                        self.data[k])
+        else:
+            with open(os.path.expanduser(db), 'rb') as f:
+                self.data = intern_tables(pickle.load(f))
         # table: msg map
         self.field_warnings = {}
         if '.groups' in self.data:
@@ -640,13 +785,38 @@ class Query_Processor:
     def get_data(self):
         return self.data
 
+    def get_query_plans(self):
+        return self.query_plans
+
     def run_queries(self):
         if len(self.queries) == 0:
             raise DBError("Incompatible targets ``{}``{}".\
                           format(', '.join(self.targets),
                                  f' under condition ``{" AND ".join(["(%s)" % x for x in self.raw_condition])}``' if self.raw_condition is not None else ''))
-        res = [('+'.join(reversed(pipeline)), self.adjust_table(sqldf(query.strip(), self.data, pipeline), pipeline)) \
-                     for pipeline, query in zip(self.pipelines, self.queries)]
+        tasks = [(query.strip(), pipeline, self.debug, self.condition)
+                 for pipeline, query in zip(self.pipelines, self.queries)]
+        if self.jobs > 1 and len(tasks) > 1:
+            # each worker process loads tables into its own SQLite session
+            tables = set(flatten_list(self.pipelines))
+            with Pool(min(self.jobs, len(tasks)),
+                      initializer=init_query_worker,
+                      initargs=(dict([(k, v) for k, v in self.data.items()
+                                      if k in tables]), )) as pool:
+                res = pool.starmap(run_query_worker, tasks)
+        else:
+            res = [run_query(self.data, *task) for task in tasks]
+        for task, (table, plan, pruned) in zip(tasks, res):
+            if plan is not None:
+                self.query_plans[task[0]] = plan
+            self.rows_loaded += sum(
+                [len(self.data[x]) for x in task[1] if x in self.data])
+            for k, v in pruned.items():
+                logger.debug(
+                    f'``{v}`` of ``{len(self.data[k])}`` rows in table ``{k}`` pruned by query condition before loading.'
+                )
+                self.rows_pruned += v
+        res = [('+'.join(reversed(task[1])), table)
+               for task, (table, plan, pruned) in zip(tasks, res)]
         res = [x for x in res if x[1] is not None]
         if len(res) == 0:
             raise DBError("No results found for targets ``{}``{}".\
@@ -659,6 +829,65 @@ class Query_Processor:
             logger.warning(self.field_warnings[k])
 
 
+class Query_Cache:
+    '''
+    Cache of query results saved next to the database,
+    keyed by database fingerprint (size and modification time) and query arguments.
+    Results of a database no longer matching the fingerprint are removed on save.
+    '''
+    def __init__(self, db, targets, condition=None, groups=None):
+        db = os.path.expanduser(db)
+        self.path = query_cache_dir(os.path.splitext(db)[0])
+        stat = os.stat(db)
+        self.fingerprint = f'{stat.st_size}_{stat.st_mtime_ns}'
+        args = [
+            uniq_list(' '.join(targets).split()),
+            [' '.join(x.split()) for x in condition or []],
+            [' '.join(x.split()) for x in groups or []]
+        ]
+        self.key = xxh(repr(args).encode()).hexdigest()
+
+    def get_file(self):
+        return os.path.join(self.path, f'{self.fingerprint}_{self.key}.pkl')
+
+    def load(self):
+        '''
+        returns cached result with ``output_table``, ``output_tables``, ``queries`` and ``query_plans``
+        or None if not available
+        '''
+        if not os.path.isfile(self.get_file()):
+            return None
+        try:
+            with open(self.get_file(), 'rb') as f:
+                return dotdict(pickle.load(f))
+        except Exception as e:
+            logger.debug(f'Failed to load cached query result: {e}')
+            return None
+
+    def dump(self, qp):
+        '''
+        save result, or warn if cache folder is not writable (eg read-only
+        database folder) as query result is still good to use
+        '''
+        res = dict(output_table=qp.output_table,
+                   output_tables=qp.output_tables,
+                   queries=qp.queries,
+                   query_plans=qp.query_plans)
+        tmp = self.get_file() + '.tmp'
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            for fn in glob.glob(os.path.join(self.path, '*.pkl')):
+                if not os.path.basename(fn).startswith(self.fingerprint + '_'):
+                    os.remove(fn)
+            with open(tmp, 'wb') as f:
+                pickle.dump(res, f)
+            os.replace(tmp, self.get_file())
+        except OSError as e:
+            logger.warning(f'Failed to save query result to cache ``{self.path}``: {e}')
+            if os.path.isfile(tmp):
+                os.remove(tmp)
+
+
 if __name__ == '__main__':
     import sys
     q = Query_Processor(sys.argv[1], [sys.argv[2]], [sys.argv[3]])
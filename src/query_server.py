@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+__author__ = "Gao Wang"
+__copyright__ = "Copyright 2016, Stephens lab"
+__email__ = "gaow@uchicago.edu"
+__license__ = "MIT"
+'''
+Query server keeping a DSC result database in memory, so that repeated
+queries (eg from ``dscrutils::dscquery``) do not reload the database each time.
+
+Start a server:
+dsc-query dsc_result --serve 8765
+
+Send a query:
+GET http://localhost:8765/query?target=simulate.n&target=score.error&group=...&outdir=dsc_result
+returns query result table in CSV format. Requests for an ``outdir`` other
+than the one served are rejected.
+'''
+
+import os, pickle
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, urlencode
+from urllib.request import urlopen
+from urllib.error import HTTPError
+import pandas as pd
+from .utils import logger, DBError
+from .dsc_database import intern_tables
+from .query_engine import Query_Processor, Query_Cache
+
+DEFAULT_PORT = 8765
+
+
+class Query_Server:
+    def __init__(self, db):
+        self.db = os.path.expanduser(db)
+        self.mtime = None
+        self.data = None
+        self.load()
+
+    def load(self):
+        '''(re)load database if it has been rebuilt since last loaded'''
+        mtime = os.stat(self.db).st_mtime_ns
+        if mtime == self.mtime:
+            return
+        with open(self.db, 'rb') as f:
+            self.data = intern_tables(pickle.load(f))
+        self.mtime = mtime
+        logger.info(f"Loaded database ``{self.db}``")
+
+    def query(self, targets, condition=None, groups=None):
+        cache = Query_Cache(self.db, targets, condition, groups)
+        res = cache.load()
+        if res is None:
+            self.load()
+            res = Query_Processor(self.data, targets, condition, groups)
+            cache.dump(res)
+        return res
+
+    def serve(self, port=DEFAULT_PORT, host='127.0.0.1'):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != '/query':
+                    self.respond(404, f'Unknown request ``{url.path}``')
+                    return
+                args = parse_qs(url.query)
+                if 'target' not in args:
+                    self.respond(400, 'Query targets are required')
+                    return
+                outdir = os.path.dirname(server.db)
+                if 'outdir' in args and os.path.realpath(os.path.expanduser(
+                        args['outdir'][0])) != os.path.realpath(outdir):
+                    self.respond(
+                        400,
+                        f'Query server is serving ``{outdir}``, not ``{args["outdir"][0]}``'
+                    )
+                    return
+                try:
+                    res = server.query(args['target'], args.get('condition'),
+                                       args.get('group'))
+                    self.respond(200,
+                                 res.output_table.to_csv(index=False),
+                                 'text/csv')
+                except Exception as e:
+                    self.respond(400, str(e))
+
+            def respond(self, code, content, content_type='text/plain'):
+                content = content.encode()
+                self.send_response(code)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        httpd = HTTPServer((host, port), Handler)
+        logger.info(
+            f"Serving queries for ``{self.db}`` at ``http://{host}:{port}/query`` (press Ctrl-C to stop) ..."
+        )
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            httpd.server_close()
+
+
+def request_query(targets,
+                  condition=None,
+                  groups=None,
+                  port=DEFAULT_PORT,
+                  host='127.0.0.1',
+                  outdir=None):
+    '''
+    Query a server started by ``dsc-query --serve``, which has to be serving
+    DSC output folder ``outdir`` if specified
+    returns query result as a pandas DataFrame
+    '''
+    params = [('target', x) for x in targets] + \
+        [('condition', x) for x in condition or []] + \
+        [('group', x) for x in groups or []] + \
+        ([('outdir', os.path.abspath(os.path.expanduser(outdir)))] if outdir else [])
+    try:
+        with urlopen(f'http://{host}:{port}/query?{urlencode(params)}') as f:
+            return pd.read_csv(f)
+    except HTTPError as e:
+        raise DBError(e.read().decode())
@@ -14,6 +14,7 @@ DSC_KW = ['DSC_OUTPUT', 'DSC_VARS', 'DSC_DEBUG',
           'DSC_REPLICATE']  # engineering keywords, reserved
 DSC_KW.extend(SOS_DIRECTIVES)
 DSC_MODP = ['@EXEC', '@FILTER', '@ALIAS', '@CONF']  # module properties
+DSC_DATA_EXT = ['rds', 'pkl', 'yml', 'h5']  # module output data formats
 
 DSC_DERIVED_BLOCK = LazyRegex(r'^(.*?)\((.*?)\)$', re.VERBOSE)
 DSC_FILE_OP = LazyRegex(r'^file\((.*?)\)$', re.VERBOSE)
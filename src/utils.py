@@ -5,7 +5,7 @@ __email__ = "gaow@uchicago.edu"
 __license__ = "MIT"
 
 import sys, os, re, yaml, itertools, collections, sympy
-from itertools import cycle, chain, islice
+from itertools import chain
 from fnmatch import fnmatch
 from difflib import SequenceMatcher
 from collections.abc import Mapping, MutableMapping
@@ -444,7 +444,7 @@ def sos_hash_output(values, jobs=1):
     Parallel hash
     FIXME: parallel not implemented for now
     '''
-    return [xxh(value).hexdigest() for value in values]
+    return [xxh(value.encode()).hexdigest() for value in values]
 
 
 def chunks(l, n):
@@ -488,47 +488,261 @@ def sos_pair_input(value):
     return flatten_list(value)
 
 
-def sos_group_input_safe(value):
+def group_input_index(*lengths):
     '''
-    Input is a list of lists or tuples. Lists are ordered such that
-    the length of the next list is always multiples of the previous
+    Input of module instances from lists of output of given ``lengths``:
+    lists are sorted by length and cycled to the longest one
     ABCD              ABCDABCD
-    ABCDEFGH -------> ABCDEFGH ------> AABBCCDDAEBFCGDH
+    ABCDEFGH -------> ABCDEFGH ------> (A, A) (B, B) (C, C) (D, D) (A, E) ...
+    Returns order of the lists, and index in them for each instance as
+    rows of an integer array.
     '''
-    for idx in reversed(range(1, len(value))):
-        if not isinstance(value[idx], (list, tuple)):
-            raise ValueError('Input elements must be list or tuples')
-        multiplier = len(value[idx]) / len(value[idx - 1])
-        if multiplier > int(multiplier):
-            # is not integer
-            raise ValueError(
-                'Length of the next list must be multiple of the previous.')
-        else:
-            multiplier = int(multiplier)
-        if multiplier > 1:
-            value[idx - 1] = flatten_list(
-                [value[idx - 1] for i in range(multiplier)])
-    return flatten_list(list(zip(*value)))
+    import numpy as np
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    n = max(lengths) if len(lengths) and min(lengths) > 0 else 0
+    rows = np.arange(n)
+    return order, np.stack([rows % lengths[i] for i in order], axis=1) \
+        if len(lengths) else np.zeros((0, 0), dtype=int)
+
+
+def group_input(*lsts):
+    '''Input of module instances, as tuples, see ``group_input_index``'''
+    import numpy as np
+    order, index = group_input_index(*[len(x) for x in lsts])
+    # values are taken once per column from their ids, as they are
+    return list(
+        zip(*[
+            np.fromiter(lsts[i], dtype=object, count=len(lsts[i]))[index[:, k]].tolist()
+            for k, i in enumerate(order)
+        ]))
+
+
+def sos_group_input(*lsts):
+    '''Input of module instances, flattened, see ``group_input_index``'''
+    return list(chain.from_iterable(group_input(*lsts)))
 
 
-def sos_group_input_adam(*lsts):
+def get_partial_filter(ft, unbound):
     '''
-    https://stackoverflow.com/questions/48346169/fast-zip-list-of-lists-while-completing-shorter-lists-by-cycling
+    Three-valued check of @FILTER ``ft`` when variables ``unbound`` (eg
+    ``_n``) of a parameter combination are not yet known: returns a function
+    giving True / False if ``ft`` is decided without them, or None if not.
     '''
-    n = len(lsts) - 1
-    cyclic = [
-        lst if i == n else itertools.cycle(lst) for i, lst in enumerate(lsts)
-    ]
-    return list(itertools.chain.from_iterable(zip(*cyclic)))
+    import ast
+
+    def build(node):
+        if isinstance(node, ast.BoolOp):
+            parts = [build(x) for x in node.values]
+            known = [x for x in parts if x is not None]
+            if not known:
+                return None
+            stop = isinstance(node.op, ast.Or)
+            complete = len(known) == len(parts)
+
+            def check(ns):
+                res = [x(ns) for x in known]
+                if stop in res:
+                    return stop
+                return (not stop) if complete and None not in res else None
+
+            return check
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            part = build(node.operand)
+            if part is None:
+                return None
+            return lambda ns: None if part(ns) is None else not part(ns)
+        names = set([x.id for x in ast.walk(node) if isinstance(x, ast.Name)])
+        if names & unbound:
+            return None
+        code = compile(ast.Expression(node), '<filter>', 'eval')
+
+        def check(ns):
+            try:
+                return bool(eval(code, ns))
+            except Exception:
+                return None
 
+        return check
 
-def sos_group_input(*lsts):
+    unbound = set(unbound)
+    return build(ast.parse(ft, mode='eval').body)
+
+
+def get_vector_filter(ft, names):
     '''
-    https://stackoverflow.com/questions/48346169/fast-zip-list-of-lists-while-completing-shorter-lists-by-cycling
+    Compile @FILTER ``ft`` into NumPy operations on columns of variables
+    ``names`` (eg ``_n``) of parameter combinations, to be evaluated with
+    ``__np__`` as ``numpy`` and ``__isin__`` as ``_isin``. Returns None if
+    ``ft`` uses operations not supported, to be evaluated row by row.
     '''
-    lsts = sorted(lsts, key=len)
-    return list(
-        chain(*islice(zip(*(cycle(l) for l in lsts)), 0, len(lsts[-1]))))
+    import ast
+    names = set(names)
+    numeric = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod)
+    compare = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+    def uses(node):
+        return any([isinstance(x, ast.Name) and x.id in names for x in ast.walk(node)])
+
+    def call(func, *args):
+        if func == '__isin__':
+            func = ast.Name(id=func, ctx=ast.Load())
+        else:
+            func = ast.Attribute(value=ast.Name(id='__np__', ctx=ast.Load()), attr=func, ctx=ast.Load())
+        return ast.Call(func=func, args=list(args), keywords=[])
+
+    def build_value(node):
+        if isinstance(node, ast.Constant) or (isinstance(node, ast.UnaryOp) and
+                                              isinstance(node.op, (ast.USub, ast.UAdd)) and
+                                              isinstance(node.operand, ast.Constant)):
+            return node
+        if isinstance(node, ast.Name) and node.id in names:
+            return node
+        if isinstance(node, ast.BinOp) and isinstance(node.op, numeric):
+            return ast.BinOp(left=build_value(node.left), op=node.op, right=build_value(node.right))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            return ast.UnaryOp(op=node.op, operand=build_value(node.operand))
+        raise ValueError
+
+    def build(node):
+        if not uses(node):
+            return ast.Call(func=ast.Name(id='bool', ctx=ast.Load()), args=[node], keywords=[])
+        if isinstance(node, ast.BoolOp):
+            res = build(node.values[0])
+            for x in node.values[1:]:
+                res = call('logical_and' if isinstance(node.op, ast.And) else 'logical_or', res, build(x))
+            return res
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return call('logical_not', build(node.operand))
+        if isinstance(node, ast.Compare):
+            res = None
+            left = node.left
+            for op, right in zip(node.ops, node.comparators):
+                if isinstance(op, (ast.In, ast.NotIn)) and not uses(right):
+                    x = call('__isin__', build_value(left), right)
+                    if isinstance(op, ast.NotIn):
+                        x = call('logical_not', x)
+                elif isinstance(op, compare):
+                    x = ast.Compare(left=build_value(left), ops=[op], comparators=[build_value(right)])
+                else:
+                    raise ValueError
+                res = x if res is None else call('logical_and', res, x)
+                left = right
+            return res
+        raise ValueError
+
+    try:
+        tree = ast.Expression(build(ast.parse(ft, mode='eval').body))
+        return compile(ast.fix_missing_locations(tree), '<filter>', 'eval')
+    except (ValueError, SyntaxError):
+        return None
+
+
+def _isin(x, values):
+    '''``x in values`` for each element of column ``x``'''
+    import numpy as np
+    if isinstance(values, (str, bytes)):
+        raise TypeError
+    res = np.zeros(np.shape(x), dtype=bool)
+    for value in values:
+        if not isinstance(value, (int, float, str, type(None))):
+            raise TypeError
+        res |= (x == value)
+    return res
+
+
+def get_column(values):
+    '''NumPy array of parameter values, None if they are not all scalars'''
+    import numpy as np
+    if not all([isinstance(x, (int, float, str, type(None))) for x in values]):
+        return None
+    if all([isinstance(x, str) for x in values]) or \
+       all([isinstance(x, (int, float)) for x in values]):
+        try:
+            return np.array(values)
+        except OverflowError:
+            pass
+    return np.array(values, dtype=object)
+
+
+def expand_grid(params, ft=None, block_size=2**18):
+    '''
+    Lazily yield combinations of parameter values (last parameter in the
+    outermost loop, values in reversed order of parameters) that satisfy
+    @FILTER ``ft``. Partial combinations are dropped as soon as ``ft`` is
+    false regardless of parameters in inner loops, so that only surviving
+    combinations of a large grid are ever visited. Inner loops of up to
+    ``block_size`` combinations are filtered at once by NumPy where ``ft``
+    allows, see ``get_vector_filter``, otherwise row by row.
+    '''
+    names = list(reversed(params))
+    values = [params[k] for k in names]
+    if not ft:
+        yield from itertools.product(*values)
+        return
+    code = compile(ft, '<filter>', 'eval')
+    ns = dict(params)
+    if len(names) == 0:
+        if eval(code, ns):
+            yield ()
+        return
+    # checks after outer loops, when the filter uses their variables
+    checks = [
+        get_partial_filter(ft, [f'_{x}' for x in names[i + 1:]])
+        if re.search(rf'\b_{re.escape(names[i])}\b', ft) else None
+        for i in range(len(names) - 1)
+    ] + [None]
+    # first of inner loops to be filtered by NumPy
+    start = len(names)
+    vector_code = get_vector_filter(ft, [f'_{x}' for x in names])
+    if vector_code is not None:
+        columns = [get_column(x) for x in values]
+        size = 1
+        while start > 0 and columns[start - 1] is not None and \
+              size * len(values[start - 1]) <= block_size:
+            start -= 1
+            size *= len(values[start])
+    block = dict()
+
+    def expand_block(prefix):
+        import numpy as np
+        if not block:
+            block['index'] = np.indices([len(x) for x in values[start:]]).reshape(len(names) - start, -1)
+            block['ns'] = dict([(f'_{names[i]}', columns[i][block['index'][i - start]])
+                                for i in range(start, len(names))],
+                               __np__=np, __isin__=_isin)
+            block['values'] = [np.array(values[i], dtype=object) for i in range(start, len(names))]
+        index = block['index']
+        try:
+            with np.errstate(all='raise'):
+                mask = np.asarray(eval(vector_code, dict(ns, **block['ns'])))
+            if mask.dtype != bool or mask.shape not in [(), (index.shape[1], )]:
+                raise ValueError
+        except Exception:
+            # row by row from now on
+            block['failed'] = True
+            return None
+        rows = np.flatnonzero(np.broadcast_to(mask, (index.shape[1], )))
+        # parameter values as they are, not as NumPy types
+        return [prefix + x for x in zip(*[block['values'][i - start][index[i - start, rows]].tolist()
+                                          for i in range(start, len(names))])]
+
+    def expand(level, prefix):
+        if level == start and 'failed' not in block:
+            res = expand_block(prefix)
+            if res is not None:
+                yield from res
+                return
+        key = f'_{names[level]}'
+        check = checks[level]
+        for value in values[level]:
+            ns[key] = value
+            if level == len(names) - 1:
+                if eval(code, ns):
+                    yield prefix + (value, )
+            elif check is None or check(ns) is not False:
+                yield from expand(level + 1, prefix + (value, ))
+
+    yield from expand(0, ())
 
 
 def round_print(text, sep, pc=None):
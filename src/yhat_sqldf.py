@@ -1,14 +1,14 @@
 import inspect
 from contextlib import contextmanager
 from pandas.io.sql import to_sql, read_sql
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 import re
 from warnings import catch_warnings, filterwarnings
 from sqlalchemy.exc import DatabaseError, ResourceClosedError
 from sqlalchemy.pool import NullPool
 from sqlalchemy.event import listen
 
-__all__ = ['PandaSQL', 'PandaSQLException', 'sqldf']
+__all__ = ['PandaSQL', 'PandaSQLException', 'sqldf', 'extract_index_columns']
 
 
 class PandaSQLException(Exception):
@@ -38,7 +38,12 @@ class PandaSQL:
             self._conn = self.engine.connect()
             self._init_connection(self._conn)
 
-    def __call__(self, query, env=None, names=None):
+    def __call__(self,
+                 query,
+                 env=None,
+                 names=None,
+                 indexes=None,
+                 explain=False):
         """
         Execute the SQL query.
         Automatically creates tables mentioned in the query from dataframes before executing.
@@ -46,7 +51,10 @@ class PandaSQL:
         :param query: SQL query string, which can reference pandas dataframes as SQL tables.
         :param env: Variables environment - a dict mapping table names to pandas dataframes.
         If not specified use local and global variables of the caller.
-        :return: Pandas dataframe with the result of the SQL query.
+        :param indexes: a dict mapping table names to columns to index before executing the query.
+        :param explain: also return the output of ``EXPLAIN QUERY PLAN`` for the query.
+        :return: Pandas dataframe with the result of the SQL query,
+        or a tuple of it and the query plan dataframe if explain is set.
         """
         if env is None:
             env = get_outer_frame_variables()
@@ -62,15 +70,21 @@ class PandaSQL:
                     continue
                 self.loaded_tables.add(table_name)
                 write_table(env[table_name], table_name, conn)
+            for table_name in (indexes or dict()):
+                create_index(table_name, indexes[table_name], conn)
 
             try:
                 result = read_sql(query, conn)
+                if explain:
+                    plan = read_sql(f'EXPLAIN QUERY PLAN {query}', conn)
             except DatabaseError as ex:
                 raise PandaSQLException(ex)
             except ResourceClosedError:
                 # query returns nothing
-                result = None
+                result = plan = None
 
+        if explain:
+            return result, plan
         return result
 
     @property
@@ -122,6 +136,24 @@ def extract_table_names(query):
     return set(tables)
 
 
+def extract_index_columns(query):
+    """
+    Extract columns referred to as "table".column in JOIN conditions of an SQL query.
+    Columns in WHERE clause are not indexed: SQLite may then scan a table by such
+    an index, changing the order of rows returned.
+    """
+    conditions = re.findall(
+        r'\bON\b(.*?)(?=\b(?:INNER|LEFT|CROSS|NATURAL|JOIN|WHERE|GROUP|ORDER|LIMIT)\b|$)',
+        query, re.IGNORECASE | re.DOTALL)
+    columns = dict()
+    for table, column in re.findall(r'"(\w+)"\.(\w+)', ' '.join(conditions)):
+        if table not in columns:
+            columns[table] = []
+        if column not in columns[table]:
+            columns[table].append(column)
+    return columns
+
+
 def write_table(df, tablename, conn):
     """ Write a dataframe to the database. """
     with catch_warnings():
@@ -137,7 +169,20 @@ def write_table(df, tablename, conn):
                )  # load index into db if all levels are named
 
 
-def sqldf(query, env=None, names=None, db_uri='sqlite:///:memory:'):
+def create_index(tablename, columns, conn):
+    """ Create an index for each of the columns of a table. """
+    for column in columns:
+        conn.execute(
+            text(f'CREATE INDEX IF NOT EXISTS "{tablename}_{column}_idx" '
+                 f'ON "{tablename}" ("{column}")'))
+
+
+def sqldf(query,
+          env=None,
+          names=None,
+          db_uri='sqlite:///:memory:',
+          indexes=None,
+          explain=False):
     """
     Query pandas data frames using sql syntax
     This function is meant for backward compatibility only. New users are encouraged to use the PandaSQL class.
@@ -151,6 +196,10 @@ def sqldf(query, env=None, names=None, db_uri='sqlite:///:memory:'):
         allows sqldf to access the variables in your python environment
     db_uri: string
         SQLAlchemy-compatible database URI
+    indexes: dict
+        table names mapped to columns to index before running the query
+    explain: bool
+        also return the query plan from ``EXPLAIN QUERY PLAN``
 
     Returns
     -------
@@ -169,4 +218,5 @@ def sqldf(query, env=None, names=None, db_uri='sqlite:///:memory:'):
     >>> sqldf("select * from df;", locals())
     >>> sqldf("select avg(x) from df;", locals())
     """
-    return PandaSQL(db_uri)(query, env, set([x for x in names if x]))
+    return PandaSQL(db_uri)(query, env, set([x for x in names if x]),
+                            indexes, explain)
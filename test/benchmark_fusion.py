@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) Gao Wang, Stephens Lab at The Univeristy of Chicago
+# Distributed under the terms of the MIT License.
+'''
+Time to run simulate -> method -> score pipelines of Python modules passing
+a numpy array, by the native executor with every module instance in its own
+process, and with chains of module instances fused (``dsc --fuse``). Usage:
+
+python benchmark_fusion.py [--replicates 20] [--size 1000000] [--workers 2]
+'''
+
+import argparse, os, time, pickle, shutil
+from collections import OrderedDict
+from types import SimpleNamespace
+from dsc.dsc_executor import DSC_Executor
+from dsc.syntax import DSC_CACHE
+
+OUTPUT = 'benchmark_fusion_out'
+HEADER = 'import numpy\nfrom dsc.dsc_io import load_dsc as __load_dsc__, save_dsc as __save_dsc__\n'
+SCRIPTS = {'simulate': 'x = numpy.random.normal(size=${_size})\n',
+           'method': 'x = __load_dsc__(${_input:r})["x"] * 2\n',
+           'score': 'x = float(__load_dsc__(${_input:r})["x"].mean())\n'}
+
+
+def get_pipeline(replicates, size):
+    io_db, cfg, actions = dict(), dict(), dict()
+    upstream = []
+    for pid, module in enumerate(SCRIPTS):
+        output = [f'{OUTPUT}/{module}/{module}_{i}.pkl' for i in range(replicates)]
+        io_db[module] = dict(input=upstream, output=output, depends=[])
+        cfg[(module, 1)] = OrderedDict([((f'{module}:{i}',), dict(size=size)) for i in range(replicates)] +
+                                       [('__input_output___', ([], [])), ('__ext__', 'pkl')])
+        actions[module] = dict(action='python3', sigil='${ }', container=None, params=['size'],
+                               group_by=1 if upstream else 0,
+                               options='dict(stderr=f"{_output:n}.stderr", stdout=f"{_output:n}.stdout")',
+                               script=HEADER + SCRIPTS[module] + '__save_dsc__(dict(x=x), ${_output:r})\n')
+        upstream = output
+    os.makedirs(DSC_CACHE, exist_ok=True)
+    pickle.dump({'1': io_db}, open(f'{DSC_CACHE}/benchmark_fusion.io.pkl', 'wb'))
+    pickle.dump(cfg, open(f'{DSC_CACHE}/benchmark_fusion.cfg.pkl', 'wb'))
+    return SimpleNamespace(db='benchmark_fusion', output=OUTPUT, actions=actions,
+                           included_steps=[(m, 1) for m in SCRIPTS], priority=dict(),
+                           signatures=dict([(m, m) for m in SCRIPTS]),
+                           step_ids=dict([(m, i) for i, m in enumerate(SCRIPTS)]))
+
+
+def main(args):
+    pipeline = get_pipeline(args.replicates, args.size)
+    print('instances\tseparate\tfused')
+    res = []
+    for fuse in [False, True]:
+        shutil.rmtree(OUTPUT, ignore_errors=True)
+        start = time.time()
+        DSC_Executor(pipeline, workers=args.workers, fuse=fuse).run()
+        res.append(time.time() - start)
+    print(f'{args.replicates * len(SCRIPTS)}\t{res[0]:.1f}\t{res[1]:.1f}')
+    shutil.rmtree(OUTPUT, ignore_errors=True)
+    for f in ['io', 'cfg']:
+        os.remove(f'{DSC_CACHE}/benchmark_fusion.{f}.pkl')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replicates', type=int, default=20)
+    parser.add_argument('--size', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, default=2)
+    main(parser.parse_args())
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) Gao Wang, Stephens Lab at The Univeristy of Chicago
+# Distributed under the terms of the MIT License.
+'''
+Time to group output of upstream modules into input of a module depending
+on them, by cycling and zipping lists then cutting into chunks as was done
+before, and by ``group_input`` from integer index arrays. Both must give
+the same groups. Usage:
+
+python benchmark_group_input.py [--instances 10000 1000000] [--depends 3]
+'''
+
+import argparse, time
+# imported as in prepare_io, not to be timed
+import numpy
+from itertools import cycle, chain, islice
+from dsc.utils import group_input, chunks
+
+
+def cyclic_group_input(*lsts):
+    lsts = sorted(lsts, key=len)
+    return list(chain(*islice(zip(*(cycle(l) for l in lsts)), 0, len(lsts[-1]))))
+
+
+def main(args):
+    print('instances\tcyclic\tindex')
+    for n in args.instances:
+        lsts = [[f'module_{i}:{j:032x}' for j in range(max(n // 10**i, 1))] for i in range(args.depends)]
+        start = time.time()
+        res = chunks(cyclic_group_input(*lsts), args.depends)
+        t1 = time.time() - start
+        start = time.time()
+        groups = group_input(*lsts)
+        t2 = time.time() - start
+        assert [tuple(x) for x in res] == groups
+        print(f'{n}\t{t1:.3f}\t{t2:.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--instances', type=int, nargs='+', default=[10000, 1000000])
+    parser.add_argument('--depends', type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) Gao Wang, Stephens Lab at The Univeristy of Chicago
+# Distributed under the terms of the MIT License.
+'''
+Benchmark write / read throughput of ``dsc.hdf5io`` across compression codecs
+for matrices typical of DSC simulations. Usage:
+
+python benchmark_hdf5io.py [--threads 1 4] [--repeat 3]
+'''
+
+import os, argparse, tempfile, timeit
+import numpy as np
+from dsc.hdf5io import save, load, aslice
+
+CODECS = [None, 'zlib', ('zlib', 1), 'blosc', ('blosc', 5), 'blosc:lz4',
+          'blosc:zstd']
+
+
+def get_matrices(seed=999):
+    rng = np.random.default_rng(seed)
+    return {
+        # eg simulated expression or regression design matrix
+        'normal': rng.standard_normal((20000, 200)),
+        # eg genotypes coded as 0, 1, 2
+        'genotype': rng.binomial(2, 0.3, (20000, 500)).astype(np.int8),
+        # eg mostly zero effect sizes
+        'sparse': rng.standard_normal((20000, 200)) * \
+            (rng.random((20000, 200)) < 0.05)
+    }
+
+
+def bench(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main(args):
+    fd, fn = tempfile.mkstemp(suffix='.h5')
+    os.close(fd)
+    print('matrix\tcodec\tlayout\tthreads\tMB\tratio\twrite_MB/s\tread_MB/s\trows_ms\tcols_ms')
+    for name, x in get_matrices().items():
+        mb = x.nbytes / 2**20
+        for codec in CODECS:
+            for layout in ['row', 'column']:
+                for threads in args.threads:
+                    write = bench(lambda: save({'x': x}, fn, compression=codec,
+                                               layout=layout, threads=threads),
+                                  args.repeat)
+                    size = os.path.getsize(fn) / 2**20
+                    read = bench(lambda: load(fn, threads=threads), args.repeat)
+                    rows = bench(lambda: load(fn, '/x', sel=aslice[:100, :],
+                                              threads=threads), args.repeat)
+                    cols = bench(lambda: load(fn, '/x', sel=aslice[:, :10],
+                                              threads=threads), args.repeat)
+                    print(f'{name}\t{codec}\t{layout}\t{threads}\t{mb:.1f}\t{mb / size:.2f}\t'
+                          f'{mb / write:.1f}\t{mb / read:.1f}\t{rows * 1000:.1f}\t{cols * 1000:.1f}')
+    os.remove(fn)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, nargs='+',
+                        default=[1, os.cpu_count() or 1])
+    parser.add_argument('--repeat', type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) Gao Wang, Stephens Lab at The Univeristy of Chicago
+# Distributed under the terms of the MIT License.
+'''
+Time to configure module instances of simulate -> fit -> score, by
+``prepare_io`` from configuration data and by Python source generated for
+each module as was done before (nested list comprehensions), which is
+compiled and executed. Both must give the same I/O database. Usage:
+
+python benchmark_prepare_io.py [--values 8] [--params 2]
+'''
+
+import argparse, os, time, pickle, tempfile
+from collections import OrderedDict
+from dsc.dsc_database import prepare_io
+from dsc.utils import n2a
+
+
+def get_conf(n_values, n_params):
+    pipeline = dict(pipeline_id=1, pipeline_name='a_simulate+a_fit+a_score', out_vars=['x'], ext='pkl')
+    res = []
+    for name, depends in [('simulate', []), ('fit', [('simulate', 1)]),
+                          ('score', [('simulate', 1), ('fit', 1)])]:
+        params = OrderedDict([(f'{name}_{i}', list(range(n_values))) for i in range(n_params)])
+        if name == 'score':
+            params = OrderedDict(list(params.items())[:1])
+        res.append(dict(pipeline, name=name, step=(name, 1), params=params,
+                        filter=f'_{name}_0 != 1' if name == 'simulate' else None,
+                        template=' '.join([name] + [f'{x}:{{}}' for x in reversed(params)]),
+                        depends=depends))
+    return res
+
+
+def get_source(conf, output):
+    '''prepare_io() as generated by DSC_Translator before'''
+    res = ['import pickle', 'from collections import OrderedDict',
+           'from dsc.utils import sos_hash_output, sos_group_input, chunks as sos_chunks',
+           'def prepare_io():', '\t__io_db__ = OrderedDict()']
+    for item in conf:
+        params = list(item['params'].keys())
+        var = lambda x: f'__{n2a(x[1]).lower()}_{x[0]}_output__'
+        out = var(item['step'])
+        filter_string = f" if {item['filter']}" if item['filter'] else ''
+        loop = [' '.join([f'for _{s} in {s}' for s in reversed(params)]), '']
+        input_vars = None
+        if len(item['depends']) > 1:
+            input_vars = f'{out[:-8]}_input__'
+            loop[1] = f"for __i__ in sos_chunks({input_vars}, {len(item['depends'])})"
+        elif len(item['depends']) == 1:
+            input_vars = var(item['depends'][0])
+            loop[1] = f'for __i__ in {input_vars}'
+        lines = [f"__pipeline_id__ = {item['pipeline_id']}",
+                 f"__pipeline_name__ = '{item['pipeline_name']}'",
+                 f"__out_vars__ = {repr(item['out_vars'])}"]
+        lines.extend([f'{k} = {repr(v)}' for k, v in item['params'].items()])
+        if len(item['depends']) > 1:
+            lines.append(f"{input_vars} = sos_group_input({', '.join([var(x) for x in item['depends']])})")
+        fmt = '.format({})'.format(', '.join([f'_{s}' for s in reversed(params)])) if params else ''
+        lines.append(f"{out} = sos_hash_output(['{item['template']}'{fmt} {loop[0]}{filter_string}])")
+        if item['depends']:
+            lines.append(f"{out} = ['{item['name']}:{{}}:{{}}'.format(item, {chr(39) + ':' + chr(39) + '.join(__i__)' if len(item['depends']) > 1 else '__i__'}) for item in {out} {loop[1]}]")
+        else:
+            lines.append(f"{out} = ['{item['name']}:{{}}'.format(item) for item in {out}]")
+        combined = '[([{0}], {1}) {2}]'.format(
+            ', '.join([f"('{x}', _{x})" for x in reversed(params)]),
+            'None' if not loop[1] else ("f\"{' '.join(__i__)}\"" if len(item['depends']) > 1 else "f'{__i__}'"),
+            ' '.join(loop) + filter_string)
+        key = "tuple(' '.join((y, x[1])).split())" if item['depends'] else '(y,)'
+        input_str = '[]' if input_vars is None else f'{input_vars} if {input_vars} is not None else []'
+        lines.append(f"__io_db__[('{item['name']}', __pipeline_id__)] = dict([({key}, dict([('__pipeline_id__', __pipeline_id__), ('__pipeline_name__', __pipeline_name__), ('__module__', '{item['name']}'), ('__out_vars__', __out_vars__)] + x[0])) for x, y in zip({combined}, {out})] + [('__input_output___', ({input_str}, {out})), ('__ext__', '{item['ext']}')])")
+        res.extend(['\t' + x for x in lines])
+    res.append(f"\tpickle.dump(__io_db__, open({repr(output)}, 'wb'))")
+    res.append('prepare_io()')
+    return '\n'.join(res) + '\n'
+
+
+def main(args):
+    tmp = tempfile.mkdtemp()
+    conf = get_conf(args.values, args.params)
+    f1, f2 = os.path.join(tmp, 'source.pkl'), os.path.join(tmp, 'data.pkl')
+    start = time.time()
+    exec(compile(get_source(conf, f1), '<prepare_io>', 'exec'), dict())
+    t1 = time.time() - start
+    start = time.time()
+    prepare_io(conf, f2)
+    t2 = time.time() - start
+    res = pickle.load(open(f2, 'rb'))
+    assert pickle.load(open(f1, 'rb')) == res
+    print('instances\tsource\tdata')
+    print(f"{sum([len(x['__input_output___'][1]) for x in res.values()])}\t{t1:.2f}\t{t2:.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--values', type=int, default=8)
+    parser.add_argument('--params', type=int, default=2)
+    main(parser.parse_args())
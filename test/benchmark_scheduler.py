@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) Gao Wang, Stephens Lab at The Univeristy of Chicago
+# Distributed under the terms of the MIT License.
+'''
+Simulate execution of random DSC benchmarks (simulate -> method -> score
+pipelines) on a number of workers, comparing makespan of steps started in
+the order they are listed to steps started critical path first, as ordered
+by ``dsc.dsc_scheduler.get_bottom_levels``, and to predicted makespan. Usage:
+
+python benchmark_scheduler.py [--workers 4 16] [--repeat 20]
+'''
+
+import argparse, heapq
+import numpy as np
+from dsc.dsc_scheduler import get_bottom_levels, predict_makespan
+
+
+def get_steps(rng, n_methods=8):
+    '''{step: (number of instances, time per instance, upstream steps)}'''
+    steps = {('simulate', 0): (20, 1.0, [])}
+    for i in range(n_methods):
+        # a few methods are much slower than others
+        steps[(f'method{i}', 0)] = (20, rng.lognormal(1, 1.5), [('simulate', 0)])
+        steps[(f'score{i}', 0)] = (20, 0.1, [(f'method{i}', 0)])
+    return steps
+
+
+def simulate(steps, workers, priority):
+    '''list scheduling of module instances, ready steps taken by priority'''
+    done = set()
+    remaining = dict([(x, steps[x][0]) for x in steps])
+    running = dict([(x, 0) for x in steps])
+    events = []
+    now, idle = 0, workers
+    while len(done) < len(steps):
+        ready = sorted(
+            [x for x in steps if remaining[x] > 0 and all([y in done for y in steps[x][2]])],
+            key=lambda x: -priority.get(x, 0))
+        for x in ready:
+            while remaining[x] > 0 and idle > 0:
+                remaining[x] -= 1
+                running[x] += 1
+                idle -= 1
+                heapq.heappush(events, (now + steps[x][1], x))
+        now, x = heapq.heappop(events)
+        idle += 1
+        running[x] -= 1
+        if remaining[x] == 0 and running[x] == 0:
+            done.add(x)
+    return now
+
+
+def main(args):
+    rng = np.random.default_rng(999)
+    print('workers\tlisted\tcritical_path_first\tpredicted')
+    for workers in args.workers:
+        res = []
+        for i in range(args.repeat):
+            steps = get_steps(rng)
+            res.append((simulate(steps, workers, dict()),
+                        simulate(steps, workers, get_bottom_levels(steps, workers)),
+                        predict_makespan(steps, workers)))
+        res = np.mean(res, axis=0)
+        print(f'{workers}\t{res[0]:.1f}\t{res[1]:.1f}\t{res[2]:.1f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[4, 16])
+    parser.add_argument('--repeat', type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) Gao Wang, Stephens Lab at The Univeristy of Chicago
+# Distributed under the terms of the MIT License.
+
+import unittest
+
+import os, shutil, pickle
+from collections import OrderedDict
+from types import SimpleNamespace
+from dsc.dsc_executor import DSC_Executor
+from dsc.dsc_database import update_ledger, load_ledger
+from dsc.dsc_scheduler import RUNTIME_ENV, SCHEDULER_ENV, get_entrypoint
+from dsc.dsc_io import load_dsc
+from dsc.syntax import DSC_CACHE
+
+OUTPUT = 'test_executor_out'
+
+def get_pipeline(simulate="open(${_output:r}, 'w').write(str(${_n} * ${DSC_STEP_ID_}) + '\\n')\n", ext='txt'):
+    '''simulate (n=1, 2) -> double (k='a'), as translated from a DSC script'''
+    files = dict([(m, [f'{OUTPUT}/{m}/{m}_{i}.{ext}' for i in [1, 2]]) for m in ['simulate', 'double']])
+    io_db = {'1': {'simulate': dict(input=[], output=files['simulate'], depends=[]),
+                   'double': dict(input=files['simulate'], output=files['double'], depends=[('simulate', 1)])}}
+    cfg = {('simulate', 1): OrderedDict([((f'simulate:{i}',), dict(__module__='simulate', n=i)) for i in [1, 2]] +
+                                        [('__input_output___', ([], [])), ('__ext__', ext)]),
+           ('double', 1): OrderedDict([((f'double:{i}',), dict(__module__='double', k='a')) for i in [1, 2]] +
+                                      [('__input_output___', ([], [])), ('__ext__', ext)])}
+    os.makedirs(DSC_CACHE, exist_ok=True)
+    pickle.dump(io_db, open(f'{DSC_CACHE}/test_executor.io.pkl', 'wb'))
+    pickle.dump(cfg, open(f'{DSC_CACHE}/test_executor.cfg.pkl', 'wb'))
+    options = 'dict(stderr=f"{_output:n}.stderr", stdout=f"{_output:n}.stdout"'
+    actions = {'simulate': dict(action='python3', sigil='${ }', options=options + ')', container=None,
+                                params=['n'], group_by=0, script=simulate),
+               'double': dict(action='bash', sigil='$[ ]', options=options + ', args="{filename:q}" + f" {_k}")',
+                              container=None, params=['k'], group_by=1,
+                              script='cat $[_input] $[_input] > $[_output]\necho $1 >> $[_output]\n')}
+    return SimpleNamespace(db='test_executor', output=OUTPUT, actions=actions,
+                           included_steps=[('simulate', 1), ('double', 1)], priority=dict(),
+                           signatures={'simulate': 's1', 'double': 'd1'}, step_ids={'simulate': 3, 'double': 5})
+
+def get_fused_pipeline(simulate="__save_dsc__(dict(x=${_n}, pid=os.getpid()), ${_output:r})\n"):
+    '''simulate (n=1, 2) -> double, both Python modules saving output as module scripts do'''
+    pipeline = get_pipeline(ext='pkl')
+    header = 'import os\nfrom dsc import dsc_io\nfrom dsc.dsc_io import load_dsc as __load_dsc__, save_dsc as __save_dsc__\n'
+    for k, v in pipeline.actions.items():
+        v.update(dict(action='python3', sigil='${ }', options=pipeline.actions['simulate']['options']))
+    pipeline.actions['simulate']['script'] = header + simulate
+    pipeline.actions['double']['script'] = header + \
+        "memory = dsc_io.MEMORY is not None and os.path.abspath(${_input:r}) in dsc_io.MEMORY\n" \
+        "x = __load_dsc__(${_input:r})\n" \
+        "__save_dsc__(dict(x=x['x'] * 2, memory=memory, same_process=x['pid'] == os.getpid()), ${_output:r})\n"
+    return pipeline
+
+class TestExecutor(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree(OUTPUT, ignore_errors=True)
+        for f in ['io', 'cfg']:
+            if os.path.isfile(f'{DSC_CACHE}/test_executor.{f}.pkl'):
+                os.remove(f'{DSC_CACHE}/test_executor.{f}.pkl')
+
+    def testRun(self):
+        '''module instances are run from I/O database, and skipped by ledger'''
+        pipeline = get_pipeline()
+        executor = DSC_Executor(pipeline, workers=2)
+        executor.run()
+        self.assertEqual(open(f'{OUTPUT}/double/double_2.txt').read(), '6\n6\na\n')
+        self.assertEqual(len(executor.completed), 4)
+        update_ledger(OUTPUT, executor.completed)
+        executor = DSC_Executor(pipeline, ledger=load_ledger(OUTPUT))
+        executor.run()
+        self.assertEqual(len(executor.completed), 0)
+        # downstream of changed module is run again
+        pipeline.signatures['simulate'] = 's2'
+        executor = DSC_Executor(pipeline, ledger=load_ledger(OUTPUT))
+        executor.run()
+        self.assertEqual(len(executor.completed), 4)
+
+    def testError(self):
+        '''downstream of failed module instances are not run'''
+        pipeline = get_pipeline("import sys\nif ${_n} == 2: sys.exit(1)\nopen(${_output:r}, 'w').write('1\\n')\n")
+        executor = DSC_Executor(pipeline)
+        os.environ[RUNTIME_ENV] = f'{OUTPUT}.runtime.log'
+        try:
+            self.assertRaises(RuntimeError, executor.run)
+        finally:
+            os.environ.pop(RUNTIME_ENV)
+        self.assertEqual(sorted(executor.completed), [f'{OUTPUT}/double/double_1.txt', f'{OUTPUT}/simulate/simulate_1.txt'])
+        self.assertEqual(len(executor.failed), 1)
+        # run time of completed module instances only
+        self.assertEqual(sorted([x.split('\t')[0] for x in open(f'{OUTPUT}.runtime.log')]), ['double', 'simulate'])
+        os.remove(f'{OUTPUT}.runtime.log')
+
+    def testEntrypoint(self):
+        '''module instances are launched via scheduler when set for the run'''
+        pipeline = get_pipeline()
+        for k, v in pipeline.actions.items():
+            v['options'] = v['options'][:-1] + f", entrypoint = os.environ.get('{SCHEDULER_ENV}', '').format('{k}'))"
+        os.environ[RUNTIME_ENV] = f'{OUTPUT}.runtime.log'
+        os.environ[SCHEDULER_ENV] = get_entrypoint()
+        try:
+            DSC_Executor(pipeline).run()
+        finally:
+            os.environ.pop(RUNTIME_ENV)
+            os.environ.pop(SCHEDULER_ENV)
+        self.assertEqual(open(f'{OUTPUT}/double/double_2.txt').read(), '6\n6\na\n')
+        # run time is logged by scheduler, once for each module instance
+        self.assertEqual(sorted([x.split('\t')[0] for x in open(f'{OUTPUT}.runtime.log')]),
+                         ['double', 'double', 'simulate', 'simulate'])
+        os.remove(f'{OUTPUT}.runtime.log')
+
+    def testFuse(self):
+        '''chains of Python module instances run in one process, passing output in memory'''
+        pipeline = get_fused_pipeline()
+        executor = DSC_Executor(pipeline, fuse=True)
+        instances = executor.get_instances()
+        executor.set_status(instances)
+        self.assertEqual([[x.output for x in chain] for chain in executor.get_chains(instances)],
+                         [[f'{OUTPUT}/simulate/simulate_{i}.pkl', f'{OUTPUT}/double/double_{i}.pkl'] for i in [1, 2]])
+        executor.run()
+        self.assertEqual(len(executor.completed), 4)
+        # output files are written, and loaded by downstream module from memory
+        self.assertEqual(load_dsc(f'{OUTPUT}/simulate/simulate_2.pkl')['x'], 2)
+        self.assertEqual(load_dsc(f'{OUTPUT}/double/double_2.pkl'), dict(x=4, memory=True, same_process=True))
+        # not so without fuse
+        shutil.rmtree(OUTPUT)
+        executor = DSC_Executor(pipeline)
+        self.assertEqual(len(executor.get_chains(instances)), 4)
+        executor.run()
+        self.assertEqual(load_dsc(f'{OUTPUT}/double/double_2.pkl'), dict(x=4, memory=False, same_process=False))
+
+    def testFuseError(self):
+        '''module instances of a chain after a failed one are not run'''
+        pipeline = get_fused_pipeline("import sys\nif ${_n} == 2: sys.exit(1)\n__save_dsc__(dict(x=1, pid=os.getpid()), ${_output:r})\n")
+        executor = DSC_Executor(pipeline, fuse=True)
+        os.environ[RUNTIME_ENV] = f'{OUTPUT}.runtime.log'
+        try:
+            self.assertRaises(RuntimeError, executor.run)
+        finally:
+            os.environ.pop(RUNTIME_ENV)
+        self.assertEqual(sorted(executor.completed), [f'{OUTPUT}/double/double_1.pkl', f'{OUTPUT}/simulate/simulate_1.pkl'])
+        self.assertEqual(len(executor.failed), 1)
+        self.assertFalse(os.path.isfile(f'{OUTPUT}/double/double_2.pkl'))
+        self.assertEqual(sorted([x.split('\t')[0] for x in open(f'{OUTPUT}.runtime.log')]), ['double', 'simulate'])
+        os.remove(f'{OUTPUT}.runtime.log')
+
+if __name__ == '__main__':
+    unittest.main()
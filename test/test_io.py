@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) Gao Wang, Stephens Lab at The Univeristy of Chicago
+# Distributed under the terms of the MIT License.
+
+import unittest
+
+import os, shutil, pickle
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from dsc.dsc_io import load_dsc, save_dsc, load_io_db
+from dsc.hdf5io import save, Compression, _get_chunkshape, _blosc_threads, THREADS_ENV
+from dsc.plugin import PyPlug
+from dsc.dsc_database import load_ledger, update_ledger, ledger_file, match_ledger, \
+    prepare_io
+from dsc.utils import sos_hash_output, expand_grid, get_vector_filter, group_input, sos_group_input
+
+class TestIO(unittest.TestCase):
+    def setUp(self):
+        self.temp_files = []
+        self.temp_dirs = []
+
+    def tearDown(self):
+        for f in self.temp_files:
+            if os.path.isfile(f):
+                os.remove(f)
+        for d in self.temp_dirs:
+            shutil.rmtree(d, ignore_errors=True)
+
+    def testLoadHDF5(self):
+        '''load module output saved in HDF5 format, fully or partially'''
+        fn = 'test_io.h5'
+        self.temp_files.append(fn)
+        x = np.arange(2000, dtype=float).reshape(200, 10)
+        save({'x': x, 'n': 200, 'DSC_DEBUG': dict(replicate=1, seed=2)}, fn)
+        res = load_dsc(fn)
+        self.assertEqual(res['n'], 200)
+        self.assertEqual(res['DSC_DEBUG']['seed'], 2)
+        np.testing.assert_array_equal(res['x'], x)
+        np.testing.assert_array_equal(load_dsc(fn, group='/x', sel=np.s_[5:10, 2]),
+                                      x[5:10, 2])
+        self.assertRaises(ValueError, load_dsc, 'test_io.pkl', group='/x')
+
+    def testHDF5Chunks(self):
+        '''chunk shape follows expected access pattern'''
+        self.assertEqual(_get_chunkshape((10000, 100), 8), (1310, 100))
+        self.assertEqual(_get_chunkshape((10000, 100), 8, 'column'), (10000, 13))
+        self.assertEqual(_get_chunkshape((10, 10**6), 8), (1, 131072))
+        fn = 'test_io.h5'
+        self.temp_files.append(fn)
+        x = np.random.rand(1000, 50)
+        save({'x': x, 'y': Compression(x.copy(), 'blosc:lz4', layout='column')},
+             fn, threads=2)
+        np.testing.assert_array_equal(load_dsc(fn, group='/y', sel=np.s_[:, 3]),
+                                      x[:, 3])
+        # one thread per module instance unless DSC allows more
+        import tables
+        env = os.environ.pop(THREADS_ENV, None)
+        try:
+            with _blosc_threads():
+                self.assertEqual(tables.set_blosc_max_threads(1), 1)
+            os.environ[THREADS_ENV] = '3'
+            with _blosc_threads():
+                self.assertEqual(tables.set_blosc_max_threads(3), 3)
+        finally:
+            os.environ.pop(THREADS_ENV, None)
+            if env is not None:
+                os.environ[THREADS_ENV] = env
+
+    def testHDF5Columnar(self):
+        '''data frames and CSR matrices can be loaded in part'''
+        fn = 'test_io.h5'
+        self.temp_files.append(fn)
+        df = pd.DataFrame({'a': np.arange(100), 'b': np.random.rand(100),
+                           'c': ['x%d' % i if i % 3 else None for i in range(100)],
+                           'd': pd.Categorical(['u', 'v'] * 50)})
+        m = sparse.random(100, 30, density=0.1, format='csr', random_state=1)
+        save({'df': df, 'm': m, 'n': m.tocsc()}, fn)
+        res = load_dsc(fn)
+        pd.testing.assert_frame_equal(res['df'], df)
+        self.assertEqual((res['m'] != m).nnz, 0)
+        pd.testing.assert_frame_equal(load_dsc(fn, group='/df', sel=np.s_[10:20, ['b', 'c']]),
+                                      df.iloc[10:20][['b', 'c']])
+        self.assertEqual((load_dsc(fn, group='/m', sel=np.s_[5:15]) != m[5:15]).nnz, 0)
+        self.assertEqual((load_dsc(fn, group='/n', sel=np.s_[:, 3]) != m[:, 3]).nnz, 0)
+        # strings with trailing NUL are kept as is
+        df = pd.DataFrame({'c': ['x\x00', 'y', None, '\x00\x00']}, index=['u\x00', 'v', 'w', 'z'])
+        save({'df': df}, fn)
+        pd.testing.assert_frame_equal(load_dsc(fn)['df'], df)
+        pd.testing.assert_frame_equal(load_dsc(fn, group='/df', sel=np.s_[:2]), df.iloc[:2])
+
+    def testLedger(self):
+        '''completed module instances are recorded with latest signature'''
+        outdir = 'test_io_ledger'
+        self.temp_dirs.append(outdir)
+        os.makedirs(f'{outdir}/normal')
+        self.assertEqual(load_ledger(outdir), {})
+        files = [f'{outdir}/normal/normal_{i}.pkl' for i in range(1, 4)]
+        for fn in files:
+            with open(fn, 'wb') as f:
+                f.write(os.urandom(2**18))
+        update_ledger(outdir, {fn: 'x' for fn in files + [f'{outdir}/normal/normal_4.pkl']})
+        update_ledger(outdir, {files[0]: 'y'}, sample=True)
+        for i in range(8):
+            update_ledger(outdir, {files[1]: str(i)}, jobs=1)
+        res = load_ledger(outdir)
+        self.assertEqual(sorted(res), ['normal/normal_1.pkl', 'normal/normal_2.pkl',
+                                       'normal/normal_3.pkl'])
+        self.assertEqual(res['normal/normal_2.pkl'][0], '7')
+        # ledger file is compacted
+        with open(ledger_file(outdir)) as f:
+            self.assertEqual(len(f.readlines()), 3)
+        self.assertTrue(match_ledger(res['normal/normal_1.pkl'], files[0], 'y', {}))
+        self.assertFalse(match_ledger(res['normal/normal_1.pkl'], files[0], 'x', {}))
+        # timestamp changed, content checked by sampled digest
+        for fn in files[:2]:
+            os.utime(fn, ns=(0, 0))
+        self.assertTrue(match_ledger(res['normal/normal_1.pkl'], files[0], 'y', {}))
+        self.assertFalse(match_ledger(res['normal/normal_2.pkl'], files[1], '7', {}))
+        with open(files[0], 'r+b') as f:
+            f.write(b'0' * 10)
+        self.assertFalse(match_ledger(res['normal/normal_1.pkl'], files[0], 'y', {}))
+
+    def testLoadIODB(self):
+        '''I/O database is loaded once until it is changed'''
+        fn = 'test_io.io.pkl'
+        self.temp_files.append(fn)
+        pickle.dump({'1': {'normal': {'output': ['normal_1.pkl']}}}, open(fn, 'wb'))
+        res = load_io_db(fn)
+        self.assertIs(load_io_db(fn), res)
+        self.assertEqual(load_io_db(fn, '1', 'normal'), {'output': ['normal_1.pkl']})
+        pickle.dump({'1': {'normal': {'output': ['normal_2.pkl']}}}, open(fn, 'wb'))
+        os.utime(fn, ns=(0, 0))
+        self.assertEqual(load_io_db(fn, '1', 'normal'), {'output': ['normal_2.pkl']})
+
+    def testPrepareIO(self):
+        '''module instances are expanded from configuration, filtered and grouped by input'''
+        fn = 'test_io.cfg.pkl'
+        self.temp_files.append(fn)
+        pipeline = dict(pipeline_id=1, pipeline_name='a_simulate+a_fit+a_score', out_vars=['x'], ext='pkl')
+        conf = [dict(pipeline, name='simulate', step=('simulate', 1), params=OrderedDict([('n', [1, 2, 3])]),
+                     filter='_n != 2', template='simulate n:{}', depends=[]),
+                dict(pipeline, name='fit', step=('fit', 1), params=OrderedDict([('k', ['a'])]),
+                     filter=None, template='fit k:{}', depends=[('simulate', 1)]),
+                dict(pipeline, name='score', step=('score', 1), params=OrderedDict(),
+                     filter=None, template='score', depends=[('simulate', 1), ('fit', 1)])]
+        prepare_io(conf, fn)
+        res = pickle.load(open(fn, 'rb'))
+        s = [f'simulate:{x}' for x in sos_hash_output(['simulate n:1', 'simulate n:3'])]
+        f = [f'fit:{sos_hash_output(["fit k:a"])[0]}:{x}' for x in s]
+        h = sos_hash_output(['score'])[0]
+        self.assertEqual(list(res.keys()), [('simulate', 1), ('fit', 1), ('score', 1)])
+        self.assertEqual(res[('simulate', 1)]['__input_output___'], ([], s))
+        self.assertEqual(res[('simulate', 1)][(s[1],)],
+                         {'__pipeline_id__': 1, '__pipeline_name__': 'a_simulate+a_fit+a_score',
+                          '__module__': 'simulate', '__out_vars__': ['x'], 'n': 3})
+        self.assertEqual(res[('fit', 1)]['__input_output___'], (s, f))
+        self.assertEqual(res[('fit', 1)][(f[0], s[0])]['k'], 'a')
+        self.assertEqual(res[('score', 1)]['__input_output___'],
+                         ([s[0], f[0], s[1], f[1]], [f'score:{h}:{s[0]}:{f[0]}', f'score:{h}:{s[1]}:{f[1]}']))
+        self.assertIn((f'score:{h}:{s[1]}:{f[1]}', s[1], f[1]), res[('score', 1)])
+        self.assertEqual(res[('score', 1)]['__ext__'], 'pkl')
+
+    def testExpandGrid(self):
+        '''parameter combinations are filtered while expanded, in order of nested loops'''
+        from itertools import product
+        params = OrderedDict([('n', [1, 2, 3]), ('k', ['a', 'b']), ('seed', list(range(10**6)))])
+        res = list(expand_grid(params, '_seed < 2 and _n != 2'))
+        self.assertEqual(res, [(0, 'a', 1), (0, 'a', 3), (0, 'b', 1), (0, 'b', 3),
+                               (1, 'a', 1), (1, 'a', 3), (1, 'b', 1), (1, 'b', 3)])
+        params['seed'] = [1, 2]
+        for ft in ['(_k == "a" and _seed == 1) or _n == 3', 'not _k == "b" and _n > _seed', '_n in n[1:]']:
+            self.assertEqual(list(expand_grid(params, ft)),
+                             [x for x in product(params['seed'], params['k'], params['n'])
+                              if eval(ft, dict(params, _seed=x[0], _k=x[1], _n=x[2]))])
+
+    def testVectorFilter(self):
+        '''filter is evaluated by NumPy when possible, with the same result as row by row'''
+        names = ['_n', '_k', '_seed']
+        self.assertIsNotNone(get_vector_filter('(_k in ["a", 1] and 1 < _n + 1 <= 3) or not _seed % 2 == 0', names))
+        self.assertIsNone(get_vector_filter('abs(_n) > 1', names))
+        self.assertIsNone(get_vector_filter('_n and _seed', names))
+        params = OrderedDict([('n', [1, 2, 3, None]), ('k', ['a', 'b', 1]), ('seed', list(range(100)))])
+        for ft in ['_k in ["a", 1] and _seed // 10 == 3', '_seed * 2 < 5 or _k != "b"', '_n == None or _k in k[2:]',
+                   'abs(_seed - 50) == 3 and _k == "a"', '_seed / (_seed + 1) > 0.95']:
+            self.assertEqual(list(expand_grid(params, ft)), list(expand_grid(params, ft, block_size=0)))
+        # errors are raised as by Python
+        self.assertRaises(ZeroDivisionError, list, expand_grid(params, '_seed / (_seed - 50) > 10'))
+
+    def testGroupInput(self):
+        '''output of upstream modules are cycled to the longest, shorter ones first'''
+        self.assertEqual(group_input(list('abcdefgh'), list('xy'), list('pqrs')),
+                         [('x', 'p', 'a'), ('y', 'q', 'b'), ('x', 'r', 'c'), ('y', 's', 'd'),
+                          ('x', 'p', 'e'), ('y', 'q', 'f'), ('x', 'r', 'g'), ('y', 's', 'h')])
+        self.assertEqual(sos_group_input([('t', 1), ('t', 2)], list('abc')),
+                         [('t', 1), 'a', ('t', 2), 'b', ('t', 1), 'c'])
+        self.assertEqual(group_input(list('ab'), []), [])
+
+    def testLoadIODBSteps(self):
+        '''I/O database is loaded once for all steps of a SoS workflow'''
+        import subprocess
+        self.temp_files.extend(['test_io.io.pkl', 'test_io.sos', 'test_io.log'])
+        pickle.dump({'1': {'normal': {'output': ['normal_1.pkl']}}}, open('test_io.io.pkl', 'wb'))
+        step = "data_io = load_io_db(IO_DB, '1', 'normal')\n" \
+            "open('test_io.log', 'a').write(f'{os.getpid()} {id(data_io)}\\n')\n"
+        with open('test_io.sos', 'w') as f:
+            # as [global] of DSC_Translator
+            f.write("[global]\nimport os\nfrom dsc.dsc_io import load_io_db\n\nIO_DB = 'test_io.io.pkl'\n\n"
+                    + ''.join([f"[normal_{i}]\n{step}\n" for i in range(1, 7)]))
+        subprocess.check_call(['sos', 'run', 'test_io.sos', 'normal', '-s', 'force', '-v', '0'])
+        res = [x.split() for x in open('test_io.log').read().strip().split('\n')]
+        self.assertEqual(len(res), 6)
+        # steps may run in several worker processes, each loading it once
+        self.assertEqual(len(set([x[1] for x in res])), len(set([x[0] for x in res])))
+
+    def testHDF5Return(self):
+        '''Python module writes HDF5 output when requested'''
+        plugin = PyPlug('DSC_test')
+        self.assertIn('__save_dsc__({"x": x', plugin.get_return({'x': 'x'}))
+        plugin.output_ext = 'h5'
+        self.assertIn('__save_dsc__({"x": x', plugin.get_return({'x': 'x'}))
+        # format by file extension
+        save_dsc({'x': np.arange(3)}, 'test_io_return.h5')
+        save_dsc({'x': np.arange(3)}, 'test_io_return.pkl')
+        self.assertEqual(open('test_io_return.h5', 'rb').read(8), b'\x89HDF\r\n\x1a\n')
+        for ext in ['h5', 'pkl']:
+            self.assertEqual(load_dsc(f'test_io_return.{ext}')['x'].tolist(), [0, 1, 2])
+            os.remove(f'test_io_return.{ext}')
+
+if __name__ == '__main__':
+    unittest.main()
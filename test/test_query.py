@@ -5,9 +5,13 @@
 
 import unittest
 
-from dsc.query_engine import Query_Processor
+import os, shutil, time
+from unittest.mock import patch
+from dsc.query_engine import Query_Processor, Query_Cache, push_down_condition
+from dsc.line import parse_filter
 import pandas as pd
 from dsc.utils import DBError
+from dsc.dsc_database import intern_tables
 from sos.targets import file_target
 from sos.utils import get_output
 
@@ -29,6 +33,7 @@ def test_outcome(res, fn):
 ash_db = 'data/dsc_result.db'
 reg_db = 'data/reg_result.db'
 cause_db = 'data/cause_result.db'
+location_db = '../dscrutils/inst/datafiles/one_sample_location/dsc_result/dsc_result.db'
 
 class TestQuery(unittest.TestCase):
     def setUp(self):
@@ -143,6 +148,153 @@ DSC,simulate.q,cis,cis.output.file,cis.ci_upr:output,cis.ci_lwr:output,summ_prob
 '''.strip().split('\n'))
         #self.assertEqual(observed, expected)
 
+    def testQueryPlan(self):
+        '''join columns are indexed before running queries'''
+        res = Query_Processor(ash_db, ['shrink.mixcompdist', 'score_beta.mse'], ['simulate.nsamp > 20'], debug = True)
+        plans = '\n'.join(res.get_query_plans().values())
+        self.assertIn('USING INDEX', plans)
+
+    def testRowOrder(self):
+        '''indexes do not change order of rows returned'''
+        res = Query_Processor(cause_db, ['simulate.q', 'summ_probs.prob'], ['simulate.q > 0.1'])
+        with patch('dsc.query_engine.extract_index_columns', lambda query: dict()):
+            expected = Query_Processor(cause_db, ['simulate.q', 'summ_probs.prob'], ['simulate.q > 0.1'])
+        self.assertTrue(res.output_table.equals(expected.output_table))
+
+    def testQueryCache(self):
+        '''query results are cached by query arguments'''
+        res = Query_Processor(ash_db, ['shrink.mixcompdist', 'score_beta.mse'], ['simulate.nsamp > 20'])
+        cache = Query_Cache(ash_db, ['shrink.mixcompdist', 'score_beta.mse'], ['simulate.nsamp > 20'])
+        self.assertIsNone(cache.load())
+        cache.dump(res)
+        try:
+            cached = Query_Cache(ash_db, ['shrink.mixcompdist  score_beta.mse'], ['simulate.nsamp  > 20']).load()
+            self.assertTrue(cached.output_table.equals(res.output_table))
+            self.assertEqual(cached.queries, res.queries)
+            self.assertIsNone(Query_Cache(ash_db, ['shrink.mixcompdist'], ['simulate.nsamp > 20']).load())
+        finally:
+            shutil.rmtree(cache.path)
+        # result is not saved but kept when cache folder is not writable
+        cache.path = os.path.join(ash_db, 'cache')
+        cache.dump(res)
+        self.assertIsNone(cache.load())
+
+    def testQueryServer(self):
+        '''query server answers queries of the DSC output folder it serves'''
+        import socket, threading
+        from dsc.query_server import Query_Server, request_query
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        server = Query_Server(ash_db)
+        threading.Thread(target=server.serve, args=(port, ), daemon=True).start()
+        cache = Query_Cache(ash_db, ['shrink.mixcompdist', 'score_beta.mse'])
+        try:
+            for i in range(50):
+                try:
+                    res = request_query(['shrink.mixcompdist', 'score_beta.mse'], port=port, outdir='data')
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            self.assertEqual(list(res.columns), list(server.query(['shrink.mixcompdist', 'score_beta.mse']).output_table.columns))
+            self.assertRaises(DBError, request_query, ['shrink.mixcompdist'], port=port, outdir='../dscrutils')
+        finally:
+            shutil.rmtree(cache.path, ignore_errors=True)
+
+    def testColumnarOutput(self):
+        '''query results are saved in Parquet or Feather format by file extension'''
+        import sys
+        from dsc.__query__ import write_columnar, get_columnar_name
+        res = Query_Processor(ash_db, ['shrink.mixcompdist', 'score.mse'], groups = ['score: score_beta, score_pi0'])
+        self.assertEqual(get_columnar_name('test_query.parquet', 'simulate+shrink+score_beta'),
+                         'test_query.simulate+shrink+score_beta.parquet')
+        self.temp_files.extend(['test_query.parquet', 'test_query.feather'])
+        write_columnar(res.output_table, 'test_query.parquet')
+        pd.testing.assert_frame_equal(pd.read_parquet('test_query.parquet'), res.output_table, check_dtype = False)
+        write_columnar(res.output_table, 'test_query.feather')
+        pd.testing.assert_frame_equal(pd.read_feather('test_query.feather'), res.output_table, check_dtype = False)
+        # "NA" is saved as missing value and mixed columns as strings
+        write_columnar(pd.DataFrame({'x': [1, 'NA', 3], 'y': ['a', 2, 'NA']}), 'test_query.parquet')
+        observed = pd.read_parquet('test_query.parquet')
+        self.assertEqual(observed['x'].dtype, float)
+        self.assertTrue(observed['x'].isnull().tolist() == [False, True, False])
+        self.assertEqual(observed['y'].tolist()[:2], ['a', '2'])
+        self.assertTrue(pd.isnull(observed['y'][2]))
+        with patch.dict(sys.modules, {'pyarrow': None}):
+            self.assertRaises(ModuleNotFoundError, write_columnar, res.output_table, 'test_query.feather')
+
+    def testXLSXOutput(self):
+        '''large query results are split into sheets of at most given rows'''
+        from openpyxl import load_workbook
+        from dsc.__query__ import write_xlsx
+        res = Query_Processor(ash_db, ['shrink.mixcompdist', 'score.mse'], groups = ['score: score_beta, score_pi0'])
+        self.temp_files.append('test_query.xlsx')
+        # 60 rows, 30 in each of two pipelines
+        for max_rows, sheets in [(25, {'Sheet1': 25, 'Sheet1_2': 25, 'Sheet1_3': 10}),
+                                 (40, {'Sheet1': 40, 'Sheet1_2': 20, 'simulate+shrink+score_beta': 30,
+                                       'simulate+shrink+score_pi0': 30})]:
+            write_xlsx(res.output_table, res.output_tables, 'test_query.xlsx', max_rows)
+            workbook = load_workbook('test_query.xlsx', read_only = True)
+            self.assertEqual(workbook.sheetnames, list(sheets.keys()))
+            for name, nrows in sheets.items():
+                rows = list(workbook[name].values)
+                self.assertEqual(len(rows), nrows + 1)
+                table = res.output_tables[name] if name in res.output_tables else res.output_table
+                self.assertEqual(list(rows[0]), [str(x) for x in table.columns])
+            self.assertEqual(list(workbook['Sheet1_2'].values)[1][-1], res.output_table.iloc[max_rows, -1])
+            workbook.close()
+        # from command line
+        import subprocess
+        os.makedirs('test_query_out', exist_ok = True)
+        try:
+            shutil.copy(ash_db, 'test_query_out/test_query_out.db')
+            subprocess.check_call(['dsc-query', 'test_query_out', '-t', 'shrink.mixcompdist', 'score.mse',
+                                   '-g', 'score: score_beta, score_pi0', '-o', 'test_query_out/res.xlsx',
+                                   '--xlsx-max-rows', '25', '--no-cache', '-v', '0'])
+            workbook = load_workbook('test_query_out/res.xlsx', read_only = True)
+            self.assertEqual(workbook.sheetnames, ['Sheet1', 'Sheet1_2', 'Sheet1_3'])
+            workbook.close()
+        finally:
+            shutil.rmtree('test_query_out')
+
+    def testPreloadedDatabase(self):
+        '''query a database already loaded in memory, eg by query server'''
+        data = intern_tables(pd.read_pickle(ash_db))
+        res = Query_Processor(ash_db, ['shrink.mixcompdist', 'score.mse'], groups = ['score: score_beta, score_pi0'])
+        for i in range(2):
+            observed = Query_Processor(data, ['shrink.mixcompdist', 'score.mse'], groups = ['score: score_beta, score_pi0'])
+            self.assertTrue(observed.output_table.equals(res.output_table))
+        self.assertEqual(data['.groups'], pd.read_pickle(ash_db)['.groups'])
+
+    def testParallelQueries(self):
+        '''queries of different pipelines run in parallel'''
+        res = Query_Processor(ash_db, ['shrink.mixcompdist', 'score.mse'], groups = ['score: score_beta, score_pi0'])
+        observed = Query_Processor(ash_db, ['shrink.mixcompdist', 'score.mse'], groups = ['score: score_beta, score_pi0'], jobs = 2)
+        self.assertEqual(list(observed.output_tables.keys()), list(res.output_tables.keys()))
+        self.assertTrue(observed.output_table.equals(res.output_table))
+
+    def testPushDownCondition(self):
+        '''single table conditions are applied before loading tables'''
+        data = intern_tables(pd.read_pickle(ash_db))
+        pipeline = ['score_beta', 'shrink', 'simulate']
+        condition = parse_filter(["shrink.mixcompdist = 'normal'"])[0]
+        observed, pruned = push_down_condition(data, condition, pipeline)
+        self.assertEqual(pruned, {'shrink': 15})
+        self.assertEqual(set(observed['shrink']['mixcompdist']), {'normal'})
+        condition = parse_filter(["shrink.mixcompdist = 'normal' or simulate.nsamp > 20"])[0]
+        self.assertEqual(push_down_condition(data, condition, pipeline)[1], {})
+        condition = parse_filter(["not shrink.mixcompdist = 'normal' and simulate.nsamp > 2000"])[0]
+        self.assertEqual(push_down_condition(data, condition, pipeline)[1], {'shrink': 15, 'simulate': 15})
+
+    def testInternTables(self):
+        '''hash keyed module tables are converted to integer keys'''
+        data = intern_tables(pd.read_pickle(location_db))
+        self.assertEqual(str(data['abs_err']['__id__'].dtype), 'int64')
+        self.assertEqual(data['normal']['__parent__'].tolist(), [-9])
+        self.assertEqual(data['.ids'][data['normal']['__id__'][0] - 1], 'normal:3fce637f')
+        self.assertEqual(data['.ids'][data['mean']['__parent__'][0] - 1], 'normal:3fce637f')
+        self.assertEqual(str(data['abs_err']['__output__'].dtype), 'category')
+
 
 if __name__ == '__main__':
     #suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestParser)
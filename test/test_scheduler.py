@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) Gao Wang, Stephens Lab at The Univeristy of Chicago
+# Distributed under the terms of the MIT License.
+
+import unittest
+
+import os, sys, time, subprocess, shutil
+import pickle
+from types import SimpleNamespace
+from collections import OrderedDict
+from dsc.dsc_scheduler import Resource_Pool, POOL_ENV, update_runtime_history, \
+    load_runtime_history, get_bottom_levels, predict_makespan, get_trunk_size, get_entrypoint, \
+    RUNTIME_ENV, THREADS_ENV, SCHEDULER_ENV
+from dsc.dsc_translator import DSC_Translator
+from dsc.dsc_database import update_ledger, load_ledger
+from dsc.syntax import DSC_CACHE
+from dsc.plugin import PyPlug
+from sos.targets import sos_targets
+
+def get_workflows(resources):
+    '''a benchmark of one python module, as parsed by DSC_Script'''
+    step = SimpleNamespace(name='normal', plugin=PyPlug('normal'), p=OrderedDict(n=[1, 2]), ft=None,
+                           depends=[], rv=OrderedDict(), rf=OrderedDict(), seed=None, libpath=[],
+                           path=[], workdir='.', container=None, container_engine=None,
+                           pymodule=[], resources=resources,
+                           exe=dict(content='x = n', args=None, file=[], path='', header='',
+                                    signature='a1b2'))
+    return [OrderedDict(normal=step)]
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.temp_files = ['test_scheduler.pool', 'test_scheduler.runtime.pkl'] + \
+            [f'test_scheduler_{i}.pkl' for i in range(3)]
+        self.procs = [subprocess.Popen(['sleep', '30']) for i in range(4)]
+
+    def tearDown(self):
+        for p in self.procs:
+            p.kill()
+            p.wait()
+        for f in self.temp_files:
+            if os.path.isfile(f):
+                os.remove(f)
+        shutil.rmtree('test_scheduler', ignore_errors=True)
+
+    def testPacking(self):
+        '''module instances are leased resources by CPU and memory budgets'''
+        pool = Resource_Pool(self.temp_files[0])
+        pool.reset(4, 8 * 2**30, {'fit': dict(cpus_per_instance=3, mem_per_instance=6 * 2**30,
+                                              time_per_instance=3600),
+                                  'huge': dict(cpus_per_instance=16)})
+        pids = [p.pid for p in self.procs]
+        self.assertTrue(pool.acquire('fit', pids[0]))
+        # not enough resources left
+        self.assertFalse(pool.acquire('fit', pids[1]))
+        self.assertTrue(pool.acquire('score', pids[2]))
+        pool.release(pids[0])
+        # waiting instance of longer time is served first
+        self.assertFalse(pool.acquire('score', pids[3]))
+        self.assertTrue(pool.acquire('fit', pids[1]))
+        pool.release(pids[2])
+        self.assertTrue(pool.acquire('score', pids[3]))
+        # leases of finished processes are returned
+        self.procs[1].kill()
+        self.procs[1].wait()
+        pool.release(pids[3])
+        # request larger than budget is capped
+        self.assertTrue(pool.acquire('huge', pids[0]))
+
+    def testRun(self):
+        '''command is executed with its exit code kept'''
+        Resource_Pool(self.temp_files[0]).reset(1, None, dict())
+        env = dict(os.environ, **{POOL_ENV: os.path.abspath(self.temp_files[0]),
+                                  RUNTIME_ENV: os.path.abspath(self.temp_files[2])})
+        cmd = [sys.executable, '-m', 'dsc.dsc_scheduler', 'score', '--']
+        self.assertEqual(subprocess.call(cmd + ['sleep', '0.2'], env=env), 0)
+        self.assertEqual(subprocess.call(cmd + ['false'], env=env), 1)
+        # run time of completed instance is logged
+        res = [x.split('\t') for x in open(self.temp_files[2]).read().strip().split('\n')]
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0][0], 'score')
+        self.assertGreaterEqual(float(res[0][1]), 0.2)
+        # with cores of the lease
+        self.assertEqual(subprocess.check_output(cmd + ['sh', '-c', f'echo ${THREADS_ENV}'], env=env), b'1\n')
+
+    def testRuntimeHistory(self):
+        '''run time of module instances are kept and used to predict benchmark run time'''
+        with open(self.temp_files[2], 'w') as f:
+            # last line from an interrupted run
+            f.write('simulate\t1\nsimulate\t3\nfit\t5\nfit')
+        update_runtime_history(self.temp_files[1], self.temp_files[2])
+        self.assertEqual(load_runtime_history(self.temp_files[1]), {'simulate': (2, 2), 'fit': (1, 5)})
+        self.assertFalse(os.path.isfile(self.temp_files[2]))
+        # two pipelines: simulate -> fit, simulate -> score
+        steps = {('simulate', 1): (4, 2, []), ('fit', 1): (4, 5, [('simulate', 1)]),
+                 ('score', 2): (4, 1, [('simulate', 1)])}
+        levels = get_bottom_levels(steps, 2)
+        self.assertEqual(levels, {('simulate', 1): 14, ('fit', 1): 10, ('score', 2): 2})
+        self.assertEqual(predict_makespan(steps, 2), 16)
+        self.assertEqual(predict_makespan(steps, 8), 7)
+
+    def testTrunkSize(self):
+        '''module instances are grouped into jobs of given time'''
+        # 1 hour jobs of 10 second instances, 4 at a time
+        self.assertEqual(get_trunk_size(200000, 10, 3600, 4), 1440)
+        # but keep 30 jobs running
+        self.assertEqual(get_trunk_size(20000, 10, 3600, 4, 30), 667)
+        self.assertEqual(get_trunk_size(10, 7200, 3600, 1, 30), 1)
+
+    def testLocalQueue(self):
+        '''local stand-in queue runs job scripts within walltime'''
+        for i, cmd in enumerate(['echo done > test_scheduler_0.pkl', 'sleep 30; echo done > test_scheduler_1.pkl']):
+            with open(f'test_scheduler_{i}.sh', 'w') as f:
+                f.write(f'#!/bin/bash\n#SBATCH --time=00:00:02\n{cmd}\n')
+            self.temp_files.extend([f'test_scheduler_{i}.{x}' for x in ['sh', 'out', 'err']])
+            out = subprocess.check_output([sys.executable, '-m', 'dsc.dsc_queue', 'submit',
+                                           f'test_scheduler_{i}.sh', '--slots', '2']).decode()
+            self.assertTrue(out.startswith('Submitted batch job '))
+        job_id = out.split()[-1]
+        for i in range(50):
+            if 'completed' in subprocess.check_output(
+                    [sys.executable, '-m', 'dsc.dsc_queue', 'status', job_id]).decode():
+                break
+            time.sleep(0.2)
+        self.assertTrue(os.path.isfile('test_scheduler_0.pkl'))
+        self.assertFalse(os.path.isfile('test_scheduler_1.pkl'))
+
+    def testTaskOptions(self):
+        '''jobs of module are sized by its instances to run, not those found in ledger'''
+        runtime = SimpleNamespace(output='test_scheduler', groups=dict(), replicate=[1],
+                                  sequence=[['normal']], rlib=[], pymodule=[], container=[])
+        pipeline = DSC_Translator(get_workflows(dict()), runtime)
+        outputs = [f'test_scheduler/normal_{i}.pkl' for i in range(4)]
+        self.temp_files.append(f'{DSC_CACHE}/test_scheduler.io.pkl')
+        with open(self.temp_files[-1], 'wb') as f:
+            pickle.dump({'1': {'normal': dict(input=[], output=outputs, depends=[])}}, f)
+        os.makedirs('test_scheduler', exist_ok=True)
+        for f in outputs[:3]:
+            with open(f, 'w') as f:
+                f.write('1')
+        update_ledger('test_scheduler', dict([(f, pipeline.signatures['normal']) for f in outputs[:3]]))
+        pipeline.filter_execution(ledger=load_ledger('test_scheduler'), history={'normal': (1, 10)})
+        self.assertEqual(pipeline.to_run['normal'], 1)
+        pipeline.host_conf = {'default': dict(trunk_size='auto', trunk_workers='[1] * 1', time_per_job=3600,
+                                              queue='q', walltime='1h')}
+        self.assertEqual(pipeline.get_task_options({'normal': (1, 10)}),
+                         {'normal': dict(trunk_size=1, walltime=60)})
+
+    def testSignature(self):
+        '''module steps are the same with or without resources declared'''
+        runtime = SimpleNamespace(output='test_scheduler', groups=dict(), replicate=[1],
+                                  sequence=[['normal']], rlib=[], pymodule=[], container=[])
+        res = [DSC_Translator(get_workflows(x), runtime) for x in [dict(), dict(cpus_per_instance=2)]]
+        self.assertEqual(res[0].signatures, res[1].signatures)
+        self.assertEqual(res[0].job_str.split('\n[normal ')[1], res[1].job_str.split('\n[normal ')[1])
+        self.assertEqual([x.scheduled for x in res], [[], ['normal']])
+        # scheduler is used at run time, when set for the run
+        self.assertIn(f"entrypoint = os.environ.get('{SCHEDULER_ENV}', '').format('normal')", res[0].job_str)
+        env = os.environ.pop(SCHEDULER_ENV, None)
+        ns = dict(os=os, _output=sos_targets('test_scheduler/normal_1.pkl'))
+        try:
+            self.assertEqual(eval(res[1].actions['normal']['options'], ns)['entrypoint'], '')
+            os.environ[SCHEDULER_ENV] = get_entrypoint()
+            self.assertTrue(eval(res[1].actions['normal']['options'], ns)['entrypoint'].endswith(
+                ' -m dsc.dsc_scheduler normal --'))
+        finally:
+            os.environ.pop(SCHEDULER_ENV)
+            if env is not None:
+                os.environ[SCHEDULER_ENV] = env
+
+if __name__ == '__main__':
+    unittest.main()